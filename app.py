@@ -1,29 +1,121 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, Blueprint, Request, current_app, render_template, redirect, url_for, flash, request, \
+    abort, send_file, jsonify, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
 from config import Config
-from models import db, User, Book, BorrowRecord
-from forms import LoginForm, BookForm, BorrowForm, RatingForm
+from models import db, User, Book, BorrowRecord, compute_late_fee
+from forms import LoginForm, BookForm, BorrowForm, RatingForm, ImportForm, BatchBorrowForm, BatchReturnForm
+from pagination import keyset_paginate, get_per_page
+import migrations
+import archive
+import replicas
+import search
+import typeahead
+import rankings
+import recommendations
+import circulation
+import stats
+import sweeper
+import covers
+import http_cache
+import instrumentation
+from fragment_cache import FragmentCache, LRUBackend, SharedBackend
+from user_cache import UserIdentityCache
+from hashing import PasswordGate, HashingBusy
+import catalog_io
+from cover_cache import RemoteCoverCache, CoverFetchError
 from datetime import datetime, timedelta
 from functools import wraps
+import mimetypes
+from sqlalchemy.orm import joinedload, with_expression
+from werkzeug.local import LocalProxy
+import click
 import os
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Tạo thư mục upload nếu chưa có
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Vui lòng đăng nhập để truy cập trang này.'
 
+# Mọi route và lệnh CLI nằm trong blueprint này; create_app đăng ký nó cho từng ứng dụng
+bp = Blueprint('main', __name__, cli_group=None)
+
+class LibraryRequest(Request):
+    """Chỉ trang nhập danh mục được nhận body lớn, mọi route khác dùng MAX_CONTENT_LENGTH"""
+    
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'main.import_books':
+            return current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+def create_app(config_object=Config):
+    """Tạo ứng dụng và gắn các extension.
+
+    Không chạm tới database hay hệ thống file: schema và dữ liệu mẫu do
+    ``flask init-db`` tạo, nên ``gunicorn --preload`` nạp ứng dụng một lần ở
+    tiến trình master rồi fork worker mà không worker nào phải làm gì thêm.
+    Mỗi lần gọi tạo một ứng dụng riêng với cấu hình và cache riêng.
+    """
+    app = Flask(__name__)
+    app.request_class = LibraryRequest
+    app.config.from_object(config_object)
+    
+    db.init_app(app)
+    replicas.init_app(app)
+    login_manager.init_app(app)
+    init_services(app)
+    
+    # Thread quét quá hạn trong tiến trình (tùy chọn), bật ở mỗi worker sau khi fork
+    sweeper.init_app(app)
+    
+    http_cache.init_app(app)
+    instrumentation.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+def init_services(app):
+    """Tạo các cache/dịch vụ trong tiến trình của ứng dụng (dùng qua các proxy bên dưới)"""
+    config = app.config
+    app.extensions['cover_cache'] = RemoteCoverCache(config['COVER_CACHE_FOLDER'],
+                                                     config['COVER_CACHE_MAX_BYTES'],
+                                                     config['COVER_SIZES'],
+                                                     config['COVER_FORMAT'],
+                                                     timeout=config['COVER_FETCH_TIMEOUT'])
+    
+    # Cache HTML thẻ sách: Redis nếu được cấu hình, ngược lại LRU trong tiến trình
+    if config['FRAGMENT_CACHE_REDIS_URL']:
+        import redis
+        backend = SharedBackend(redis.Redis.from_url(config['FRAGMENT_CACHE_REDIS_URL']),
+                                ttl=config['FRAGMENT_CACHE_TTL'])
+    else:
+        backend = LRUBackend(config['FRAGMENT_CACHE_SIZE'], config['FRAGMENT_CACHE_TTL'])
+    app.extensions['fragments'] = FragmentCache(backend, enabled=config['FRAGMENT_CACHE_ENABLED'])
+    
+    # Giới hạn số lần băm mật khẩu đồng thời
+    app.extensions['password_gate'] = PasswordGate(config['PASSWORD_HASH_CONCURRENCY'],
+                                                   config['PASSWORD_HASH_WAIT'])
+    
+    # Cache danh tính người dùng để request đã đăng nhập không phải truy vấn bảng User
+    app.extensions['user_identities'] = UserIdentityCache(config['USER_CACHE_SIZE'], config['USER_CACHE_TTL'])
+    
+    # Chỉ mục gợi ý sách khi gõ ở trang mượn sách, dựng lại khi tên/tác giả sách đổi
+    app.extensions['book_typeahead'] = typeahead.BookTypeahead(config['TYPEAHEAD_REFRESH_SECONDS'])
+    
+    # Số liệu dashboard đã đọc, giữ STATS_CACHE_TTL giây và bị xóa khi bộ đếm đổi
+    app.extensions['dashboard_stats'] = stats.TTLCache()
+
+def _service(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+cover_cache = _service('cover_cache')
+fragments = _service('fragments')
+password_gate = _service('password_gate')
+user_identities = _service('user_identities')
+book_typeahead = _service('book_typeahead')
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_identities.load(user_id)
 
 # Decorator kiểm tra quyền admin
 def admin_required(f):
@@ -31,170 +123,288 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin():
             flash('Bạn không có quyền truy cập trang này!', 'danger')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         return f(*args, **kwargs)
     return decorated_function
 
 # Helper function: Kiểm tra file được phép
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-# Khởi tạo database và dữ liệu mẫu
-def init_database():
-    with app.app_context():
-        db.create_all()
-        
-        # Tạo tài khoản admin nếu chưa có
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='admin', role='admin')
-            admin.set_password('admin123')
-            db.session.add(admin)
-        
-        # Tạo tài khoản user nếu chưa có
-        if not User.query.filter_by(username='user').first():
-            user = User(username='user', role='user')
-            user.set_password('user123')
-            db.session.add(user)
-        
-        # Thêm sách mẫu nếu chưa có
-        if Book.query.count() == 0:
-            sample_books = [
-                Book(title='Đắc Nhân Tâm', author='Dale Carnegie', category='Kỹ năng sống', 
-                     description='Cuốn sách nổi tiếng về nghệ thuật giao tiếp và ứng xử',
-                     image_url='https://salt.tikicdn.com/cache/750x750/ts/product/2e/25/6c/0e5e1ead0fd82236a23adb4f9e5e99b1.jpg.webp',
-                     quantity=5, available=5),
-                Book(title='Sapiens', author='Yuval Noah Harari', category='Lịch sử',
-                     description='Lược sử loài người từ thời kỳ đồ đá đến nay',
-                     image_url='https://salt.tikicdn.com/cache/750x750/ts/product/5e/18/24/2a6154ba08df6ce6161c13f4303fa19e.jpg.webp',
-                     quantity=3, available=3),
-                Book(title='Tuổi Trẻ Đáng Giá Bao Nhiêu', author='Rosie Nguyễn', category='Kỹ năng sống',
-                     description='Dành cho những người trẻ đang tìm kiếm định hướng',
-                     image_url='https://salt.tikicdn.com/cache/750x750/ts/product/46/08/f1/6c5cea81c557e5a97b007b800e5c483c.jpg.webp',
-                     quantity=4, available=4),
-                Book(title='Nhà Giả Kim', author='Paulo Coelho', category='Văn học',
-                     description='Chuyến hành trình tìm kiếm kho báu và ý nghĩa cuộc đời',
-                     image_url='https://salt.tikicdn.com/cache/750x750/ts/product/5e/d6/f8/107c6f87a786c45cb6e0940c52e8f6b5.jpg.webp',
-                     quantity=6, available=6),
-                Book(title='Tôi Tài Giỏi Bạn Cũng Thế', author='Adam Khoo', category='Kỹ năng sống',
-                     description='Phương pháp học tập hiệu quả từ chuyên gia',
-                     image_url='https://salt.tikicdn.com/cache/750x750/ts/product/d0/86/d7/7d1a42f6d0f92e65c6ebd32a04c53c2e.jpg.webp',
-                     quantity=3, available=3),
-            ]
-            for book in sample_books:
-                db.session.add(book)
-        
-        db.session.commit()
-        print('✅ Database đã được khởi tạo thành công!')
+# Helper function: Đọc tham số phân trang (con trỏ và số dòng mỗi trang)
+def page_args():
+    per_page = get_per_page(request.args.get('per_page'),
+                            current_app.config['PER_PAGE'], current_app.config['MAX_PER_PAGE'])
+    return request.args.get('after'), per_page
+
+# Helper function: Nạp phí phạt hiện tại được tính trong SQL vào record.accrued_fee
+# (records là BorrowRecord hoặc archive.history())
+def with_late_fee(records=BorrowRecord):
+    return with_expression(records.accrued_fee,
+                           records.current_late_fee(current_app.config['LATE_FEE_PER_DAY']))
+
+# Template helper: URL ảnh bìa theo kích thước ('thumb', 'medium')
+@bp.app_template_global()
+def cover_url(book, size='thumb'):
+    image_url = book.image_url
+    if image_url.startswith('http'):
+        if not current_app.config['COVER_PROXY']:
+            return image_url
+        # v đổi khi image_url đổi, nên trình duyệt có thể cache URL này lâu dài
+        return url_for('main.book_cover', id=book.id, size=size, v=RemoteCoverCache.key_for(image_url)[:12])
+    return url_for('static', filename=covers.variant_path(image_url, size, current_app.config))
+
+# Template helper: Render một fragment của sách, lấy từ cache nếu có
+@bp.app_template_global()
+def book_fragment(template, book):
+    return fragments.render(template, book, lambda: render_template(template, book=book),
+                            salt=current_app.config['ETAG_SALT'])
+
+# Khởi tạo/nâng cấp database và dữ liệu mẫu (trong app context); chạy lại nhiều lần vẫn an toàn
+def init_database(seed=True):
+    for version, name in migrations.migrate():
+        print(f'  ↳ Migration {version}: {name}')
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    if seed:
+        seed_sample_data()
+    
+    # Xây lại chỉ mục tìm kiếm nếu còn trống
+    if search.index_is_empty():
+        search.rebuild_index()
+    
+    # Khởi tạo bảng thống kê nếu chưa có
+    if stats.is_empty():
+        stats.rebuild()
+    if http_cache.catalog_revision() == 0:
+        http_cache.bump_catalog_revision()
+    
+    db.session.commit()
+    print('✅ Database đã được khởi tạo thành công!')
+
+# Tài khoản và sách mẫu, chỉ tạo khi chưa có
+def seed_sample_data():
+    # Tạo tài khoản admin nếu chưa có
+    if not User.query.filter_by(username='admin').first():
+        admin = User(username='admin', role='admin')
+        admin.set_password('admin123', current_app.config['PASSWORD_HASH_METHOD'])
+        db.session.add(admin)
+    
+    # Tạo tài khoản user nếu chưa có
+    if not User.query.filter_by(username='user').first():
+        user = User(username='user', role='user')
+        user.set_password('user123', current_app.config['PASSWORD_HASH_METHOD'])
+        db.session.add(user)
+    
+    # Thêm sách mẫu nếu chưa có
+    if Book.query.count() == 0:
+        sample_books = [
+            Book(title='Đắc Nhân Tâm', author='Dale Carnegie', category='Kỹ năng sống', 
+                 description='Cuốn sách nổi tiếng về nghệ thuật giao tiếp và ứng xử',
+                 image_url='https://salt.tikicdn.com/cache/750x750/ts/product/2e/25/6c/0e5e1ead0fd82236a23adb4f9e5e99b1.jpg.webp',
+                 quantity=5, available=5),
+            Book(title='Sapiens', author='Yuval Noah Harari', category='Lịch sử',
+                 description='Lược sử loài người từ thời kỳ đồ đá đến nay',
+                 image_url='https://salt.tikicdn.com/cache/750x750/ts/product/5e/18/24/2a6154ba08df6ce6161c13f4303fa19e.jpg.webp',
+                 quantity=3, available=3),
+            Book(title='Tuổi Trẻ Đáng Giá Bao Nhiêu', author='Rosie Nguyễn', category='Kỹ năng sống',
+                 description='Dành cho những người trẻ đang tìm kiếm định hướng',
+                 image_url='https://salt.tikicdn.com/cache/750x750/ts/product/46/08/f1/6c5cea81c557e5a97b007b800e5c483c.jpg.webp',
+                 quantity=4, available=4),
+            Book(title='Nhà Giả Kim', author='Paulo Coelho', category='Văn học',
+                 description='Chuyến hành trình tìm kiếm kho báu và ý nghĩa cuộc đời',
+                 image_url='https://salt.tikicdn.com/cache/750x750/ts/product/5e/d6/f8/107c6f87a786c45cb6e0940c52e8f6b5.jpg.webp',
+                 quantity=6, available=6),
+            Book(title='Tôi Tài Giỏi Bạn Cũng Thế', author='Adam Khoo', category='Kỹ năng sống',
+                 description='Phương pháp học tập hiệu quả từ chuyên gia',
+                 image_url='https://salt.tikicdn.com/cache/750x750/ts/product/d0/86/d7/7d1a42f6d0f92e65c6ebd32a04c53c2e.jpg.webp',
+                 quantity=3, available=3),
+        ]
+        for book in sample_books:
+            db.session.add(book)
+        db.session.flush()
 
-@app.route('/')
+@bp.route('/')
 def index():
+    revision = http_cache.catalog_revision()
+    not_modified = http_cache.revalidate(current_app.config['ETAG_SALT'], revision,
+                                         last_modified=http_cache.revision_datetime(revision))
+    if not_modified:
+        return not_modified
+    
     books = Book.query.order_by(Book.created_at.desc()).limit(6).all()
     return render_template('index.html', books=books)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and password_gate.verify(user, form.password.data)
+        except HashingBusy:
+            flash('Hệ thống đang bận, vui lòng thử đăng nhập lại sau giây lát!', 'warning')
+            return render_template('login.html', form=form), 503
+        
+        # Băm lại nếu hash đang dùng tham số cũ (bỏ qua nếu đang bận, lần sau sẽ làm)
+        method = current_app.config['PASSWORD_HASH_METHOD']
+        if valid and user.needs_rehash(method):
+            try:
+                password_gate.rehash(user, form.password.data, method)
+                db.session.commit()
+            except HashingBusy:
+                pass
+        
+        if valid:
             login_user(user)
             flash(f'Chào mừng {user.username}!', 'success')
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
+            return redirect(next_page) if next_page else redirect(url_for('main.index'))
         else:
             flash('Tên đăng nhập hoặc mật khẩu không đúng!', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Đã đăng xuất thành công!', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/books')
+# Các kiểu sắp xếp danh sách sách: tên hiển thị và cột (đều có chỉ mục kèm id)
+BOOK_SORTS = {
+    'newest': ('Mới nhất', Book.created_at),
+    'rating': ('Đánh giá cao', Book.rating_score),
+    'trending': ('Đang thịnh hành', Book.trending_score),
+}
+
+@bp.route('/books')
 def books():
-    search = request.args.get('search', '')
-    category = request.args.get('category', '')
-    
-    query = Book.query
+    revision = http_cache.catalog_revision()
+    not_modified = http_cache.revalidate(current_app.config['ETAG_SALT'], revision, request.query_string,
+                                         last_modified=http_cache.revision_datetime(revision))
+    if not_modified:
+        return not_modified
     
-    if search:
-        query = query.filter(Book.title.contains(search) | Book.author.contains(search))
+    search_text = request.args.get('search', '')
+    category = request.args.get('category', '')
+    sort = request.args.get('sort', 'newest')
+    if sort not in BOOK_SORTS:
+        sort = 'newest'
     
-    if category:
-        query = query.filter_by(category=category)
+    cursor, per_page = page_args()
     
-    books = query.all()
+    if search_text:
+        # Tìm qua chỉ mục toàn văn, xếp theo độ liên quan
+        books = search.search_books(search_text, category, cursor, per_page)
+    else:
+        query = Book.query
+        if category:
+            query = query.filter_by(category=category)
+        books = keyset_paginate(query, BOOK_SORTS[sort][1], Book.id, cursor, per_page)
     
     # Lấy danh sách thể loại
     categories = db.session.query(Book.category).distinct().all()
     categories = [c[0] for c in categories if c[0]]
     
-    return render_template('books.html', books=books, search=search, 
-                         category=category, categories=categories)
+    return render_template('books.html', books=books, search=search_text, 
+                         category=category, categories=categories,
+                         sort=sort, sorts=[(key, label) for key, (label, _) in BOOK_SORTS.items()])
 
-@app.route('/book/<int:id>')
+@bp.route('/book/<int:id>')
 def book_detail(id):
-    book = Book.query.get_or_404(id)
-    
-    # Lấy các review
-    reviews = BorrowRecord.query.filter_by(book_id=id).filter(
-        BorrowRecord.rating.isnot(None)
-    ).order_by(BorrowRecord.return_date.desc()).limit(10).all()
+    # Sách đổi updated_at mỗi khi được sửa, mượn, trả hoặc đánh giá; khối gợi ý có
+    # phiên bản riêng. Không gửi Last-Modified vì rebuild gợi ý không có thời điểm
+    version = db.session.query(Book.updated_at, Book.created_at).filter(Book.id == id).first()
+    if version is None:
+        abort(404)
+    not_modified = http_cache.revalidate(current_app.config['ETAG_SALT'], id,
+                                         (version.updated_at or version.created_at).isoformat(),
+                                         *recommendations.neighbors_version(id))
+    if not_modified:
+        return not_modified
+    
+    book = db.get_or_404(Book, id)
+    
+    # Lấy các review (cả các lượt mượn đã chuyển sang bảng lưu trữ)
+    records = archive.history()
+    reviews = db.session.query(records).options(joinedload(records.user)).filter(
+        records.book_id == id, records.rating.isnot(None)
+    ).order_by(records.return_date.desc()).limit(10).all()
     
     # Kiểm tra user đã mượn sách này chưa (để hiển thị form rating)
     user_borrowed = False
     if current_user.is_authenticated:
-        user_borrowed = BorrowRecord.query.filter_by(
-            book_id=id, 
-            user_id=current_user.id,
-            status='returned'
+        user_borrowed = db.session.query(records.id).filter(
+            records.book_id == id,
+            records.user_id == current_user.id,
+            records.status == 'returned'
         ).first() is not None
     
+    # Gợi ý "người mượn sách này cũng mượn" (top-K lưu sẵn, một truy vấn theo chỉ mục)
+    similar = recommendations.similar_books(id, current_app.config['RECOMMENDATIONS_SHOWN'])
+    
     return render_template('book_detail.html', book=book, reviews=reviews, 
-                         user_borrowed=user_borrowed)
+                         user_borrowed=user_borrowed, similar=similar)
+
+@bp.route('/cover/<int:id>/<size>')
+def book_cover(id, size):
+    if size not in current_app.config['COVER_SIZES'] and size != 'original':
+        abort(404)
+    
+    image_url = db.session.query(Book.image_url).filter(Book.id == id).scalar()
+    if not image_url or not image_url.startswith('http'):
+        abort(404)
+    
+    try:
+        path = cover_cache.get(image_url, size)
+    except CoverFetchError:
+        # Không tải được thì để trình duyệt tự lấy ảnh gốc
+        return redirect(image_url)
+    
+    mimetype = mimetypes.guess_type(path if not path.endswith('.orig') else image_url)[0] or 'image/jpeg'
+    response = send_file(path, mimetype=mimetype, conditional=True,
+                         max_age=current_app.config['COVER_CACHE_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
 
-@app.route('/book/<int:id>/rate', methods=['GET', 'POST'])
+@bp.route('/book/<int:id>/rate', methods=['GET', 'POST'])
 @login_required
 def rate_book(id):
-    book = Book.query.get_or_404(id)
+    book = db.get_or_404(Book, id)
     
     # Kiểm tra user đã mượn và trả sách này chưa
-    borrow_record = BorrowRecord.query.filter_by(
-        book_id=id,
-        user_id=current_user.id,
-        status='returned'
+    records = archive.history()
+    borrow_record = db.session.query(records).filter(
+        records.book_id == id,
+        records.user_id == current_user.id,
+        records.status == 'returned'
     ).first()
     
     if not borrow_record:
         flash('Bạn chỉ có thể đánh giá sách đã mượn và trả!', 'warning')
-        return redirect(url_for('book_detail', id=id))
+        return redirect(url_for('main.book_detail', id=id))
     
     form = RatingForm()
     
     if form.validate_on_submit():
-        # Nếu đã đánh giá rồi thì cập nhật
-        if borrow_record.rating:
-            # Trừ rating cũ
-            book.sum_ratings -= borrow_record.rating
-            book.total_ratings -= 1
-        
-        # Thêm rating mới
-        borrow_record.rating = form.rating.data
-        borrow_record.review = form.review.data
-        
-        book.sum_ratings += form.rating.data
-        book.total_ratings += 1
+        # Cập nhật rating và tổng rating của sách bằng UPDATE nguyên tử
+        # (nếu đã đánh giá rồi thì chỉ cộng phần chênh lệch)
+        updated = circulation.set_rating(borrow_record.id, book.id, borrow_record.rating,
+                                         form.rating.data, form.review.data)
+        if not updated:
+            db.session.rollback()
+            flash('Đánh giá vừa được cập nhật ở nơi khác, vui lòng thử lại!', 'warning')
+            return redirect(url_for('main.rate_book', id=id))
         
         db.session.commit()
+        fragments.invalidate_book(book.id)
         flash('Đã gửi đánh giá thành công!', 'success')
-        return redirect(url_for('book_detail', id=id))
+        return redirect(url_for('main.book_detail', id=id))
     
     # Pre-fill nếu đã có rating
     if borrow_record.rating:
@@ -203,7 +413,7 @@ def rate_book(id):
     
     return render_template('rate_book.html', form=form, book=book)
 
-@app.route('/books/add', methods=['GET', 'POST'])
+@bp.route('/books/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def add_book():
@@ -215,12 +425,8 @@ def add_book():
         if form.image.data:
             file = form.image.data
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Thêm timestamp để tránh trùng tên
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                image_path = f'uploads/books/{filename}'
+                # Lưu theo nội dung (SHA-256) và tạo ảnh thu nhỏ
+                image_path = covers.save_upload(file, current_app.config)
         
         # Nếu không upload file thì dùng URL
         if not image_path and form.image_url.data:
@@ -236,16 +442,21 @@ def add_book():
             available=form.quantity.data
         )
         db.session.add(book)
+        db.session.flush()
+        search.index_book(book)
+        typeahead.mark_changed()
+        stats.book_added(book.quantity, book.available)
+        http_cache.bump_catalog_revision()
         db.session.commit()
         flash(f'Đã thêm sách "{book.title}" thành công!', 'success')
-        return redirect(url_for('books'))
+        return redirect(url_for('main.books'))
     return render_template('book_form.html', form=form, title='Thêm sách mới')
 
-@app.route('/books/edit/<int:id>', methods=['GET', 'POST'])
+@bp.route('/books/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def edit_book(id):
-    book = Book.query.get_or_404(id)
+    book = db.get_or_404(Book, id)
     form = BookForm(obj=book)
     
     if form.validate_on_submit():
@@ -258,181 +469,464 @@ def edit_book(id):
         if form.image.data:
             file = form.image.data
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                book.image_url = f'uploads/books/{filename}'
+                book.image_url = covers.save_upload(file, current_app.config)
         elif form.image_url.data:
             book.image_url = form.image_url.data
         
         # Cập nhật số lượng có sẵn theo tỷ lệ
         old_quantity = book.quantity
+        old_available = book.available
         new_quantity = form.quantity.data
         if old_quantity > 0:
             ratio = book.available / old_quantity
             book.available = int(new_quantity * ratio)
         book.quantity = new_quantity
         
+        search.index_book(book)
+        typeahead.mark_changed()
+        stats.book_updated(new_quantity - old_quantity, book.available - old_available)
+        http_cache.bump_catalog_revision()
         db.session.commit()
+        fragments.invalidate_book(book.id)
         flash(f'Đã cập nhật sách "{book.title}" thành công!', 'success')
-        return redirect(url_for('books'))
+        return redirect(url_for('main.books'))
     
     return render_template('book_form.html', form=form, title='Chỉnh sửa sách', book=book)
 
-@app.route('/books/delete/<int:id>')
+@bp.route('/books/delete/<int:id>')
 @login_required
 @admin_required
 def delete_book(id):
-    book = Book.query.get_or_404(id)
+    book = db.get_or_404(Book, id)
     
     # Kiểm tra xem có ai đang mượn sách này không
     active_borrows = BorrowRecord.query.filter_by(book_id=id, status='borrowing').count()
     if active_borrows > 0:
         flash(f'Không thể xóa sách "{book.title}" vì còn người đang mượn!', 'danger')
-        return redirect(url_for('books'))
+        return redirect(url_for('main.books'))
     
+    search.remove_book(book.id)
+    typeahead.mark_changed()
+    recommendations.remove_book(book.id)
+    stats.book_deleted(book.id, book.quantity, book.available)
+    http_cache.bump_catalog_revision()
     db.session.delete(book)
     db.session.commit()
+    fragments.invalidate_book(id)
     flash(f'Đã xóa sách "{book.title}" thành công!', 'success')
-    return redirect(url_for('books'))
+    return redirect(url_for('main.books'))
+
+@bp.route('/books/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_books():
+    form = ImportForm()
+    result = None
+    if form.validate_on_submit():
+        file = form.file.data
+        result = catalog_io.import_books(file.stream, catalog_io.detect_format(file.filename),
+                                         current_app.config['IMPORT_BATCH_SIZE'])
+        for book_id in result.touched_ids:
+            fragments.invalidate_book(book_id)
+    return render_template('book_import.html', form=form, result=result)
+
+@bp.route('/export/<table>.<format>')
+@login_required
+@admin_required
+def export_data(table, format):
+    exporters = {'books': catalog_io.export_books, 'borrows': catalog_io.export_borrows}
+    if table not in exporters or format not in ('csv', 'jsonl'):
+        abort(404)
+    
+    rows = exporters[table](format, current_app.config['EXPORT_BATCH_SIZE'])
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(rows), mimetype=f'{mimetype}; charset=utf-8', headers={
+        'Content-Disposition': f'attachment; filename={table}.{format}'
+    })
 
-@app.route('/borrow', methods=['GET', 'POST'])
+@bp.route('/borrow', methods=['GET', 'POST'])
 @login_required
 def borrow():
     form = BorrowForm()
     
-    # Lấy danh sách sách còn có sẵn
-    available_books = Book.query.filter(Book.available > 0).all()
-    form.book_id.choices = [(b.id, f'{b.title} - {b.author} (Còn: {b.available})') for b in available_books]
+    # Chọn sẵn sách khi đến từ trang chi tiết (/borrow?book_id=...)
+    book_id = request.args.get('book_id', type=int)
+    if request.method == 'GET' and book_id:
+        book = db.session.get(Book, book_id)
+        if book is not None and book.available > 0:
+            form.book_id.data = book.id
+            form.query.data = f'{book.title} - {book.author}'
     
     if form.validate_on_submit():
-        book = Book.query.get(form.book_id.data)
+        # Giảm số lượng sách có sẵn (chỉ thành công khi còn sách)
+        title = circulation.take_copy(form.book_id.data)
         
-        if book.available <= 0:
+        if title is None:
+            db.session.rollback()
             flash('Sách này hiện không còn!', 'danger')
-            return redirect(url_for('borrow'))
+            return redirect(url_for('main.borrow'))
+        
+        if current_app.config['RECOMMENDATIONS_INCREMENTAL']:
+            recommendations.record_borrow(current_user.id, [form.book_id.data])
         
         # Tạo bản ghi mượn sách
-        due_date = datetime.utcnow() + timedelta(days=app.config['BORROW_DAYS'])
+        due_date = datetime.utcnow() + timedelta(days=current_app.config['BORROW_DAYS'])
         record = BorrowRecord(
-            book_id=book.id,
+            book_id=form.book_id.data,
             user_id=current_user.id,
             due_date=due_date
         )
         
-        # Giảm số lượng sách có sẵn
-        book.available -= 1
-        
         db.session.add(record)
+        stats.borrowed(form.book_id.data, current_user.id)
         db.session.commit()
+        fragments.invalidate_book(form.book_id.data)
         
-        flash(f'Đã mượn sách "{book.title}" thành công! Hạn trả: {due_date.strftime("%d/%m/%Y")}', 'success')
-        return redirect(url_for('my_borrows'))
+        flash(f'Đã mượn sách "{title}" thành công! Hạn trả: {due_date.strftime("%d/%m/%Y")}', 'success')
+        return redirect(url_for('main.my_borrows'))
     
     return render_template('borrow.html', form=form)
 
-@app.route('/my-borrows')
+@bp.route('/borrow/suggest')
+@login_required
+def borrow_suggest():
+    # Gợi ý sách còn bản theo tiền tố tên/tác giả cho ô tìm ở trang mượn sách
+    limit = min(request.args.get('limit', current_app.config['TYPEAHEAD_LIMIT'], type=int), current_app.config['TYPEAHEAD_MAX_LIMIT'])
+    matches = book_typeahead.suggest(request.args.get('q', ''), max(limit, 1))
+    return jsonify(results=[{'id': book_id, 'title': title, 'author': author, 'available': available}
+                            for book_id, title, author, available in matches])
+
+@bp.route('/my-borrows')
 @login_required
 def my_borrows():
-    records = BorrowRecord.query.filter_by(user_id=current_user.id).order_by(BorrowRecord.borrow_date.desc()).all()
-    
-    # Tính phí phạt cho các sách quá hạn
-    for record in records:
-        if record.status == 'borrowing':
-            record.calculate_late_fee(app.config['LATE_FEE_PER_DAY'])
-    
-    return render_template('my_borrows.html', records=records)
+    cursor, per_page = page_args()
+    # Toàn bộ lịch sử, gồm cả các lượt đã chuyển sang bảng lưu trữ
+    history = archive.history()
+    query = db.session.query(history).options(joinedload(history.book), with_late_fee(history)) \
+        .filter(history.user_id == current_user.id)
+    records = keyset_paginate(query, history.borrow_date, history.id, cursor, per_page)
+    
+    # Sách đang mượn (tập nhỏ) dùng cho cảnh báo sắp đến hạn, không phụ thuộc trang hiện tại
+    active_records = BorrowRecord.query.options(joinedload(BorrowRecord.book)).filter_by(
+        user_id=current_user.id, status='borrowing'
+    ).order_by(BorrowRecord.due_date).all()
+    
+    return render_template('my_borrows.html', records=records, active_records=active_records)
 
-@app.route('/return/<int:id>')
+@bp.route('/return/<int:id>')
 @login_required
 def return_book(id):
-    record = BorrowRecord.query.get_or_404(id)
+    record = db.get_or_404(BorrowRecord, id)
     
     # Kiểm tra quyền
     if record.user_id != current_user.id and not current_user.is_admin():
         flash('Bạn không có quyền thực hiện thao tác này!', 'danger')
-        return redirect(url_for('my_borrows'))
+        return redirect(url_for('main.my_borrows'))
     
     if record.status == 'returned':
         flash('Sách này đã được trả rồi!', 'warning')
-        return redirect(url_for('my_borrows'))
+        return redirect(url_for('main.my_borrows'))
     
-    # Cập nhật trạng thái
-    record.status = 'returned'
-    record.return_date = datetime.utcnow()
-    record.calculate_late_fee(app.config['LATE_FEE_PER_DAY'])
+    # Cập nhật trạng thái (chỉ một request có thể đóng bản ghi đang mượn)
+    return_date = datetime.utcnow()
+    late_fee = compute_late_fee(record.due_date, return_date, current_app.config['LATE_FEE_PER_DAY'])
+    if not circulation.close_record(record.id, return_date, late_fee):
+        db.session.rollback()
+        flash('Sách này đã được trả rồi!', 'warning')
+        return redirect(url_for('main.my_borrows'))
     
     # Tăng số lượng sách có sẵn
-    book = Book.query.get(record.book_id)
-    book.available += 1
+    book_id = record.book_id
+    title = circulation.put_back_copy(book_id)
+    stats.returned()
     
     db.session.commit()
+    fragments.invalidate_book(book_id)
     
-    if record.late_fee > 0:
-        flash(f'Đã trả sách "{book.title}". Phí phạt trễ hạn: {record.late_fee:,} VNĐ', 'warning')
+    if late_fee > 0:
+        flash(f'Đã trả sách "{title}". Phí phạt trễ hạn: {late_fee:,} VNĐ', 'warning')
     else:
-        flash(f'Đã trả sách "{book.title}" thành công!', 'success')
+        flash(f'Đã trả sách "{title}" thành công!', 'success')
     
-    return redirect(url_for('my_borrows'))
+    return redirect(url_for('main.my_borrows'))
+
+# Helper function: Mượn nhiều sách trong một transaction, trả về kết quả từng mã
+def borrow_many(book_ids, user_id):
+    unique_ids = list(dict.fromkeys(book_ids))
+    titles = dict(db.session.query(Book.id, Book.title).filter(Book.id.in_(unique_ids)))
+    taken = circulation.take_copies([book_id for book_id in unique_ids if book_id in titles])
+    
+    due_date = datetime.utcnow() + timedelta(days=current_app.config['BORROW_DAYS'])
+    if taken:
+        if current_app.config['RECOMMENDATIONS_INCREMENTAL']:
+            recommendations.record_borrow(user_id, list(taken))
+        db.session.execute(db.insert(BorrowRecord), [
+            {'book_id': book_id, 'user_id': user_id, 'due_date': due_date} for book_id in taken
+        ])
+        stats.borrowed_many(list(taken), user_id)
+    db.session.commit()
+    for book_id in taken:
+        fragments.invalidate_book(book_id)
+    
+    results, seen = [], set()
+    for book_id in book_ids:
+        result = {'id': book_id, 'title': titles.get(book_id), 'ok': False}
+        if book_id in seen:
+            result['message'] = 'Trùng trong danh sách'
+        elif book_id not in titles:
+            result['message'] = 'Không tìm thấy sách'
+        elif book_id not in taken:
+            result['message'] = 'Sách này hiện không còn!'
+        else:
+            result.update(ok=True, message=f'Hạn trả: {due_date.strftime("%d/%m/%Y")}')
+        seen.add(book_id)
+        results.append(result)
+    return results
 
-@app.route('/dashboard')
+# Helper function: Trả nhiều phiếu mượn trong một transaction, trả về kết quả từng mã
+def return_many(record_ids, user):
+    unique_ids = list(dict.fromkeys(record_ids))
+    records = {
+        row.id: row for row in db.session.query(
+            BorrowRecord.id, BorrowRecord.user_id, BorrowRecord.status, Book.title
+        ).join(Book).filter(BorrowRecord.id.in_(unique_ids))
+    }
+    
+    # Người dùng thường chỉ trả được phiếu của mình; điều kiện nằm ngay trong câu UPDATE
+    owner_id = None if user.is_admin() else user.id
+    closed = circulation.close_records(list(records), datetime.utcnow(),
+                                       current_app.config['LATE_FEE_PER_DAY'], user_id=owner_id)
+    if closed:
+        circulation.put_back_copies([book_id for _, book_id, _ in closed])
+        stats.returned(len(closed))
+    db.session.commit()
+    for book_id in {book_id for _, book_id, _ in closed}:
+        fragments.invalidate_book(book_id)
+    
+    fees = {record_id: late_fee for record_id, _, late_fee in closed}
+    results, seen = [], set()
+    for record_id in record_ids:
+        record = records.get(record_id)
+        result = {'id': record_id, 'title': record.title if record else None, 'ok': False}
+        if record_id in seen:
+            result['message'] = 'Trùng trong danh sách'
+        elif record is None:
+            result['message'] = 'Không tìm thấy phiếu mượn'
+        elif owner_id is not None and record.user_id != owner_id:
+            result['message'] = 'Bạn không có quyền thực hiện thao tác này!'
+        elif record_id not in fees:
+            result['message'] = 'Sách này đã được trả rồi!'
+        else:
+            late_fee = fees[record_id] or 0
+            result.update(ok=True, late_fee=late_fee,
+                          message=f'Phí phạt trễ hạn: {late_fee:,} VNĐ' if late_fee else 'Đã trả')
+        seen.add(record_id)
+        results.append(result)
+    return results
+
+# Helper function: Trả kết quả mượn/trả hàng loạt dạng JSON hoặc trang HTML
+def batch_response(form, results, template):
+    if request.is_json:
+        if results is None:
+            return jsonify(errors=form.errors), 400
+        return jsonify(results=results, succeeded=sum(1 for r in results if r['ok']))
+    return render_template(template, form=form, results=results)
+
+@bp.route('/borrow/batch', methods=['GET', 'POST'])
 @login_required
-@admin_required
-def dashboard():
-    # Thống kê tổng quan
-    total_books = Book.query.count()
-    total_quantity = db.session.query(db.func.sum(Book.quantity)).scalar() or 0
-    total_borrowed = db.session.query(db.func.sum(Book.quantity - Book.available)).scalar() or 0
-    active_borrows = BorrowRecord.query.filter_by(status='borrowing').count()
-    
-    # Sách quá hạn
-    overdue_records = BorrowRecord.query.filter(
-        BorrowRecord.status == 'borrowing',
-        BorrowRecord.due_date < datetime.utcnow()
-    ).all()
+def borrow_batch():
+    form = BatchBorrowForm()
+    results = None
     
-    # Tính phí phạt cho sách quá hạn
-    for record in overdue_records:
-        record.calculate_late_fee(app.config['LATE_FEE_PER_DAY'])
+    if form.validate_on_submit():
+        borrower_id = current_user.id
+        if form.username.data:
+            borrower = User.query.filter_by(username=form.username.data).first()
+            if not current_user.is_admin():
+                form.username.errors.append('Chỉ quản trị viên được mượn hộ!')
+            elif borrower is None:
+                form.username.errors.append('Không tìm thấy người dùng!')
+            else:
+                borrower_id = borrower.id
+        if not form.username.errors:
+            results = borrow_many(form.book_ids.data, borrower_id)
+    
+    return batch_response(form, results, 'borrow_batch.html')
+
+@bp.route('/return/batch', methods=['GET', 'POST'])
+@login_required
+def return_batch():
+    form = BatchReturnForm()
+    results = None
     
-    # Sách được mượn nhiều nhất
-    popular_books = db.session.query(
-        Book, db.func.count(BorrowRecord.id).label('borrow_count')
-    ).join(BorrowRecord).group_by(Book.id).order_by(db.desc('borrow_count')).limit(5).all()
+    if form.validate_on_submit():
+        results = return_many(form.record_ids.data, current_user)
     
-    # Độc giả tích cực
-    active_readers = db.session.query(
-        User, db.func.count(BorrowRecord.id).label('borrow_count')
-    ).join(BorrowRecord).filter(User.role == 'user').group_by(User.id).order_by(db.desc('borrow_count')).limit(5).all()
+    return batch_response(form, results, 'return_batch.html')
+
+@bp.route('/dashboard')
+@login_required
+@admin_required
+def dashboard():
+    # Thống kê tổng quan, sách/độc giả nổi bật (đọc từ bảng thống kê, có cache)
+    summary = stats.dashboard_stats(current_app.config['STATS_CACHE_TTL'])
+    
+    # Sách quá hạn, phí phạt tính trong SQL, phạt nhiều nhất lên đầu
+    overdue_records = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book), joinedload(BorrowRecord.user), with_late_fee()
+    ).filter(BorrowRecord.is_overdue()).order_by(
+        BorrowRecord.current_late_fee(current_app.config['LATE_FEE_PER_DAY']).desc(), BorrowRecord.id
+    ).all()
     
     return render_template('dashboard.html',
-                         total_books=total_books,
-                         total_quantity=total_quantity,
-                         total_borrowed=total_borrowed,
-                         active_borrows=active_borrows,
+                         total_books=summary['total_books'],
+                         total_quantity=summary['total_quantity'],
+                         total_borrowed=summary['total_borrowed'],
+                         active_borrows=summary['active_borrows'],
                          overdue_records=overdue_records,
-                         popular_books=popular_books,
-                         active_readers=active_readers)
+                         popular_books=summary['popular_books'],
+                         active_readers=summary['active_readers'])
+
+@bp.route('/dashboard/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(fragments.stats())
 
-@app.route('/all-borrows')
+@bp.route('/all-borrows')
 @login_required
 @admin_required
 def all_borrows():
-    records = BorrowRecord.query.order_by(BorrowRecord.borrow_date.desc()).all()
-    
-    # Tính phí phạt
-    for record in records:
-        if record.status == 'borrowing':
-            record.calculate_late_fee(app.config['LATE_FEE_PER_DAY'])
+    cursor, per_page = page_args()
+    overdue_only = bool(request.args.get('overdue'))
+    query = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book), joinedload(BorrowRecord.user), with_late_fee()
+    )
+    if overdue_only:
+        query = query.filter(BorrowRecord.is_overdue())
+    records = keyset_paginate(query, BorrowRecord.borrow_date, BorrowRecord.id, cursor, per_page)
+    
+    # Tổng hợp trạng thái đọc từ bộ đếm thay vì đếm trên toàn bảng
+    counters = stats.read_counters()
+    total_records = counters['total_borrows']
+    borrowing_records = counters['active_borrows']
+    
+    return render_template('all_borrows.html', records=records,
+                         overdue_only=overdue_only,
+                         total_records=total_records,
+                         borrowing_records=borrowing_records,
+                         returned_records=total_records - borrowing_records)
+
+@bp.cli.command('init-db')
+@click.option('--no-seed', is_flag=True, help='Không tạo tài khoản và sách mẫu.')
+@click.option('--status', is_flag=True, help='Chỉ liệt kê các migration chưa chạy.')
+def init_db(no_seed, status):
+    """Tạo/nâng cấp schema theo phiên bản và dữ liệu mẫu (chạy mỗi lần deploy)"""
+    if status:
+        waiting = migrations.pending()
+        for version, name in waiting:
+            print(f'⏳ Migration {version}: {name}')
+        if not waiting:
+            print('✅ Schema đã ở phiên bản mới nhất')
+        return
+    init_database(seed=not no_seed)
+
+@bp.cli.command('search-reindex')
+def search_reindex():
+    """Xây lại toàn bộ chỉ mục tìm kiếm sách"""
+    count = search.rebuild_index()
+    db.session.commit()
+    print(f'✅ Đã đánh chỉ mục {count} cuốn sách')
+
+@bp.cli.command('stats-rebuild')
+@click.option('--check', is_flag=True, help='Chỉ kiểm tra chênh lệch, không ghi lại.')
+def stats_rebuild(check):
+    """Tính lại toàn bộ bảng thống kê và báo cáo chênh lệch"""
+    drift = stats.rebuild(dry_run=check)
+    if check:
+        db.session.rollback()
+    else:
+        db.session.commit()
     
-    return render_template('all_borrows.html', records=records)
+    if not drift:
+        print('✅ Thống kê khớp với dữ liệu gốc')
+    for name, stored, actual in drift:
+        print(f'⚠️  {name}: đang lưu {stored}, thực tế {actual}')
+    if drift and not check:
+        print('✅ Đã tính lại thống kê')
+
+@bp.cli.command('rankings-refresh')
+@click.option('--ratings', is_flag=True, help='Tính lại cả điểm đánh giá và histogram số sao.')
+def rankings_refresh(ratings):
+    """Tính lại điểm thịnh hành (chạy định kỳ, ví dụ mỗi giờ qua cron)"""
+    if ratings:
+        print(f'✅ Điểm đánh giá: {rankings.rebuild_ratings()} sách có đánh giá')
+    count = rankings.refresh_trending(current_app.config['TRENDING_HALF_LIFE_DAYS'],
+                                      current_app.config['TRENDING_WINDOW_DAYS'])
+    http_cache.bump_catalog_revision()
+    db.session.commit()
+    print(f'✅ Điểm thịnh hành: {count} sách được mượn gần đây')
+
+@bp.cli.command('recommendations-rebuild')
+def recommendations_rebuild():
+    """Tính lại gợi ý "người mượn cũng mượn" từ toàn bộ lịch sử mượn"""
+    started = datetime.utcnow()
+    written = recommendations.rebuild(current_app.config['RECOMMENDATIONS_TOP_K'],
+                                      current_app.config['RECOMMENDATIONS_MIN_CO_COUNT'])
+    db.session.commit()
+    engine = 'NumPy/SciPy' if recommendations.np is not None else 'Python'
+    print(f'✅ Ghi {written} cặp sách gợi ý ({engine}, '
+          f'{(datetime.utcnow() - started).total_seconds():.1f}s)')
+
+@bp.cli.command('sweep-overdue')
+@click.option('--chunk-size', type=int, default=None, help='Số dòng mỗi transaction.')
+def sweep_overdue(chunk_size):
+    """Cập nhật phí phạt và cờ quá hạn cho các sách đang mượn quá hạn"""
+    processed, elapsed = sweeper.sweep_overdue(current_app.config['LATE_FEE_PER_DAY'],
+                                               chunk_size or current_app.config['OVERDUE_SWEEP_CHUNK'])
+    rate = processed / elapsed if elapsed > 0 else 0
+    print(f'✅ Đã quét {processed} bản ghi quá hạn trong {elapsed:.2f}s ({rate:,.0f} dòng/giây)')
+
+@bp.cli.command('archive-borrows')
+@click.option('--days', type=int, default=None, help='Chuyển các lượt đã trả lâu hơn số ngày này.')
+@click.option('--chunk-size', type=int, default=None, help='Số dòng mỗi transaction.')
+def archive_borrows(days, chunk_size):
+    """Chuyển lượt mượn đã trả từ lâu sang bảng lưu trữ"""
+    moved, elapsed = archive.archive_returned(days if days is not None else current_app.config['ARCHIVE_AFTER_DAYS'],
+                                              chunk_size or current_app.config['ARCHIVE_CHUNK'])
+    rate = moved / elapsed if elapsed > 0 else 0
+    print(f'✅ Đã chuyển {moved} lượt mượn sang bảng lưu trữ trong {elapsed:.2f}s ({rate:,.0f} dòng/giây)')
+
+@bp.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Định dạng file (mặc định đoán theo phần mở rộng).')
+@click.option('--batch-size', type=int, default=None, help='Số dòng mỗi transaction.')
+def import_catalog(path, fmt, batch_size):
+    """Nhập danh mục sách từ file CSV/JSONL"""
+    with open(path, 'rb') as stream:
+        result = catalog_io.import_books(stream, fmt or catalog_io.detect_format(path),
+                                         batch_size or current_app.config['IMPORT_BATCH_SIZE'])
+    print(f'✅ Thêm mới {result.inserted}, cập nhật {result.updated}, '
+          f'trùng {result.duplicates}, không hợp lệ {result.invalid}')
+    for line, message in result.errors:
+        print(f'⚠️  Dòng {line}: {message}')
+
+@bp.cli.command('export-catalog')
+@click.argument('table', type=click.Choice(['books', 'borrows']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-')
+def export_catalog(table, fmt, output):
+    """Xuất bảng sách hoặc mượn/trả ra CSV/JSONL"""
+    exporter = catalog_io.export_books if table == 'books' else catalog_io.export_borrows
+    for chunk in exporter(fmt, current_app.config['EXPORT_BATCH_SIZE']):
+        output.write(chunk)
+
+app = create_app()
 
 if __name__ == '__main__':
     # Only initialize database in development
     if os.environ.get('FLASK_ENV') != 'production':
-        init_database()
+        with app.app_context():
+            init_database()
     app.run(debug=True)
-else:
-    # In production (when imported by gunicorn)
-    init_database()
\ No newline at end of file
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tách lịch sử mượn thành bảng nóng và bảng lưu trữ.
+
+``BorrowRecord`` chỉ giữ các lượt đang mượn và các lượt trả gần đây; lượt đã
+trả quá ``ARCHIVE_AFTER_DAYS`` ngày được ``archive_returned`` (lệnh
+``flask archive-borrows``, chạy định kỳ qua cron) chuyển sang
+``BorrowArchive`` theo từng khúc ``id``: mỗi khúc là một DELETE ... RETURNING,
+một INSERT và một transaction ngắn. Id được giữ nguyên, và bảng nóng không cấp
+lại id đã chuyển đi (``sqlite_autoincrement``, sequence trên PostgreSQL) nên id
+là duy nhất trên cả hai bảng.
+
+Mượn, trả, quét quá hạn và dashboard chỉ đọc bảng nóng. Những chỗ cần toàn bộ
+lịch sử (lịch sử mượn của độc giả, review, tính lại rating, thống kê, gợi ý,
+xuất dữ liệu) đọc qua ``history()``: UNION ALL của hai bảng, ánh xạ thành
+``BorrowRecord`` nên template và quan hệ ``book``/``user`` dùng như cũ. Điều
+kiện lọc được database đẩy vào từng vế của UNION và dùng chỉ mục của mỗi bảng.
+
+Nên đặt ``ARCHIVE_AFTER_DAYS`` lớn hơn ``TRENDING_WINDOW_DAYS`` vì điểm thịnh
+hành chỉ đọc bảng nóng.
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import aliased
+
+from models import db, BorrowArchive, BorrowRecord
+
+
+def _columns(model):
+    table = model.__table__
+    return [table.c[column.key] for column in BorrowRecord.__table__.c]
+
+
+def history_select():
+    """SELECT ... UNION ALL SELECT ... trên cả hai bảng (các cột của BorrowRecord)"""
+    return db.union_all(db.select(*_columns(BorrowRecord)), db.select(*_columns(BorrowArchive)))
+
+
+def history():
+    """Thực thể BorrowRecord đọc từ cả bảng nóng lẫn bảng lưu trữ.
+
+    Dùng như một model: ``db.session.query(records).filter(records.user_id == 1)``.
+    """
+    return aliased(BorrowRecord, history_select().subquery('borrow_history'), name='borrow_history')
+
+
+def _move(ids):
+    hot = BorrowRecord.__table__
+    if db.session.get_bind().dialect.delete_returning:
+        # Xóa và lấy lại đúng các dòng đã xóa trong một câu, không sót thay đổi xen giữa
+        rows = db.session.execute(hot.delete().where(hot.c.id.in_(ids)).returning(*hot.c)).mappings().all()
+        db.session.execute(BorrowArchive.__table__.insert(), [dict(row) for row in rows])
+        return
+    db.session.execute(BorrowArchive.__table__.insert().from_select(
+        [column.key for column in hot.c], db.select(*hot.c).where(hot.c.id.in_(ids))))
+    db.session.execute(hot.delete().where(hot.c.id.in_(ids)))
+
+
+def archive_returned(older_than_days, chunk_size=1000, now=None):
+    """Chuyển các lượt đã trả trước ``older_than_days`` ngày sang bảng lưu trữ.
+
+    Trả về (số dòng đã chuyển, số giây).
+    """
+    started = time.perf_counter()
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    moved = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.session.query(BorrowRecord.id).filter(
+            BorrowRecord.id > last_id,
+            BorrowRecord.status == 'returned',
+            BorrowRecord.return_date < cutoff
+        ).order_by(BorrowRecord.id).limit(chunk_size)]
+        if not ids:
+            break
+
+        _move(ids)
+        db.session.commit()
+        moved += len(ids)
+        last_id = ids[-1]
+
+    return moved, time.perf_counter() - started
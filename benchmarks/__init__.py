@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Các bài đo hiệu năng chạy thủ công, ví dụ: ``python -m benchmarks.login_throughput``
+
+* ``benchmarks.datagen``: sinh dữ liệu giả lập cố định theo seed.
+* ``benchmarks.routes``: đo từng route, ghi kết quả JSON để so sánh giữa các bản.
+* ``benchmarks.query_plans``: EXPLAIN các câu SQL của từng route, báo lỗi nếu quét toàn bảng.
+* ``benchmarks.login_throughput``: đăng nhập dồn dập và giới hạn băm mật khẩu.
+"""
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Sinh dữ liệu giả lập (User, Book, BorrowRecord) cho các bài đo.
+
+Chạy: ``DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.datagen --scale 100k``
+
+Cùng ``--seed`` và ``--scale`` luôn sinh ra cùng một bộ dữ liệu; ngày tháng
+được tính tương đối với nửa đêm (UTC) của ngày chạy để luôn có một phần sách
+đang mượn và quá hạn. Tài khoản giả lập có tên ``reader<N>`` và mật khẩu
+``bench123``. Chỉ chạy trên database trống (chỉ có dữ liệu mẫu).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Số người dùng, số đầu sách, số lượt mượn
+SCALES = {
+    '1k': (100, 500, 1_000),
+    '100k': (5_000, 20_000, 100_000),
+    '1m': (50_000, 100_000, 1_000_000),
+}
+
+PASSWORD = 'bench123'
+CATEGORIES = ('Văn học', 'Khoa học', 'Lịch sử', 'Công nghệ', 'Kinh tế',
+              'Nghệ thuật', 'Tâm lý', 'Kỹ năng sống', 'Khác')
+WORDS = ('sông', 'núi', 'biển', 'trời', 'đất', 'người', 'mùa', 'xuân', 'hạ', 'thu', 'đông',
+         'ánh', 'sáng', 'bóng', 'tối', 'lịch', 'sử', 'khoa', 'học', 'kinh', 'tế', 'tâm', 'hồn',
+         'hành', 'trình', 'giấc', 'mơ', 'thành', 'phố', 'làng', 'quê', 'tình', 'yêu', 'chiến',
+         'tranh', 'hòa', 'bình', 'tuổi', 'trẻ', 'bí', 'mật', 'kho', 'báu', 'dữ', 'liệu', 'máy',
+         'tính', 'nghệ', 'thuật', 'cuộc', 'đời', 'con', 'đường', 'ngôi', 'sao', 'gió', 'mưa')
+SURNAMES = ('Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi')
+GIVEN_NAMES = ('An', 'Bình', 'Chi', 'Dũng', 'Giang', 'Hà', 'Hải', 'Hương', 'Khoa', 'Lan',
+               'Minh', 'Nam', 'Ngọc', 'Phong', 'Quang', 'Thảo', 'Trang', 'Tuấn', 'Việt', 'Yến')
+
+ACTIVE_RATIO = 0.03   # Phần lượt mượn gần nhất còn đang mượn
+RATED_RATIO = 0.3     # Phần lượt đã trả có đánh giá
+HISTORY_DAYS = 730    # Khoảng thời gian trải các lượt mượn
+
+
+def _skewed(rng, n):
+    """Chỉ số 0..n-1 lệch về đầu (một số sách/độc giả được mượn nhiều hơn hẳn)"""
+    return min(n - 1, int(n * rng.random() ** 2))
+
+
+def generate_books(rng, count):
+    for _ in range(count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+        quantity = rng.randint(1, 10)
+        yield {
+            'title': title,
+            'author': f'{rng.choice(SURNAMES)} {rng.choice(GIVEN_NAMES)}',
+            'category': rng.choice(CATEGORIES),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 30))),
+            'quantity': quantity,
+            'available': quantity,
+        }
+
+
+def generate_borrows(rng, count, user_ids, books, anchor, borrow_days, fee_per_day):
+    """Sinh các lượt mượn theo thứ tự thời gian; cập nhật available trong books"""
+    from models import compute_late_fee
+
+    first_active = int(count * (1 - ACTIVE_RATIO))
+    for index in range(count):
+        book = books[_skewed(rng, len(books))]
+        user_id = user_ids[_skewed(rng, len(user_ids))]
+        borrow_date = anchor - timedelta(days=HISTORY_DAYS * (1 - index / count),
+                                         seconds=rng.randint(0, 86399))
+        due_date = borrow_date + timedelta(days=borrow_days)
+        row = {
+            'book_id': book['id'],
+            'user_id': user_id,
+            'borrow_date': borrow_date,
+            'due_date': due_date,
+            'return_date': None,
+            'status': 'borrowing',
+            'late_fee': 0,
+            'rating': None,
+            'review': None,
+        }
+        if index >= first_active and book['available'] > 0:
+            book['available'] -= 1
+        else:
+            return_date = min(anchor, borrow_date + timedelta(days=rng.randint(1, borrow_days + 7)))
+            row.update(status='returned', return_date=return_date,
+                       late_fee=compute_late_fee(due_date, return_date, fee_per_day))
+            if rng.random() < RATED_RATIO:
+                row['rating'] = rng.randint(1, 5)
+        yield row
+
+
+def _insert(model, rows, batch_size, returning=None):
+    from models import db
+
+    ids = []
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        if returning is not None:
+            stmt = db.insert(model).returning(returning, sort_by_parameter_order=True)
+            ids.extend(db.session.execute(stmt, chunk).scalars())
+        else:
+            db.session.execute(db.insert(model), chunk)
+        db.session.commit()
+    return ids
+
+
+def populate(scale, seed=42, batch_size=5000, anchor=None):
+    """Ghi dữ liệu vào database hiện tại, trả về số dòng đã tạo theo bảng"""
+    from flask import current_app
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Book, BorrowRecord
+    import http_cache
+    import rankings
+    import search
+    import stats
+    import typeahead
+
+    user_count, book_count, borrow_count = SCALES[scale]
+    rng = random.Random(seed)
+    anchor = anchor or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # Băm một lần rồi dùng chung: băm mật khẩu cho hàng chục nghìn tài khoản mất hàng giờ
+    password_hash = generate_password_hash(PASSWORD, current_app.config['PASSWORD_HASH_METHOD'])
+    users = [{'username': f'reader{index}', 'password_hash': password_hash, 'role': 'user'}
+             for index in range(1, user_count + 1)]
+    user_ids = _insert(User, users, batch_size, returning=User.id)
+
+    books = list(generate_books(rng, book_count))
+    book_ids = _insert(Book, books, batch_size, returning=Book.id)
+    for book, book_id in zip(books, book_ids):
+        book['id'] = book_id
+
+    borrows = list(generate_borrows(rng, borrow_count, user_ids, books, anchor,
+                                    current_app.config['BORROW_DAYS'],
+                                    current_app.config['LATE_FEE_PER_DAY']))
+    _insert(BorrowRecord, borrows, batch_size)
+
+    for start in range(0, len(books), batch_size):
+        db.session.execute(db.update(Book), [
+            {'id': book['id'], 'available': book['available']}
+            for book in books[start:start + batch_size]
+        ])
+    db.session.commit()
+
+    search.rebuild_index()
+    rankings.rebuild_ratings()
+    rankings.refresh_trending(current_app.config['TRENDING_HALF_LIFE_DAYS'],
+                              current_app.config['TRENDING_WINDOW_DAYS'], now=anchor)
+    stats.rebuild()
+    http_cache.bump_catalog_revision()
+    typeahead.mark_changed()
+    db.session.commit()
+    return {'users': len(user_ids), 'books': len(book_ids), 'borrows': len(borrows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k',
+                        help='Quy mô theo số lượt mượn')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000, help='Số dòng mỗi câu INSERT')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit('Hãy đặt DATABASE_URL tới database dùng để đo (sẽ bị ghi thêm dữ liệu).')
+
+    from app import app, init_database
+    from models import BorrowRecord
+
+    with app.app_context():
+        init_database()
+        if BorrowRecord.query.first() is not None:
+            sys.exit('Database đã có lượt mượn; hãy dùng một database trống.')
+        started = time.perf_counter()
+        counts = populate(args.scale, args.seed, args.batch_size)
+        elapsed = time.perf_counter() - started
+
+    print(f"✅ {counts['users']} người dùng, {counts['books']} sách, "
+          f"{counts['borrows']} lượt mượn ({elapsed:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
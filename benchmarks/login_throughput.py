@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Đo thông lượng đăng nhập và độ trễ của các trang khác trong lúc đăng nhập dồn dập.
+
+Chạy: ``python -m benchmarks.login_throughput --threads 16 --seconds 10``
+
+Mặc định dùng một file SQLite tạm nên không đụng vào dữ liệu thật.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='Số luồng đăng nhập đồng thời')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Thời gian chạy')
+    parser.add_argument('--method', default=None, help='Ghi đè PASSWORD_HASH_METHOD')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    if args.method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.method
+
+    from app import app, init_database
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        init_database()
+
+    stop = threading.Event()
+    results = {'ok': 0, 'busy': 0, 'failed': 0}
+    login_latency = []
+    page_latency = []
+    lock = threading.Lock()
+
+    def login_worker():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': 'user', 'password': 'user123'})
+            elapsed = time.perf_counter() - started
+            key = 'ok' if response.status_code == 302 else 'busy' if response.status_code == 503 else 'failed'
+            with lock:
+                results[key] += 1
+                login_latency.append(elapsed)
+            client.get('/logout')
+
+    def page_worker():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/books')
+            with lock:
+                page_latency.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_worker) for _ in range(args.threads)]
+    threads.append(threading.Thread(target=page_worker))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"Hash method:        {app.config['PASSWORD_HASH_METHOD']}")
+    print(f"Concurrency gate:   {app.config['PASSWORD_HASH_CONCURRENCY']}")
+    print(f"Logins OK:          {results['ok']} ({results['ok'] / args.seconds:.1f}/s)")
+    print(f"Logins busy (503):  {results['busy']}")
+    print(f"Logins failed:      {results['failed']}")
+    if login_latency:
+        print(f'Login p50/p95 (ms): {statistics.median(login_latency) * 1000:.1f} / '
+              f'{percentile(login_latency, 95) * 1000:.1f}')
+    if page_latency:
+        print(f'/books p50/p95 (ms): {statistics.median(page_latency) * 1000:.1f} / '
+              f'{percentile(page_latency, 95) * 1000:.1f}')
+
+
+if __name__ == '__main__':
+    main()
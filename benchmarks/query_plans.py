@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra kế hoạch thực thi của mọi câu SELECT mà các route chính chạy.
+
+Chạy (trên database đã có dữ liệu từ ``benchmarks.datagen``, nên dùng quy mô
+100k trở lên để planner không chọn quét bảng chỉ vì bảng nhỏ)::
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.query_plans
+
+Mỗi route được gọi qua Flask test client. Các câu SELECT nó gửi tới database
+được ghi lại rồi chạy lại với ``EXPLAIN QUERY PLAN`` (SQLite) hoặc
+``EXPLAIN (FORMAT JSON)`` (PostgreSQL) với đúng tham số đó. Câu nào quét toàn
+bảng (SQLite: ``SCAN <bảng>`` không qua chỉ mục; PostgreSQL: ``Seq Scan``) trên
+bảng không nằm trong ``SMALL_TABLES`` hay ``EXPECTED_SCANS`` của route đó bị báo
+lỗi, và lệnh thoát với mã 1 để dùng được trong CI. ``tests/test_query_plans.py``
+chạy cùng kiểm tra này cho từng route trong bộ test.
+"""
+import argparse
+import os
+import re
+import sys
+
+from benchmarks.datagen import PASSWORD
+
+# Bảng chỉ có vài dòng, quét toàn bộ là cách rẻ nhất
+SMALL_TABLES = {'library_stat', 'schema_migration'}
+
+# Quét toàn bảng có chủ đích theo route: {route: {bảng: lý do}}
+EXPECTED_SCANS = {
+    'borrow_suggest': {'book': 'Lần gọi đầu của tiến trình dựng chỉ mục gợi ý từ toàn bộ sách'},
+}
+
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+class StatementRecorder:
+    """Ghi lại các câu SELECT (kèm tham số) trong lúc bật"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.engine = engine
+        self.active = False
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active and not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append((statement, parameters))
+
+    def record(self):
+        self.statements = []
+        self.active = True
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.active = False
+
+
+def sqlite_scans(conn, statement, parameters, aliases):
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    scans = []
+    for row in rows:
+        match = _SQLITE_SCAN_RE.match(row[-1])
+        if match:
+            name = match.group(1)
+            scans.append(aliases.get(name, name))
+    return scans, '\n'.join(row[-1] for row in rows)
+
+
+def postgresql_scans(conn, statement, parameters, aliases):
+    plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        import json
+        plan = json.loads(plan)
+    scans = []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(node.get('Relation Name'))
+        for child in node.get('Plans', ()):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return scans, repr(plan)
+
+
+def table_aliases(statement):
+    """{bí danh: tên bảng} từ các mệnh đề ``FROM/JOIN <bảng> AS <bí danh>``"""
+    return {alias: table for table, alias in
+            re.findall(r'(?:FROM|JOIN)\s+"?(\w+)"?\s+AS\s+"?(\w+)"?', statement, re.IGNORECASE)}
+
+
+def build_routes(app):
+    """[(tên route, đường dẫn, tài khoản)] với id/con trỏ lấy từ dữ liệu thật"""
+    from models import db, Book, BorrowArchive, BorrowRecord, User
+    from pagination import encode_cursor
+
+    with app.app_context():
+        book = db.session.query(Book).order_by(Book.total_ratings.desc(), Book.id).first()
+        newest = db.session.query(Book).order_by(Book.created_at.desc(), Book.id.desc()).offset(20).first()
+        category = db.session.query(Book.category).filter(Book.category.isnot(None)).first()
+        latest = db.session.query(BorrowRecord).order_by(BorrowRecord.borrow_date.desc(),
+                                                         BorrowRecord.id.desc()).offset(20).first()
+        # Độc giả có lịch sử ở cả hai bảng nếu đã chạy archive-borrows
+        reader_id = (db.session.query(BorrowArchive.user_id).first()
+                     or db.session.query(BorrowRecord.user_id).first())[0]
+        reader = db.session.get(User, reader_id).username
+        own = db.session.query(BorrowRecord).filter(BorrowRecord.user_id == reader_id) \
+            .order_by(BorrowRecord.borrow_date.desc()).first()
+
+    reader_login = (reader, PASSWORD if reader.startswith('reader') else 'user123')
+    admin_login = ('admin', 'admin123')
+    routes = [
+        ('index', '/', None),
+        ('books', '/books', None),
+        ('books_category', f'/books?category={category[0]}', None),
+        ('books_rating', '/books?sort=rating', None),
+        ('books_trending', '/books?sort=trending', None),
+        ('books_search', '/books?search=song', None),
+        ('book_detail', f'/book/{book.id}', reader_login),
+        ('rate_form', f'/book/{book.id}/rate', reader_login),
+        ('my_borrows', '/my-borrows', reader_login),
+        ('borrow_form', '/borrow', reader_login),
+        ('borrow_form_book', f'/borrow?book_id={book.id}', reader_login),
+        ('borrow_suggest', '/borrow/suggest?q=song', reader_login),
+        ('dashboard', '/dashboard', admin_login),
+        ('all_borrows', '/all-borrows', admin_login),
+        ('all_borrows_overdue', '/all-borrows?overdue=1', admin_login),
+    ]
+    if newest is not None:
+        routes.append(('books_page', f'/books?after={encode_cursor(newest.created_at, newest.id)}', None))
+    if latest is not None:
+        routes.append(('all_borrows_page',
+                       f'/all-borrows?after={encode_cursor(latest.borrow_date, latest.id)}', admin_login))
+    if own is not None:
+        routes.append(('my_borrows_page',
+                       f'/my-borrows?after={encode_cursor(own.borrow_date, own.id)}', reader_login))
+    return routes
+
+
+def explainer(app):
+    """(StatementRecorder, hàm EXPLAIN) cho engine của ứng dụng"""
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+    return StatementRecorder(engine), postgresql_scans if engine.dialect.name == 'postgresql' else sqlite_scans
+
+
+def inspect_route(app, recorder, explain, route):
+    """Gọi một route, trả về (mã HTTP, số câu SELECT, [(bảng bị quét, câu SQL, kế hoạch)], [kế hoạch đạt])"""
+    name, path, login = route
+    client = app.test_client()
+    if login:
+        client.post('/login', data={'username': login[0], 'password': login[1]})
+    with recorder.record():
+        status = client.get(path).status_code
+    statements = recorder.statements
+
+    allowed = SMALL_TABLES | set(EXPECTED_SCANS.get(name, ()))
+    problems = []
+    plans = []
+    with recorder.engine.connect() as conn:
+        for statement, parameters in statements:
+            scans, plan = explain(conn, statement, parameters, table_aliases(statement))
+            bad = sorted(set(scans) - allowed)
+            if bad:
+                problems.append((bad, statement, plan))
+            else:
+                plans.append(plan)
+    return status, len(statements), problems, plans
+
+
+def describe(bad, statement, plan):
+    return (f'quét toàn bảng {", ".join(bad)}:\n   {" ".join(statement.split())}\n'
+            + '\n'.join(f'     {line}' for line in plan.splitlines()))
+
+
+def check(app, routes, verbose=False):
+    """Trả về số câu SQL quét toàn bảng ngoài dự kiến"""
+    recorder, explain = explainer(app)
+
+    failures = 0
+    for route in routes:
+        status, count, problems, plans = inspect_route(app, recorder, explain, route)
+        if verbose:
+            for plan in plans:
+                print(f'    {plan}')
+
+        mark = '✅' if not problems and status < 400 else '❌'
+        print(f'{mark} {route[0]:<20} {status}  {count} câu SELECT')
+        if status >= 400:
+            failures += 1
+        for problem in problems:
+            failures += 1
+            print(f'   {describe(*problem)}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--route', '-r', action='append', help='Chỉ kiểm tra các route này (lặp lại được)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='In cả kế hoạch của các câu đạt')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit('Hãy đặt DATABASE_URL tới database đã sinh bằng benchmarks.datagen.')
+
+    from app import app
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SLOW_REQUEST_MS'] = 0
+    routes = [route for route in build_routes(app) if not args.route or route[0] in args.route]
+    failures = check(app, routes, args.verbose)
+    if failures:
+        sys.exit(f'❌ {failures} lỗi kế hoạch truy vấn')
+    print('✅ Không có câu nào quét toàn bảng ngoài dự kiến')
+
+
+if __name__ == '__main__':
+    main()
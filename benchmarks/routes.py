@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""Đo thông lượng, độ trễ và số câu SQL của từng route chính.
+
+Chạy (trên database đã có dữ liệu từ ``benchmarks.datagen``)::
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.routes -n 200 -o before.json
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.routes -n 200 --compare before.json
+
+Mặc định chạy trong tiến trình qua Flask test client và đếm câu SQL của mỗi
+request. Với ``--base-url http://127.0.0.1:8000`` các request được gửi tới một
+server đang chạy (ví dụ gunicorn); khi đó không đếm được câu SQL.
+
+Kịch bản ``borrow`` và ``return`` ghi vào database: hãy sinh lại dữ liệu trước
+mỗi lần đo nếu cần kết quả so sánh được.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from benchmarks import percentile
+from benchmarks.datagen import PASSWORD
+
+SCENARIOS = ('books', 'books_search', 'book_detail', 'dashboard', 'all_borrows', 'borrow', 'return')
+SEARCH_TERMS = ('song', 'nguoi', 'lich su', 'hanh trinh', 'bi mat', 'thanh pho', 'tinh yeu')
+
+_CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class QueryCounter:
+    """Đếm câu SQL theo luồng (chỉ dùng được khi chạy trong tiến trình)"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+class TestClientSession:
+    """Gửi request qua Flask test client, có đếm câu SQL"""
+
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, data=None):
+        self.counter.reset()
+        response = self.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, self.counter.count
+
+    def login(self, username, password):
+        self.client.post('/login', data={'username': username, 'password': password})
+
+
+class HTTPSession:
+    """Gửi request tới server đang chạy, giữ cookie và tự lấy CSRF token"""
+
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._token = None
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self._NoRedirect)
+
+    def _open(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as exc:
+            return exc.code, ''
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            data = dict(data or {}, csrf_token=self._csrf_token(path))
+        status, _ = self._open(method, path, data)
+        return status, None
+
+    def _csrf_token(self, path):
+        # Token dùng được cho cả phiên, chỉ lấy một lần để không tính vào thời gian đo
+        if self._token is None:
+            _, html = self._open('GET', path)
+            match = _CSRF_RE.search(html)
+            self._token = match.group(1) if match else ''
+        return self._token
+
+    def login(self, username, password):
+        self._token = None
+        self.request('POST', '/login', {'username': username, 'password': password})
+        self._token = None
+
+
+def load_targets(app, seed):
+    """Chọn trước id sách/phiếu mượn cho các kịch bản (cố định theo seed)"""
+    from models import db, Book, BorrowRecord, User
+
+    rng = random.Random(seed)
+    with app.app_context():
+        book_ids = [row[0] for row in db.session.query(Book.id).order_by(Book.id)]
+        available_ids = [row[0] for row in db.session.query(Book.id).filter(Book.available > 0)
+                         .order_by(Book.id)]
+        active_ids = [row[0] for row in db.session.query(BorrowRecord.id)
+                      .filter(BorrowRecord.status == 'borrowing').order_by(BorrowRecord.id)]
+        reader = db.session.query(User.username).filter(User.username.like('reader%')) \
+            .order_by(User.id).first()
+    rng.shuffle(active_ids)
+    return {
+        'rng': rng,
+        'book_ids': book_ids,
+        'available_ids': available_ids,
+        'active_ids': active_ids,
+        'reader': (reader[0], PASSWORD) if reader else ('user', 'user123'),
+    }
+
+
+def build_request(name, targets):
+    """Trả về (method, path, data) cho một lần gọi kịch bản, hoặc None nếu hết dữ liệu"""
+    rng = targets['rng']
+    if name == 'books':
+        return 'GET', '/books', None
+    if name == 'books_search':
+        return 'GET', '/books?' + urllib.parse.urlencode({'search': rng.choice(SEARCH_TERMS)}), None
+    if name == 'book_detail':
+        return 'GET', f"/book/{rng.choice(targets['book_ids'])}", None
+    if name == 'dashboard':
+        return 'GET', '/dashboard', None
+    if name == 'all_borrows':
+        return 'GET', '/all-borrows', None
+    if name == 'borrow':
+        if not targets['available_ids']:
+            return None
+        return 'POST', '/borrow', {'book_id': rng.choice(targets['available_ids'])}
+    if name == 'return':
+        if not targets['active_ids']:
+            return None
+        return 'GET', f"/return/{targets['active_ids'].pop()}", None
+    raise ValueError(name)
+
+
+def run_scenario(name, make_session, targets, requests, threads, warmup):
+    lock = threading.Lock()
+    latencies, queries, statuses = [], [], {}
+
+    def worker(count, record):
+        session = make_session(name)
+        for _ in range(count):
+            with lock:
+                call = build_request(name, targets)
+            if call is None:
+                return
+            started = time.perf_counter()
+            status, query_count = session.request(*call)
+            elapsed = time.perf_counter() - started
+            if record:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if query_count is not None:
+                        queries.append(query_count)
+
+    if warmup:
+        worker(warmup, record=False)
+
+    per_thread = [requests // threads + (1 if index < requests % threads else 0) for index in range(threads)]
+    workers = [threading.Thread(target=worker, args=(count, True)) for count in per_thread]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / wall, 2) if wall and latencies else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def dataset_info(app):
+    from models import db, User, Book, BorrowRecord
+
+    with app.app_context():
+        return {
+            'dialect': db.engine.dialect.name,
+            'users': db.session.query(db.func.count(User.id)).scalar(),
+            'books': db.session.query(db.func.count(Book.id)).scalar(),
+            'borrows': db.session.query(db.func.count(BorrowRecord.id)).scalar(),
+        }
+
+
+def compare(results, baseline_path):
+    """In chênh lệch p95 và số câu SQL so với một file kết quả trước đó"""
+    with open(baseline_path, encoding='utf-8') as handle:
+        baseline = json.load(handle)['routes']
+    print(f"\n{'route':<14}{'p95 trước':>12}{'p95 sau':>12}{'thay đổi':>10}{'SQL trước':>11}{'SQL sau':>9}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = ((current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100) if before['p95_ms'] else 0.0
+        print(f"{name:<14}{before['p95_ms']:>12.2f}{current['p95_ms']:>12.2f}{change:>+9.1f}%"
+              f"{str(before['queries_mean']):>11}{str(current['queries_mean']):>9}")
+
+
+def _logged_in(session, name, targets):
+    # Trang quản trị và trả sách hộ cần admin; mượn sách dùng tài khoản độc giả
+    if name in ('dashboard', 'all_borrows', 'return'):
+        session.login('admin', 'admin123')
+    elif name == 'borrow':
+        session.login(*targets['reader'])
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', '-n', type=int, default=100, help='Số request đo cho mỗi kịch bản')
+    parser.add_argument('--threads', '-t', type=int, default=1, help='Số luồng gửi đồng thời')
+    parser.add_argument('--warmup', type=int, default=5, help='Số request chạy trước, không tính')
+    parser.add_argument('--scenario', '-s', action='append', choices=SCENARIOS,
+                        help='Chỉ chạy các kịch bản này (lặp lại được)')
+    parser.add_argument('--base-url', help='Đo một server đang chạy thay vì test client')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', '-o', help='Ghi kết quả JSON ra file')
+    parser.add_argument('--compare', help='So sánh với file kết quả JSON trước đó')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit('Hãy đặt DATABASE_URL tới database đã sinh bằng benchmarks.datagen.')
+
+    from app import app
+    from models import db
+
+    if args.base_url:
+        def make_session(name):
+            session = HTTPSession(args.base_url)
+            return _logged_in(session, name, targets)
+    else:
+        app.config['WTF_CSRF_ENABLED'] = False
+        with app.app_context():
+            counter = QueryCounter(db.engine)
+
+        def make_session(name):
+            return _logged_in(TestClientSession(app, counter), name, targets)
+
+    targets = load_targets(app, args.seed)
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, make_session, targets, args.requests, args.threads, args.warmup)
+        row = results[name]
+        print(f"{name:<14}{row['throughput_rps']:>9.1f} req/s  p50 {row['p50_ms']:>8.2f}  "
+              f"p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms  "
+              f"SQL {row['queries_mean']}  lỗi {row['errors']}")
+
+    report = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'mode': 'http' if args.base_url else 'test_client',
+            'threads': args.threads,
+            'requests': args.requests,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'dataset': dataset_info(app),
+        },
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
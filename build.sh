@@ -4,5 +4,5 @@ set -o errexit
 
 pip install -r requirements.txt
 
-# Initialize database
-python -c "from app import app, init_database; init_database()"
\ No newline at end of file
+# Initialize / migrate database (idempotent, safe on every deploy)
+flask --app app init-db
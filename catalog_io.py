@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Nhập/xuất danh mục sách dạng luồng (CSV hoặc JSONL).
+
+Nhập: đọc file từng dòng, kiểm tra bằng cùng quy tắc với ``BookForm``, bỏ dòng
+trùng (title, author) trong file, rồi ghi theo lô - mỗi lô một câu SELECT tra
+sách đã có, một INSERT executemany cho sách mới, một UPDATE executemany cho
+sách đã có, và một transaction.
+
+Xuất: duyệt bảng bằng ``yield_per`` và sinh từng dòng, không bao giờ nạp cả
+bảng vào bộ nhớ.
+"""
+import csv
+import io
+import json
+
+from werkzeug.datastructures import MultiDict
+
+from forms import BookRowForm
+from models import db, Book
+import archive
+import http_cache
+import search
+import typeahead
+import stats
+
+IMPORT_FIELDS = ('title', 'author', 'category', 'description', 'image_url', 'quantity')
+
+BOOK_EXPORT_FIELDS = ('id', 'title', 'author', 'category', 'description', 'image_url',
+                      'quantity', 'available', 'total_ratings', 'sum_ratings', 'created_at')
+BORROW_EXPORT_FIELDS = ('id', 'book_id', 'user_id', 'borrow_date', 'due_date', 'return_date',
+                        'status', 'late_fee', 'rating', 'review')
+
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.touched_ids = []
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def iter_rows(stream, fmt):
+    """Sinh (số dòng, dict) từ một stream nhị phân"""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, exc
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError('Dòng không phải object JSON')
+    else:
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _validate(form, row):
+    """Trả về (dict đã làm sạch, None) hoặc (None, thông báo lỗi).
+
+    Dùng lại một instance BookRowForm cho mọi dòng (chỉ process lại dữ liệu)
+    vì khởi tạo form mới cho từng dòng tốn nhiều hơn cả việc kiểm tra.
+    """
+    formdata = MultiDict({
+        key: '' if row.get(key) is None else str(row.get(key)).strip()
+        for key in IMPORT_FIELDS
+    })
+    form.process(formdata)
+    if not form.validate():
+        message = '; '.join(f'{field}: {", ".join(errors)}' for field, errors in form.errors.items())
+        return None, message
+    data = {key: form.data[key] for key in IMPORT_FIELDS}
+    data['description'] = data['description'] or None
+    data['image_url'] = data['image_url'] or None
+    return data, None
+
+
+def _update_statement():
+    """UPDATE executemany cho sách đã có.
+
+    Số có sẵn được tính trong SQL từ giá trị hiện tại của dòng (giữ nguyên số
+    đang được mượn, chỉ cộng chênh lệch số lượng, không xuống dưới 0), nên lượt
+    mượn/trả chạy song song với lần nhập không bị ghi đè.
+    """
+    table = Book.__table__
+    available = table.c.available + (db.bindparam('new_quantity', type_=db.Integer) - table.c.quantity)
+    values = {field: db.bindparam(f'new_{field}') for field in IMPORT_FIELDS}
+    values['available'] = db.case((available < 0, 0), else_=available)
+    return db.update(table).where(table.c.id == db.bindparam('book_id')).values(values)
+
+
+def _write_batch(batch, result):
+    """Ghi một lô vào DB trong một transaction"""
+    keys = list(batch.keys())
+    # Khóa các dòng (PostgreSQL) để chênh lệch ghi vào bộ đếm khớp với UPDATE bên dưới
+    existing = {
+        (book.title, book.author): book
+        for book in db.session.query(
+            Book.id, Book.title, Book.author, Book.quantity, Book.available
+        ).filter(db.tuple_(Book.title, Book.author).in_(keys)).with_for_update()
+    }
+
+    new_rows = [dict(data, available=data['quantity']) for key, data in batch.items() if key not in existing]
+    updates = []
+    quantity_delta = available_delta = 0
+    for key, data in batch.items():
+        current = existing.get(key)
+        if current is None:
+            continue
+        updates.append(dict(data, id=current.id))
+        quantity_delta += data['quantity'] - current.quantity
+        available_delta += max(0, current.available + data['quantity'] - current.quantity) - current.available
+
+    indexed = []
+    if new_rows:
+        inserted = db.session.execute(
+            db.insert(Book).returning(Book.id, Book.title, Book.author, Book.category,
+                                      Book.description, sort_by_parameter_order=True),
+            new_rows
+        ).all()
+        indexed.extend(inserted)
+        stats.book_added(sum(row['quantity'] for row in new_rows),
+                         sum(row['available'] for row in new_rows),
+                         count=len(new_rows))
+    if updates:
+        db.session.execute(_update_statement(), [
+            dict({f'new_{field}': row[field] for field in IMPORT_FIELDS}, book_id=row['id'])
+            for row in updates
+        ])
+        indexed.extend(_Doc(row) for row in updates)
+        stats.book_updated(quantity_delta, available_delta)
+
+    search.index_books(indexed)
+    typeahead.mark_changed()
+    http_cache.bump_catalog_revision()
+    db.session.commit()
+
+    result.inserted += len(new_rows)
+    result.updated += len(updates)
+    result.touched_ids.extend(row['id'] for row in updates)
+
+
+class _Doc:
+    """Bọc dict để search.index_books đọc như thuộc tính"""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+
+def import_books(stream, fmt='csv', batch_size=1000):
+    """Nhập sách từ stream, trả về ImportResult"""
+    result = ImportResult()
+    form = BookRowForm()
+    seen = set()
+    batch = {}
+
+    for line_number, row in iter_rows(stream, fmt):
+        if isinstance(row, Exception):
+            result.error(line_number, str(row))
+            continue
+
+        data, message = _validate(form, row)
+        if data is None:
+            result.error(line_number, message)
+            continue
+
+        key = (data['title'], data['author'])
+        if key in seen:
+            result.duplicates += 1
+            continue
+        seen.add(key)
+        batch[key] = data
+
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch = {}
+
+    if batch:
+        _write_batch(batch, result)
+    return result
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _export(query, fields, fmt, batch_size):
+    if fmt == 'jsonl':
+        for obj in query.yield_per(batch_size):
+            yield json.dumps({field: _format_value(getattr(obj, field)) for field in fields},
+                             ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for index, obj in enumerate(query.yield_per(batch_size), start=1):
+        writer.writerow([_format_value(getattr(obj, field)) for field in fields])
+        if index % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_books(fmt='csv', batch_size=1000):
+    query = db.session.query(*[getattr(Book, field) for field in BOOK_EXPORT_FIELDS]).order_by(Book.id)
+    return _export(query, BOOK_EXPORT_FIELDS, fmt, batch_size)
+
+
+def export_borrows(fmt='csv', batch_size=1000):
+    # Toàn bộ lịch sử, gồm cả các lượt đã chuyển sang bảng lưu trữ
+    records = archive.history()
+    query = db.session.query(
+        *[getattr(records, field) for field in BORROW_EXPORT_FIELDS]
+    ).order_by(records.id)
+    return _export(query, BORROW_EXPORT_FIELDS, fmt, batch_size)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Các thao tác mượn/trả/đánh giá dạng nguyên tử.
+
+Mỗi thay đổi bộ đếm là một câu UPDATE có điều kiện (ví dụ
+``available = available - 1 WHERE available > 0``), nên nhiều worker cùng
+mượn một cuốn sách không thể làm âm số lượng, không cần khóa dòng và không cần
+vòng lặp thử lại. Các hàm ở đây không commit; route gọi chúng tự commit.
+
+Các hàm ``*_many`` làm cùng việc cho cả một danh sách id bằng vài câu lệnh
+có điều kiện (``WHERE id IN (...)``), dùng cho quầy mượn/trả hàng loạt.
+"""
+from models import db, Book, BorrowArchive, BorrowRecord, bayesian_rating
+
+
+def _supports_returning():
+    return db.session.get_bind().dialect.update_returning
+
+
+def _execute(stmt):
+    return db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def take_copy(book_id):
+    """Giảm available đi 1 nếu còn sách.
+
+    Trả về tên sách khi thành công, None nếu sách không tồn tại hoặc đã hết.
+    """
+    stmt = db.update(Book).where(Book.id == book_id, Book.available > 0) \
+        .values(available=Book.available - 1, trending_score=Book.trending_score + 1)
+
+    if _supports_returning():
+        return _execute(stmt.returning(Book.title)).scalar()
+
+    if _execute(stmt).rowcount != 1:
+        return None
+    return db.session.query(Book.title).filter(Book.id == book_id).scalar()
+
+
+def put_back_copy(book_id):
+    """Tăng available thêm 1, trả về tên sách"""
+    stmt = db.update(Book).where(Book.id == book_id) \
+        .values(available=Book.available + 1)
+
+    if _supports_returning():
+        return _execute(stmt.returning(Book.title)).scalar()
+
+    _execute(stmt)
+    return db.session.query(Book.title).filter(Book.id == book_id).scalar()
+
+
+def take_copies(book_ids):
+    """Giảm available đi 1 cho mỗi sách (id không trùng nhau) còn bản.
+
+    Trả về ``{book_id: title}`` của các sách đã lấy được; sách không tồn tại
+    hoặc đã hết không có trong kết quả.
+    """
+    if not book_ids:
+        return {}
+    stmt = db.update(Book).where(Book.id.in_(book_ids), Book.available > 0) \
+        .values(available=Book.available - 1, trending_score=Book.trending_score + 1)
+
+    if _supports_returning():
+        return dict(_execute(stmt.returning(Book.id, Book.title)).all())
+
+    taken = {}
+    for book_id in book_ids:
+        title = take_copy(book_id)
+        if title is not None:
+            taken[book_id] = title
+    return taken
+
+
+def put_back_copies(book_ids):
+    """Tăng available cho các sách, mỗi lần xuất hiện trong book_ids là một bản"""
+    counts = {}
+    for book_id in book_ids:
+        counts[book_id] = counts.get(book_id, 0) + 1
+    ids_by_count = {}
+    for book_id, count in counts.items():
+        ids_by_count.setdefault(count, []).append(book_id)
+    # Thường mỗi sách chỉ trả một bản nên chỉ có một câu lệnh
+    for count, ids in ids_by_count.items():
+        _execute(db.update(Book).where(Book.id.in_(ids))
+                 .values(available=Book.available + count))
+
+
+def close_record(record_id, return_date, late_fee):
+    """Chuyển bản ghi sang 'returned' nếu nó còn đang mượn.
+
+    Chỉ một request thắng được điều kiện ``status = 'borrowing'``, nên sách
+    không bao giờ được cộng lại hai lần. Trả về True nếu bản ghi đã được đóng.
+    """
+    stmt = db.update(BorrowRecord).where(
+        BorrowRecord.id == record_id,
+        BorrowRecord.status == 'borrowing'
+    ).values(status='returned', return_date=return_date, late_fee=late_fee)
+    return _execute(stmt).rowcount == 1
+
+
+def close_records(record_ids, return_date, fee_per_day, user_id=None):
+    """Đóng các bản ghi còn đang mượn, phí phạt được tính ngay trong câu UPDATE.
+
+    Nếu có ``user_id`` thì chỉ đóng bản ghi của người đó. Trả về danh sách
+    ``(record_id, book_id, late_fee)`` của các bản ghi đã được đóng.
+    """
+    if not record_ids:
+        return []
+    conditions = [BorrowRecord.id.in_(record_ids), BorrowRecord.status == 'borrowing']
+    if user_id is not None:
+        conditions.append(BorrowRecord.user_id == user_id)
+    # Biểu thức được tính trên giá trị cũ của dòng (status vẫn là 'borrowing')
+    late_fee = BorrowRecord.current_late_fee(fee_per_day, return_date)
+
+    if _supports_returning():
+        stmt = db.update(BorrowRecord).where(*conditions).values(
+            status='returned', return_date=return_date, late_fee=late_fee
+        ).returning(BorrowRecord.id, BorrowRecord.book_id, BorrowRecord.late_fee)
+        return [tuple(row) for row in _execute(stmt)]
+
+    # Không có RETURNING: đóng từng bản ghi bằng UPDATE có điều kiện như close_record,
+    # nên bản ghi bị request khác đóng sau câu SELECT không bị ghi đè hay trả về
+    rows = db.session.query(BorrowRecord.id, BorrowRecord.book_id, late_fee) \
+        .filter(*conditions).with_for_update().all()
+    return [tuple(row) for row in rows if close_record(row[0], return_date, row[2])]
+
+
+def set_rating(record_id, book_id, old_rating, new_rating, review):
+    """Ghi đánh giá mới, cập nhật tổng rating, histogram số sao và điểm xếp hạng.
+
+    Bản ghi chỉ được ghi nếu rating hiện tại vẫn là ``old_rating`` (so sánh
+    rồi ghi), nên hai lần gửi đồng thời không thể cộng trùng vào tổng.
+    Trả về False nếu đánh giá đã bị thay đổi bởi request khác.
+    """
+    # Lượt mượn cũ có thể đã được chuyển sang bảng lưu trữ (archive.py)
+    for model in (BorrowRecord, BorrowArchive):
+        stmt = db.update(model).where(
+            model.id == record_id,
+            model.rating.is_not_distinct_from(old_rating)
+        ).values(rating=new_rating, review=review)
+        if _execute(stmt).rowcount == 1:
+            break
+    else:
+        return False
+
+    # Vế phải của SET đọc giá trị cũ của dòng, nên điểm mới được tính từ tổng mới
+    sum_ratings = Book.sum_ratings + (new_rating - (old_rating or 0))
+    total_ratings = Book.total_ratings + (0 if old_rating else 1)
+    values = {
+        'sum_ratings': sum_ratings,
+        'total_ratings': total_ratings,
+        'rating_score': bayesian_rating(sum_ratings, total_ratings),
+    }
+    if old_rating != new_rating:
+        new_column = getattr(Book, f'stars_{new_rating}')
+        values[new_column.key] = new_column + 1
+        if old_rating:
+            old_column = getattr(Book, f'stars_{old_rating}')
+            values[old_column.key] = old_column - 1
+    _execute(db.update(Book).where(Book.id == book_id).values(values))
+    return True
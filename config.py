@@ -1,25 +1,129 @@
 # -*- coding: utf-8 -*-
 import os
 
+def _database_url(url):
+    # Fix for Render PostgreSQL URL (postgres:// -> postgresql://)
+    if url and url.startswith('postgres://'):
+        return url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+def engine_options(url):
+    """Tham số create_engine (pool, kiểm tra kết nối, timeout câu lệnh) theo biến môi trường"""
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',  # Bỏ kết nối chết trước khi dùng
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # Giây, nhỏ hơn timeout của server/proxy
+    }
+    if url.startswith('sqlite'):
+        # SQLite dùng pool mặc định của Flask-SQLAlchemy (bộ nhớ: StaticPool, không nhận pool_size)
+        return options
+    options.update(
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),  # Số kết nối giữ sẵn mỗi tiến trình
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),  # Số kết nối tạm thêm khi đông
+        pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # Giây chờ kết nối rảnh trước khi báo lỗi
+    )
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
     # Get database URL from environment
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    
-    # Fix for Render PostgreSQL URL (postgres:// -> postgresql://)
-    if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
-        DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+    DATABASE_URL = _database_url(os.environ.get('DATABASE_URL'))
     
     # Use PostgreSQL in production, SQLite in development
     SQLALCHEMY_DATABASE_URI = DATABASE_URL or 'sqlite:///library.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # Bản sao chỉ đọc (read replica), phân cách bằng dấu phẩy; xem replicas.py
+    DATABASE_REPLICA_URLS = [_database_url(url.strip())
+                             for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f'replica_{index}': dict(engine_options(url), url=url)
+                        for index, url in enumerate(DATABASE_REPLICA_URLS)}
+    DB_REPLICA_ENDPOINTS = ('main.index', 'main.books', 'main.book_detail', 'main.dashboard', 'main.all_borrows')  # Chỉ đọc, GET/HEAD
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))  # Đọc từ primary sau khi ghi
     
     # Cấu hình mượn sách
     BORROW_DAYS = 14  # Số ngày mượn tối đa
     LATE_FEE_PER_DAY = 5000  # Phí phạt mỗi ngày trễ (VNĐ)
+    BATCH_MAX_ITEMS = 100  # Số sách/phiếu tối đa cho một lần mượn/trả hàng loạt
+    
+    # Cấu hình phân trang
+    PER_PAGE = 20  # Số dòng mặc định mỗi trang
+    MAX_PER_PAGE = 100  # Số dòng tối đa mỗi trang
+    
+    # Cấu hình thống kê
+    STATS_CACHE_TTL = 30  # Số giây giữ số liệu dashboard trong cache
+    
+    # Cấu hình quét sách quá hạn
+    OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))  # Số giây giữa hai lần quét, 0 = tắt
+    OVERDUE_SWEEP_CHUNK = 1000  # Số dòng mỗi transaction
+    
+    # Cấu hình lưu trữ lịch sử mượn (flask archive-borrows, xem archive.py)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))  # Chuyển lượt đã trả lâu hơn số ngày này
+    ARCHIVE_CHUNK = 1000  # Số dòng mỗi transaction
+    
+    # Cấu hình xếp hạng "đang thịnh hành"
+    TRENDING_HALF_LIFE_DAYS = 7  # Trọng số một lượt mượn giảm một nửa sau số ngày này
+    TRENDING_WINDOW_DAYS = 60  # Chỉ tính các lượt mượn trong khoảng này (flask rankings-refresh)
+    
+    # Cấu hình gợi ý "người mượn cũng mượn" (flask recommendations-rebuild)
+    RECOMMENDATIONS_TOP_K = 10  # Số sách gần nhất lưu cho mỗi sách
+    RECOMMENDATIONS_MIN_CO_COUNT = 1  # Số độc giả chung tối thiểu để được gợi ý
+    RECOMMENDATIONS_SHOWN = 6  # Số gợi ý hiển thị ở trang chi tiết
+    RECOMMENDATIONS_INCREMENTAL = True  # Cập nhật gợi ý ngay khi có lượt mượn mới
+    
+    # Cấu hình gợi ý sách khi gõ ở trang mượn sách (/borrow/suggest, xem typeahead.py)
+    TYPEAHEAD_LIMIT = 10  # Số gợi ý mặc định
+    TYPEAHEAD_MAX_LIMIT = 50  # Giới hạn tham số limit
+    TYPEAHEAD_REFRESH_SECONDS = 30  # Dựng lại chỉ mục tối đa một lần mỗi khoảng này khi danh mục đổi
     
     # Cấu hình upload file
     UPLOAD_FOLDER = 'static/uploads/books'
-    MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB max file size
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 8 * 1024 * 1024  # 8MB cho mọi route (ảnh bìa giới hạn 5MB trong BookForm)
+    IMPORT_MAX_CONTENT_LENGTH = 64 * 1024 * 1024  # Riêng trang nhập danh mục, xem LibraryRequest trong app.py
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    
+    # Cấu hình ảnh bìa thu nhỏ (tạo một lần khi upload)
+    COVER_SIZES = {'thumb': (240, 360), 'medium': (480, 720)}  # Khung tối đa (rộng, cao)
+    COVER_FORMAT = 'webp'  # 'webp' hoặc 'jpeg'
+    COVER_ASYNC = True  # Tạo ảnh thu nhỏ ngoài thread của request
+    
+    # Cấu hình bộ đệm ảnh bìa từ máy chủ ngoài
+    COVER_PROXY = True  # Phục vụ image_url dạng http qua /cover/... thay vì trỏ thẳng ra ngoài
+    COVER_CACHE_FOLDER = 'cache/covers'
+    COVER_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Dung lượng tối đa của thư mục cache
+    COVER_CACHE_MAX_AGE = 365 * 24 * 3600  # Thời gian trình duyệt được cache ảnh (giây)
+    COVER_FETCH_TIMEOUT = 10  # Giây
+    
+    # Cấu hình GET có điều kiện: đổi giá trị này khi template thay đổi để làm mới ETag
+    ETAG_SALT = os.environ.get('ETAG_SALT', '1')
+    
+    # Cấu hình cache HTML thẻ sách
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 2000  # Số fragment tối đa trong bộ nhớ mỗi tiến trình
+    FRAGMENT_CACHE_TTL = 600  # Giây
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL')  # Dùng chung giữa các worker nếu có
+    
+    # Cấu hình cache người dùng đăng nhập
+    USER_CACHE_SIZE = 10000  # Số người dùng tối đa trong cache mỗi tiến trình
+    USER_CACHE_TTL = 60  # Giây
+    
+    # Cấu hình băm mật khẩu (hash cũ được băm lại khi đăng nhập thành công)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # Hoặc 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2))  # Số lần băm cùng lúc
+    PASSWORD_HASH_WAIT = float(os.environ.get('PASSWORD_HASH_WAIT', 0))  # Số giây chờ lượt băm trước khi báo bận (0: báo bận ngay)
+    
+    # Cấu hình nhập/xuất danh mục
+    IMPORT_BATCH_SIZE = 1000  # Số dòng mỗi transaction khi nhập
+    EXPORT_BATCH_SIZE = 1000  # Số dòng nạp mỗi lần khi xuất (yield_per)
+    
+    # Cấu hình đo hiệu năng từng request (Server-Timing, log request chậm, /metrics)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') == '1'  # '0' để tắt hẳn
+    SERVER_TIMING_HEADER = True
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))  # 0 để không ghi log request chậm
+    SLOW_REQUEST_LOG_QUERIES = 5  # Số câu SQL chậm nhất được ghi kèm
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # /metrics nhận "Authorization: Bearer <token>" hoặc phiên admin
+    METRICS_ALLOW_LOOPBACK = os.environ.get('METRICS_ALLOW_LOOPBACK') == '1'  # Mở /metrics cho 127.0.0.1 (không dùng sau reverse proxy)
\ No newline at end of file
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Bộ đệm cục bộ cho ảnh bìa ở máy chủ ngoài (``image_url`` dạng http).
+
+Ảnh được tải về một lần, lưu trong thư mục cache có giới hạn dung lượng (xóa
+ảnh lâu không dùng nhất trước - LRU theo mtime), tạo các bản thu nhỏ giống ảnh
+upload, rồi phục vụ từ máy chủ của thư viện. Nhiều request cùng thiếu một URL
+chỉ kích hoạt một lần tải.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import urllib.request
+
+import covers
+
+CHUNK_SIZE = 64 * 1024
+
+
+class CoverFetchError(Exception):
+    pass
+
+
+class RemoteCoverCache:
+    def __init__(self, cache_dir, max_bytes, sizes, fmt, timeout=10, max_file_bytes=10 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.sizes = sizes
+        self.fmt = fmt
+        self.timeout = timeout
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._total_bytes = None
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _original_name(self, key):
+        return f'{key}.orig'
+
+    def _target_name(self, key, size):
+        if size in self.sizes and covers.Image is not None:
+            return covers.variant_name(key, size, self.fmt)
+        return self._original_name(key)
+
+    def get(self, url, size):
+        """Trả về đường dẫn file đã cache cho URL ở kích thước size (tải về nếu chưa có)"""
+        key = self.key_for(url)
+        path = self._path(self._target_name(key, size))
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+
+        # Gộp các lần thiếu đồng thời: chỉ thread đầu tiên tải, các thread khác chờ
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            event.wait(self.timeout * 2)
+            if os.path.exists(path):
+                return path
+            raise CoverFetchError(url)
+
+        try:
+            self._fill(url, key)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+        if not os.path.exists(path):
+            raise CoverFetchError(url)
+        return path
+
+    def _fill(self, url, key):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        original = self._path(self._original_name(key))
+        if not os.path.exists(original):
+            self._download(url, original)
+
+        created = []
+        if covers.Image is not None:
+            try:
+                created = covers.generate_variants(original, self.cache_dir, key, self.sizes, self.fmt)
+            except (OSError, ValueError) as exc:
+                raise CoverFetchError(url) from exc
+
+        self._account([original] + created)
+
+    def _download(self, url, destination):
+        if not url.startswith(('http://', 'https://')):
+            raise CoverFetchError(url)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.fetch-')
+        try:
+            request = urllib.request.Request(url, headers={'User-Agent': 'library-cover-cache'})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response, \
+                    os.fdopen(fd, 'wb') as out:
+                received = 0
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if received > self.max_file_bytes:
+                        raise CoverFetchError(url)
+                    out.write(chunk)
+            os.replace(temp_path, destination)
+        except (OSError, ValueError) as exc:
+            raise CoverFetchError(url) from exc
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _account(self, paths):
+        added = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += added
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file())
+
+    def evict(self, target_ratio=0.9):
+        """Xóa các ảnh dùng lâu nhất cho đến khi dung lượng còn dưới target_ratio * max_bytes"""
+        groups = {}
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            key = entry.name.split('_', 1)[0].split('.', 1)[0]
+            stat = entry.stat()
+            size, mtime, names = groups.get(key, (0, 0, []))
+            groups[key] = (size + stat.st_size, max(mtime, stat.st_mtime), names + [entry.name])
+
+        total = sum(size for size, _, _ in groups.values())
+        limit = self.max_bytes * target_ratio
+        for key, (size, _, names) in sorted(groups.items(), key=lambda item: item[1][1]):
+            if total <= limit:
+                break
+            with self._lock:
+                if key in self._inflight:
+                    continue
+            for name in names:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+            total -= size
+
+        with self._lock:
+            self._total_bytes = total
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        with self._lock:
+            self._total_bytes = None
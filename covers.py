@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Xử lý ảnh bìa sách tải lên.
+
+* Ghi file theo từng khúc vào thư mục upload, đồng thời tính SHA-256.
+* Đặt tên file theo nội dung (``<sha256>.<ext>``) nên tải lại cùng một ảnh
+  không tốn thêm dung lượng.
+* Tạo sẵn các bản thu nhỏ (``<sha256>_thumb.webp``, ``<sha256>_medium.webp``)
+  một lần khi upload, có thể chạy ngoài thread của request.
+
+Pillow là tùy chọn: nếu không cài, ảnh gốc vẫn được lưu và dùng cho mọi cỡ.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - Pillow là tùy chọn
+    Image = None
+
+# Đường dẫn tương đối trong thư mục static, khớp với UPLOAD_FOLDER
+STATIC_PREFIX = 'uploads/books'
+CHUNK_SIZE = 64 * 1024
+
+_executor = None
+
+
+def _variant_format(preferred):
+    if preferred == 'webp' and Image is not None and not features.check('webp'):
+        return 'jpeg'
+    return preferred
+
+
+def _variant_extension(fmt):
+    return 'jpg' if fmt == 'jpeg' else fmt
+
+
+def variant_name(digest, size, fmt):
+    return f'{digest}_{size}.{_variant_extension(_variant_format(fmt))}'
+
+
+def _store_stream(stream, upload_folder, extension):
+    """Ghi stream ra đĩa theo từng khúc, trả về (sha256, tên file)"""
+    hasher = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+
+        digest = hasher.hexdigest()
+        filename = f'{digest}.{extension}'
+        final_path = os.path.join(upload_folder, filename)
+        if os.path.exists(final_path):
+            # Đã có ảnh cùng nội dung: bỏ bản vừa ghi
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, final_path)
+        return digest, filename
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def generate_variants(source_path, upload_folder, digest, sizes, fmt):
+    """Tạo các bản thu nhỏ còn thiếu cho một ảnh gốc"""
+    if Image is None:
+        return []
+
+    fmt = _variant_format(fmt)
+    created = []
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for size, box in sizes.items():
+            target = os.path.join(upload_folder, variant_name(digest, size, fmt))
+            if os.path.exists(target):
+                continue
+            variant = image.copy()
+            variant.thumbnail(box)
+            temp_path = target + '.tmp'
+            variant.save(temp_path, format=fmt.upper(), quality=80)
+            os.replace(temp_path, target)
+            created.append(target)
+    return created
+
+
+def _submit(func, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cover')
+    return _executor.submit(func, *args)
+
+
+def save_upload(file_storage, config):
+    """Lưu ảnh bìa tải lên, trả về đường dẫn tương đối trong static"""
+    # Lấy đuôi từ tên gốc: secure_filename bỏ hết ký tự không phải ASCII ('封面.jpg' -> 'jpg')
+    extension = os.path.splitext(file_storage.filename or '')[1][1:].lower()
+    if extension not in config['ALLOWED_EXTENSIONS']:
+        raise ValueError(f'Định dạng ảnh không được hỗ trợ: {file_storage.filename!r}')
+
+    upload_folder = config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    digest, filename = _store_stream(file_storage.stream, upload_folder, extension)
+
+    args = (os.path.join(upload_folder, filename), upload_folder, digest,
+            config['COVER_SIZES'], config['COVER_FORMAT'])
+    if config['COVER_ASYNC']:
+        _submit(generate_variants, *args)
+    else:
+        generate_variants(*args)
+
+    return f'{STATIC_PREFIX}/{filename}'
+
+
+def variant_path(image_url, size, config):
+    """Đường dẫn static của bản thu nhỏ nếu đã có, nếu chưa thì của ảnh gốc"""
+    if not image_url.startswith(STATIC_PREFIX + '/'):
+        return image_url
+
+    digest = image_url[len(STATIC_PREFIX) + 1:].rsplit('.', 1)[0]
+    name = variant_name(digest, size, config['COVER_FORMAT'])
+    if os.path.exists(os.path.join(config['UPLOAD_FOLDER'], name)):
+        return f'{STATIC_PREFIX}/{name}'
+    return image_url
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
+import re
+
+from flask import current_app, request
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, IntegerField, SelectField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, Length, NumberRange, Optional
+from flask_wtf.file import FileField, FileAllowed, FileRequired, FileSize
+from wtforms import Form, StringField, PasswordField, IntegerField, SelectField, SubmitField, TextAreaField
+from wtforms.validators import DataRequired, Length, NumberRange, Optional, ValidationError
+from werkzeug.datastructures import CombinedMultiDict, MultiDict
+from wtforms.widgets import HiddenInput
+
+from models import db, Book
 
 class LoginForm(FlaskForm):
     username = StringField('Tên đăng nhập', validators=[DataRequired(), Length(min=3, max=80)])
@@ -25,16 +32,41 @@ class BookForm(FlaskForm):
     ])
     description = TextAreaField('Mô tả sách', validators=[Optional(), Length(max=1000)])
     image = FileField('Ảnh bìa sách', validators=[
-        FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Chỉ chấp nhận file ảnh!')
+        FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Chỉ chấp nhận file ảnh!'),
+        FileSize(max_size=5 * 1024 * 1024, message='Ảnh tối đa 5MB!')
     ])
     image_url = StringField('Hoặc nhập URL ảnh', validators=[Optional(), Length(max=300)])
     quantity = IntegerField('Số lượng', validators=[DataRequired(), NumberRange(min=1)])
     submit = SubmitField('Lưu')
 
+class BookRowForm(Form):
+    """Kiểm tra một dòng khi nhập hàng loạt, dùng chung quy tắc với BookForm"""
+    title = BookForm.title
+    author = BookForm.author
+    category = BookForm.category
+    description = BookForm.description
+    image_url = BookForm.image_url
+    quantity = BookForm.quantity
+
+class ImportForm(FlaskForm):
+    file = FileField('File danh mục (CSV hoặc JSONL)', validators=[
+        FileRequired('Vui lòng chọn file!'),
+        FileAllowed(['csv', 'jsonl'], 'Chỉ chấp nhận file .csv hoặc .jsonl!')
+    ])
+    submit = SubmitField('Nhập dữ liệu')
+
 class BorrowForm(FlaskForm):
-    book_id = SelectField('Chọn sách', coerce=int, validators=[DataRequired()])
+    # Ô tìm chỉ để gõ gợi ý (/borrow/suggest); sách được chọn nằm trong book_id
+    query = StringField('Chọn sách', validators=[Optional(), Length(max=200)])
+    book_id = IntegerField(widget=HiddenInput(), validators=[DataRequired(message='Vui lòng chọn sách từ danh sách gợi ý')])
     submit = SubmitField('Mượn sách')
 
+    def validate_book_id(self, field):
+        # Chỉ nạp đúng sách được chọn; circulation.take_copy vẫn kiểm tra lại khi trừ số lượng
+        book = db.session.get(Book, field.data)
+        if book is None or book.available <= 0:
+            raise ValidationError('Sách này hiện không còn!')
+
 class RatingForm(FlaskForm):
     rating = SelectField('Đánh giá', 
                         choices=[(5, '⭐⭐⭐⭐⭐ Xuất sắc'),
@@ -45,4 +77,53 @@ class RatingForm(FlaskForm):
                         coerce=int,
                         validators=[DataRequired()])
     review = TextAreaField('Nhận xét', validators=[Optional(), Length(max=500)])
-    submit = SubmitField('Gửi đánh giá')
\ No newline at end of file
+    submit = SubmitField('Gửi đánh giá')
+class IdListField(TextAreaField):
+    """Danh sách mã số: chuỗi cách nhau bởi dấu phẩy/khoảng trắng, hoặc mảng JSON"""
+
+    def _value(self):
+        return ', '.join(str(value) for value in self.data) if self.data else ''
+
+    def process_formdata(self, valuelist):
+        self.data = []
+        for value in valuelist:
+            tokens = [value] if isinstance(value, int) else re.split(r'[\s,;]+', str(value).strip())
+            for token in tokens:
+                if token == '':
+                    continue
+                try:
+                    self.data.append(int(token))
+                except ValueError:
+                    raise ValueError(f'Mã không hợp lệ: {token}')
+
+    def pre_validate(self, form):
+        limit = current_app.config['BATCH_MAX_ITEMS']
+        if self.data and len(self.data) > limit:
+            raise ValidationError(f'Tối đa {limit} mã mỗi lần!')
+
+class BatchForm(FlaskForm):
+    """Form mượn/trả hàng loạt, nhận cả form post lẫn JSON.
+
+    Client JSON lấy CSRF token từ trường ẩn ``csrf_token`` của trang form (cùng
+    session) rồi gửi trong body hoặc qua header ``X-CSRFToken`` như CSRFProtect.
+    """
+
+    class Meta:
+        def wrap_formdata(self, form, formdata):
+            formdata = super().wrap_formdata(form, formdata)
+            if formdata is None or self.csrf_field_name in formdata:
+                return formdata
+            for header in current_app.config.get('WTF_CSRF_HEADERS', ['X-CSRFToken', 'X-CSRF-Token']):
+                token = request.headers.get(header)
+                if token:
+                    return CombinedMultiDict([formdata, MultiDict({self.csrf_field_name: token})])
+            return formdata
+
+class BatchBorrowForm(BatchForm):
+    book_ids = IdListField('Mã sách', validators=[DataRequired('Vui lòng nhập ít nhất một mã sách!')])
+    username = StringField('Người mượn (để trống nếu là bạn)', validators=[Optional(), Length(max=80)])
+    submit = SubmitField('Mượn tất cả')
+
+class BatchReturnForm(BatchForm):
+    record_ids = IdListField('Mã phiếu mượn', validators=[DataRequired('Vui lòng nhập ít nhất một mã phiếu!')])
+    submit = SubmitField('Trả tất cả')
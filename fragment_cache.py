@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Cache HTML đã render cho thẻ sách và khối thông tin sách.
+
+Khóa gồm id sách và phiên bản (``updated_at``), nên khi sách thay đổi thì khóa
+cũ không còn được dùng tới. Các route ghi gọi thêm ``invalidate_book`` để giải
+phóng ngay bản cũ trong bộ nhớ.
+
+Chỉ mục ngược sách -> khóa chỉ giữ các khóa còn có thể nằm trong backend: khóa
+bị LRU loại hoặc hết hạn được báo về qua ``on_evict``, và khóa của phiên bản cũ
+được bỏ ngay khi render phiên bản mới.
+
+Backend mặc định là LRU trong tiến trình, giới hạn số mục. Có thể thay bằng
+backend dùng chung (ví dụ Redis) qua ``SharedBackend``: mọi client có
+``get(key)``, ``set(key, value, ex=ttl)`` và ``delete(*keys)`` đều dùng được.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+
+class LRUBackend:
+    def __init__(self, maxsize=2000, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = None  # Hàm nhận danh sách khóa bị loại khỏi cache
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def _evicted(self, keys):
+        if keys and self.on_evict is not None:
+            self.on_evict(keys)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at >= time.monotonic():
+                self._items.move_to_end(key)
+                return value
+            del self._items[key]
+        self._evicted([key])
+        return None
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                evicted.append(self._items.popitem(last=False)[0])
+        self._evicted(evicted)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SharedBackend:
+    """Bọc một client kiểu Redis để nhiều worker dùng chung cache"""
+
+    def __init__(self, client, ttl=600, prefix='fragment:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+class FragmentCache:
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._keys_by_book = {}  # book_id -> {khóa: phiên bản}
+        if hasattr(backend, 'on_evict'):
+            backend.on_evict = self._forget
+
+    @staticmethod
+    def _stamp(book):
+        version = book.updated_at or book.created_at
+        return version.isoformat() if version else ''
+
+    @classmethod
+    def make_key(cls, name, book, salt=''):
+        return f'{name}:{book.id}:{cls._stamp(book)}:{salt}'
+
+    def _forget(self, keys):
+        """Bỏ các khóa backend đã loại khỏi chỉ mục ngược"""
+        with self._lock:
+            for key in keys:
+                book_id = int(key.split(':', 2)[1])
+                entries = self._keys_by_book.get(book_id)
+                if entries is None:
+                    continue
+                entries.pop(key, None)
+                if not entries:
+                    del self._keys_by_book[book_id]
+
+    def render(self, name, book, renderer, salt=''):
+        """Lấy fragment từ cache, nếu chưa có thì render và lưu lại"""
+        if not self.enabled:
+            return Markup(renderer())
+
+        key = self.make_key(name, book, salt)
+        html = self.backend.get(key)
+        if html is not None:
+            with self._lock:
+                self.hits += 1
+            return Markup(html)
+
+        html = str(renderer())
+        stamp = self._stamp(book)
+        with self._lock:
+            self.misses += 1
+            entries = self._keys_by_book.setdefault(book.id, {})
+            stale = [old for old, old_stamp in entries.items() if old_stamp != stamp]
+            for old in stale:
+                del entries[old]
+            entries[key] = stamp
+        self.backend.delete(stale)
+        self.backend.set(key, html)
+        return Markup(html)
+
+    def invalidate_book(self, book_id):
+        with self._lock:
+            keys = self._keys_by_book.pop(book_id, {})
+        self.backend.delete(list(keys))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'tracked_books': len(self._keys_by_book),
+            }
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Chính sách băm mật khẩu và giới hạn số lần băm đồng thời.
+
+Kiểm tra mật khẩu tốn hàng chục mili giây CPU. Để một đợt đăng nhập dồn dập
+không chiếm hết worker, chỉ tối đa ``PASSWORD_HASH_CONCURRENCY`` lần băm được
+chạy cùng lúc. Request không lấy được lượt được báo bận (503) ngay, hoặc sau
+tối đa ``PASSWORD_HASH_WAIT`` giây nếu cấu hình lớn hơn 0: worker đồng bộ
+đứng chờ lượt băm thì cũng không phục vụ được request nào khác.
+
+Semaphore được tạo bằng ``multiprocessing`` nên khi chạy
+``gunicorn --preload`` các worker fork ra dùng chung một giới hạn.
+"""
+import multiprocessing
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class PasswordGate:
+    def __init__(self, concurrency, wait):
+        self.wait = wait
+        self._semaphore = multiprocessing.BoundedSemaphore(concurrency)
+
+    def _acquire(self):
+        if self.wait > 0:
+            acquired = self._semaphore.acquire(timeout=self.wait)
+        else:
+            acquired = self._semaphore.acquire(block=False)
+        if not acquired:
+            raise HashingBusy()
+
+    def verify(self, user, password):
+        """Kiểm tra mật khẩu, ném HashingBusy nếu đã đủ số lượt băm đồng thời"""
+        self._acquire()
+        try:
+            return user.check_password(password)
+        finally:
+            self._semaphore.release()
+
+    def rehash(self, user, password, method):
+        """Băm lại với tham số mới (cũng đi qua giới hạn đồng thời)"""
+        self._acquire()
+        try:
+            user.set_password(password, method)
+        finally:
+            self._semaphore.release()
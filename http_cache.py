@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""GET có điều kiện (ETag / Last-Modified / 304) cho các trang danh mục.
+
+Số hiệu danh mục là thời điểm thay đổi gần nhất tính bằng micro giây, nên
+vừa dùng làm ETag vừa làm Last-Modified. Nó là giá trị lớn hơn trong hai nguồn:
+
+* ``catalog_revision`` trong ``LibraryStat``, chỉ được tăng bởi các thay đổi
+  mà ``updated_at`` của sách không phản ánh được: thêm/sửa/xóa/nhập sách và
+  tính lại điểm thịnh hành;
+* ``updated_at`` mới nhất của bảng sách, tự đổi theo mỗi lượt mượn, trả và
+  đánh giá (cột ``onupdate``), đọc qua chỉ mục ``ix_book_updated_at``.
+
+Nhờ vậy mượn/trả không phải ghi vào một dòng dùng chung, còn view chỉ cần một
+câu SELECT nhỏ để quyết định trả 304 trước khi chạy truy vấn ORM và render
+template.
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import g, request, session, make_response
+from flask_login import current_user
+
+from models import db, Book, LibraryStat
+
+REVISION = 'catalog_revision'
+
+
+def _now_us():
+    return int(time.time() * 1_000_000)
+
+
+def _to_us(value):
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+
+def bump_catalog_revision():
+    """Tăng số hiệu danh mục (gọi trong cùng transaction với thay đổi).
+
+    Không cần gọi khi chỉ đổi cột của sách (mượn, trả, đánh giá): ``updated_at``
+    của sách đã đổi theo.
+    """
+    now = _now_us()
+    result = db.session.execute(
+        db.update(LibraryStat).where(LibraryStat.name == REVISION).values(
+            value=db.case((LibraryStat.value + 1 > now, LibraryStat.value + 1), else_=now)
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.add(LibraryStat(name=REVISION, value=now))
+
+
+def catalog_revision():
+    stored = db.select(LibraryStat.value).where(LibraryStat.name == REVISION).scalar_subquery()
+    latest = db.select(db.func.max(Book.updated_at)).scalar_subquery()
+    value, updated_at = db.session.execute(db.select(stored, latest)).one()
+    value = value or 0
+    if updated_at is not None:
+        value = max(value, _to_us(updated_at))
+    return value
+
+
+def revision_datetime(revision):
+    return datetime.fromtimestamp(revision / 1_000_000, tz=timezone.utc)
+
+
+def _user_key():
+    if current_user.is_authenticated:
+        return f'{current_user.id}:{current_user.role}'
+    return 'anon'
+
+
+def _header_date(last_modified):
+    """Giá trị header Last-Modified: làm tròn lên giây, bỏ qua nếu giây đó chưa qua.
+
+    Header chỉ có độ chính xác giây. Làm tròn lên để client gửi lại một mốc
+    không sớm hơn thay đổi cuối; chờ hết giây để mọi thay đổi sau đó chắc chắn
+    mới hơn mốc này. Trong lúc chờ client vẫn có ETag.
+    """
+    if last_modified is None:
+        return None
+    header = last_modified.replace(microsecond=0)
+    if header < last_modified:
+        header += timedelta(seconds=1)
+    if header > datetime.now(timezone.utc):
+        return None
+    return header
+
+
+def revalidate(salt, *parts, last_modified=None):
+    """Trả về response 304 nếu bản của client còn mới, ngược lại trả về None.
+
+    Khi trả về None, ETag/Last-Modified/Cache-Control sẽ được gắn vào response
+    của view bởi ``apply_validators``. Trang có flash message không được gắn
+    validator vì nội dung của nó chỉ hiển thị một lần.
+    """
+    if session.get('_flashes'):
+        return None
+
+    raw = '|'.join(str(part) for part in (salt, request.endpoint, _user_key()) + parts)
+    etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    g.http_cache = (etag, _header_date(last_modified))
+
+    if request.if_none_match:
+        matched = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        # So với giá trị đầy đủ micro giây: thay đổi trong cùng giây với
+        # If-Modified-Since vẫn là mới hơn
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+
+    response = make_response('', 304)
+    return apply_validators(response)
+
+
+def apply_validators(response):
+    validators = g.pop('http_cache', None)
+    if validators is None or response.status_code not in (200, 304):
+        return response
+
+    etag, last_modified = validators
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.add('Cookie')
+    return response
+
+
+def init_app(app):
+    app.after_request(apply_validators)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Đo thời gian từng request: số câu SQL, thời gian DB, thời gian render template.
+
+Với mỗi request:
+
+* header ``Server-Timing`` (``db``, ``tpl``, ``app``) để xem ngay trong DevTools;
+* request chậm hơn ``SLOW_REQUEST_MS`` được ghi log kèm các câu SQL chậm nhất;
+* số liệu được cộng dồn vào histogram theo endpoint, xuất ở ``/metrics`` theo
+  định dạng văn bản của Prometheus.
+
+Số liệu ``/metrics`` là của tiến trình hiện tại; với nhiều worker gunicorn,
+Prometheus sẽ thấy từng worker riêng. Route này đóng theo mặc định: chỉ mở
+cho request có ``METRICS_TOKEN`` hoặc phiên đăng nhập admin.
+``METRICS_ALLOW_LOOPBACK`` (tắt sẵn) mở thêm cho request từ 127.0.0.1/::1, chỉ
+nên bật khi không có reverse proxy cùng máy (sau nginx mọi client đều đến từ
+loopback). ``INSTRUMENTATION_ENABLED = False`` tắt
+hẳn: không đăng ký listener hay route nào.
+"""
+import heapq
+import hmac
+import threading
+import time
+
+from flask import Response, abort, current_app, g, has_request_context, request, \
+    before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class RequestStats:
+    """Số liệu của một request, lưu ở ``g.request_stats``"""
+
+    __slots__ = ('started', 'queries', 'db_time', 'template_time', 'slowest', '_render_stack')
+
+    def __init__(self, keep_slowest):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.slowest = [] if keep_slowest else None
+        self._render_stack = []
+
+    def add_query(self, statement, elapsed, keep):
+        self.queries += 1
+        self.db_time += elapsed
+        if self.slowest is not None:
+            item = (elapsed, self.queries, statement)
+            if len(self.slowest) < keep:
+                heapq.heappush(self.slowest, item)
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def slowest_queries(self):
+        return sorted(self.slowest or [], reverse=True)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Histogram theo (endpoint, method), an toàn khi nhiều luồng cùng ghi"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, endpoint, method, stats, duration):
+        key = (endpoint, method)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'duration': Histogram(DURATION_BUCKETS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'db_seconds': 0.0,
+                    'template_seconds': 0.0,
+                }
+            series['duration'].observe(duration)
+            series['queries'].observe(stats.queries)
+            series['db_seconds'] += stats.db_time
+            series['template_seconds'] += stats.template_time
+
+    def render(self):
+        """Xuất toàn bộ số liệu theo định dạng văn bản của Prometheus"""
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            _render_histogram(lines, 'http_request_duration_seconds', 'Request duration',
+                              [(key, series['duration']) for key, series in items])
+            _render_histogram(lines, 'http_request_db_queries', 'SQL statements per request',
+                              [(key, series['queries']) for key, series in items])
+            for name, field, help_text in (
+                ('http_request_db_seconds_total', 'db_seconds', 'Time spent in SQL'),
+                ('http_request_template_seconds_total', 'template_seconds', 'Time spent rendering templates'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for key, series in items:
+                    lines.append(f'{name}{{{_labels(key)}}} {series[field]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(key):
+    endpoint, method = key
+    return f'endpoint="{endpoint}",method="{method}"'
+
+
+def _render_histogram(lines, name, help_text, series):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in series:
+        labels = _labels(key)
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.total}')
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = conn.info.get('query_started')
+    if stats is None or not started:
+        return
+    stats.add_query(statement, time.perf_counter() - started.pop(),
+                    current_app.config['SLOW_REQUEST_LOG_QUERIES'])
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats._render_stack.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is None or not stats._render_stack:
+        return
+    started = stats._render_stack.pop()
+    # Template lồng nhau (fragment trong trang) đã nằm trong thời gian của template ngoài
+    if not stats._render_stack:
+        stats.template_time += time.perf_counter() - started
+
+
+def init_app(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+
+    registry = MetricsRegistry()
+    app.extensions['instrumentation'] = registry
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats(keep_slowest=app.config['SLOW_REQUEST_MS'] > 0)
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+
+        duration = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        registry.observe(endpoint, request.method, stats, duration)
+
+        if app.config['SERVER_TIMING_HEADER']:
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template_time * 1000:.1f}, '
+                f'app;dur={duration * 1000:.1f}'
+            )
+
+        slow_ms = app.config['SLOW_REQUEST_MS']
+        if slow_ms and duration * 1000 >= slow_ms:
+            slowest = '\n'.join(f'  {elapsed * 1000:.1f}ms #{order}: {statement}'
+                                for elapsed, order, statement in stats.slowest_queries())
+            app.logger.warning('Slow request %s %s: %.1fms, %d queries (%.1fms), template %.1fms\n%s',
+                               request.method, request.full_path.rstrip('?'), duration * 1000,
+                               stats.queries, stats.db_time * 1000, stats.template_time * 1000, slowest)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        allowed = (
+            (token and hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                           f'Bearer {token}'.encode('utf-8')))
+            or (app.config['METRICS_ALLOW_LOOPBACK'] and request.remote_addr in LOOPBACK_ADDRESSES)
+            or (current_user.is_authenticated and current_user.is_admin())
+        )
+        if not allowed:
+            abort(403)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
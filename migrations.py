@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Khởi tạo và nâng cấp schema theo phiên bản (``flask init-db``).
+
+Mỗi migration có một số phiên bản tăng dần và chỉ chạy một lần; các phiên bản
+đã chạy được ghi trong bảng ``schema_migration``. Migration 1 tạo mọi bảng còn
+thiếu theo models hiện tại, nên trên database mới các migration sau không còn
+gì để làm. Trên database cũ (tạo bằng ``db.create_all()`` từ trước), các bước
+sau thêm cột và chỉ mục còn thiếu rồi tính lại dữ liệu cho chúng. Mọi bước đều
+kiểm tra trước khi tạo, nên chạy lại sau một lần bị ngắt giữa chừng vẫn an toàn.
+
+Trên PostgreSQL, ``migrate`` giữ một advisory lock trong suốt quá trình: nhiều
+tiến trình deploy chạy cùng lúc sẽ lần lượt chờ nhau thay vì cùng ALTER TABLE.
+
+Thêm migration mới: viết một hàm với ``@migration(<phiên bản kế tiếp>, '<mô tả>')``.
+"""
+from flask import current_app
+
+from models import db, Book, BookNeighbor, BorrowArchive, BorrowRecord, SchemaMigration
+
+# Khóa advisory của PostgreSQL dùng cho migrate (số bất kỳ, cố định)
+LOCK_KEY = 720_019
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+def _connection():
+    return db.session.connection()
+
+
+def _has_table(name):
+    return db.inspect(_connection()).has_table(name)
+
+
+def _has_column(table, column):
+    return column in {info['name'] for info in db.inspect(_connection()).get_columns(table)}
+
+
+def _add_column(column, default=None):
+    """ALTER TABLE ... ADD COLUMN nếu cột chưa có, trả về True nếu vừa thêm.
+
+    ``default`` là giá trị cho các dòng đã có (bắt buộc với cột NOT NULL).
+    """
+    table = column.table
+    if _has_column(table.name, column.name):
+        return False
+    dialect = _connection().dialect
+    quote = dialect.identifier_preparer.quote
+    ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=dialect)}'
+    if default is not None:
+        literal = db.literal(default, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f' DEFAULT {literal}'
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    db.session.execute(db.text(ddl))
+    return True
+
+
+def _create_index(name):
+    index = next(index for table in db.metadata.tables.values() for index in table.indexes if index.name == name)
+    index.create(bind=_connection(), checkfirst=True)
+
+
+@migration(1, 'Tạo các bảng còn thiếu')
+def _create_tables():
+    db.metadata.create_all(bind=_connection())
+
+
+@migration(2, 'book.updated_at và chỉ mục (title, author)')
+def _book_updated_at():
+    if _add_column(Book.__table__.c.updated_at):
+        db.session.execute(db.update(Book).values(updated_at=Book.created_at)
+                           .execution_options(synchronize_session=False))
+    _create_index('ix_book_title_author')
+
+
+@migration(3, 'borrow_record.overdue')
+def _borrow_overdue():
+    if _add_column(BorrowRecord.__table__.c.overdue, default=False):
+        db.session.execute(db.update(BorrowRecord).where(BorrowRecord.is_overdue()).values(overdue=True)
+                           .execution_options(synchronize_session=False))
+
+
+@migration(4, 'Điểm đánh giá, histogram số sao và điểm thịnh hành của sách')
+def _book_rankings():
+    import rankings
+
+    columns = Book.__table__.c
+    added = _add_column(columns.rating_score, default=Book.rating_score.default.arg)
+    for stars in range(1, 6):
+        added = _add_column(columns[f'stars_{stars}'], default=0) or added
+    added = _add_column(columns.trending_score, default=0) or added
+    _create_index('ix_book_rating_score')
+    _create_index('ix_book_trending_score')
+    if added:
+        rankings.rebuild_ratings()
+        rankings.refresh_trending(current_app.config['TRENDING_HALF_LIFE_DAYS'],
+                                  current_app.config['TRENDING_WINDOW_DAYS'])
+
+
+@migration(5, 'Bảng gợi ý book_neighbor')
+def _book_neighbor():
+    import recommendations
+
+    BookNeighbor.__table__.create(bind=_connection(), checkfirst=True)
+    # Migration 1 đã tạo bảng trống trên database cũ, nên xét dữ liệu thay vì sự tồn tại của bảng
+    if db.session.query(BookNeighbor.book_id).first() is None:
+        recommendations.rebuild(current_app.config['RECOMMENDATIONS_TOP_K'],
+                                current_app.config['RECOMMENDATIONS_MIN_CO_COUNT'])
+
+
+@migration(6, 'Chỉ mục tìm kiếm book_search')
+def _search_index():
+    import search
+
+    search.create_index()
+
+
+@migration(7, 'Bảng lưu trữ lịch sử mượn borrow_record_archive')
+def _borrow_archive():
+    BorrowArchive.__table__.create(bind=_connection(), checkfirst=True)
+
+
+@migration(8, 'Chỉ mục ghép cho các truy vấn thường dùng của sách và lượt mượn')
+def _composite_indexes():
+    for name in ('ix_book_created_at', 'ix_book_category', 'ix_borrow_record_user',
+                 'ix_borrow_record_status_due', 'ix_borrow_record_book', 'ix_borrow_record_borrow_date'):
+        _create_index(name)
+
+
+@migration(9, 'Chỉ mục book.updated_at cho số hiệu danh mục')
+def _book_updated_at_index():
+    _create_index('ix_book_updated_at')
+
+
+def _sqlite_has_autoincrement(table):
+    sql = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {'name': table.name}).scalar()
+    return 'AUTOINCREMENT' in (sql or '').upper()
+
+
+def _sqlite_rebuild(table):
+    """Tạo lại bảng theo models, giữ nguyên dữ liệu (SQLite không ALTER được khóa chính)"""
+    quote = _connection().dialect.identifier_preparer.quote
+    old_name = f'{table.name}_old'
+    db.session.execute(db.text(f'ALTER TABLE {quote(table.name)} RENAME TO {quote(old_name)}'))
+    for index in table.indexes:
+        db.session.execute(db.text(f'DROP INDEX IF EXISTS {quote(index.name)}'))
+    table.create(bind=_connection())
+    columns = ', '.join(quote(column.name) for column in table.c)
+    db.session.execute(db.text(f'INSERT INTO {quote(table.name)} ({columns}) SELECT {columns} FROM {quote(old_name)}'))
+    db.session.execute(db.text(f'DROP TABLE {quote(old_name)}'))
+
+
+@migration(10, 'borrow_record không dùng lại id đã chuyển sang bảng lưu trữ')
+def _borrow_record_autoincrement():
+    hot = BorrowRecord.__table__
+    last_id = max(db.session.query(db.func.max(BorrowRecord.id)).scalar() or 0,
+                  db.session.query(db.func.max(BorrowArchive.id)).scalar() or 0)
+    dialect = _connection().dialect.name
+    if dialect == 'sqlite':
+        if not _sqlite_has_autoincrement(hot):
+            _sqlite_rebuild(hot)
+        db.session.execute(db.text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': hot.name})
+        db.session.execute(db.text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                           {'name': hot.name, 'seq': last_id})
+    elif dialect == 'postgresql' and last_id:
+        # Sequence vốn không lùi, chỉ đảm bảo nó đã vượt qua mọi id trong bảng lưu trữ
+        db.session.execute(db.text("SELECT setval(seq, GREATEST(:seq, nextval(seq))) "
+                                   "FROM (SELECT pg_get_serial_sequence(:name, 'id') AS seq) AS serial"),
+                           {'name': hot.name, 'seq': last_id})
+
+
+def applied_versions():
+    if not _has_table(SchemaMigration.__tablename__):
+        return set()
+    return {row[0] for row in db.session.query(SchemaMigration.version)}
+
+
+def pending():
+    """[(phiên bản, mô tả)] của các migration chưa chạy"""
+    done = applied_versions()
+    return [(version, name) for version, name, _ in sorted(MIGRATIONS) if version not in done]
+
+
+def migrate():
+    """Chạy lần lượt các migration chưa chạy, mỗi migration một transaction.
+
+    Trả về [(phiên bản, mô tả)] của các migration vừa chạy.
+    """
+    db.session.commit()
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        # Khóa theo kết nối riêng: session có thể đổi kết nối sau mỗi commit
+        lock = db.engine.connect()
+        lock.execute(db.text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+    try:
+        SchemaMigration.__table__.create(bind=_connection(), checkfirst=True)
+        done = applied_versions()
+        applied = []
+        for version, name, func in sorted(MIGRATIONS):
+            if version in done:
+                continue
+            try:
+                func()
+                db.session.add(SchemaMigration(version=version, name=name))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            applied.append((version, name))
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+            lock.close()
@@ -1,10 +1,58 @@
 # -*- coding: utf-8 -*-
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_method
+from sqlalchemy.orm import query_expression
+from sqlalchemy.sql.expression import FunctionElement
 from datetime import datetime, timedelta
+from functools import lru_cache
 from werkzeug.security import generate_password_hash, check_password_hash
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Session tự chọn primary/bản sao theo request, xem replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+@lru_cache(maxsize=None)
+def hash_prefix(method):
+    """Phần đầu hash (trước '$') mà werkzeug ghi cho method, với tham số mặc định
+    đã được điền đủ ('scrypt' -> 'scrypt:32768:8:1'); chỉ băm một lần cho mỗi method"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def compute_late_fee(due_date, end_date, fee_per_day=5000):
+    """Phí phạt khi trả (hoặc tính đến) thời điểm end_date"""
+    if end_date > due_date:
+        return (end_date - due_date).days * fee_per_day
+    return 0
+
+# Điểm đánh giá kiểu Bayes: coi như mỗi sách đã có sẵn RATING_PRIOR_WEIGHT lượt
+# đánh giá RATING_PRIOR_MEAN sao, nên sách chỉ có 1-2 lượt 5 sao không vượt lên đầu
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 5
+
+def bayesian_rating(sum_ratings, total_ratings):
+    """Điểm xếp hạng; dùng được cả với số Python lẫn biểu thức cột SQL"""
+    return (RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT + sum_ratings) / (RATING_PRIOR_WEIGHT + total_ratings)
+
+class days_between(FunctionElement):
+    """Số ngày trọn vẹn từ start đến end, tính trong SQL (giống timedelta.days khi end > start)"""
+    type = db.Integer()
+    inherit_cache = True
+    
+    def __init__(self, start, end):
+        super().__init__(start, end)
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return 'CAST(EXTRACT(DAY FROM (%s - %s)) AS INTEGER)' % (
+        compiler.process(end, **kw), compiler.process(start, **kw))
+
+@compiles(days_between, 'sqlite')
+def _days_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return 'CAST(julianday(%s) - julianday(%s) AS INTEGER)' % (
+        compiler.process(end, **kw), compiler.process(start, **kw))
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,16 +60,32 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default='user')  # 'admin' hoặc 'user'
     
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password, method=None):
+        if method:
+            self.password_hash = generate_password_hash(password, method=method)
+        else:
+            self.password_hash = generate_password_hash(password)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def needs_rehash(self, method):
+        """Hash hiện tại có được tạo với thuật toán/tham số khác method không"""
+        return self.password_hash.split('$', 1)[0] != hash_prefix(method)
+    
     def is_admin(self):
         return self.role == 'admin'
 
 class Book(db.Model):
+    __table_args__ = (
+        db.Index('ix_book_title_author', 'title', 'author'),  # Tra trùng khi nhập hàng loạt
+        db.Index('ix_book_created_at', 'created_at', 'id'),  # Trang chủ, sắp xếp "mới nhất" (keyset)
+        db.Index('ix_book_category', 'category', 'created_at', 'id'),  # Lọc thể loại, danh sách thể loại
+        db.Index('ix_book_rating_score', 'rating_score', 'id'),  # Sắp xếp "đánh giá cao" (keyset)
+        db.Index('ix_book_trending_score', 'trending_score', 'id'),  # Sắp xếp "đang thịnh hành" (keyset)
+        db.Index('ix_book_updated_at', 'updated_at'),  # Số hiệu danh mục (MAX), xem http_cache.py
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=False)
@@ -31,10 +95,20 @@ class Book(db.Model):
     quantity = db.Column(db.Integer, default=1)
     available = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Thống kê rating
     total_ratings = db.Column(db.Integer, default=0)
     sum_ratings = db.Column(db.Integer, default=0)
+    rating_score = db.Column(db.Float, nullable=False, default=RATING_PRIOR_MEAN)  # bayesian_rating()
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)  # Số lượt đánh giá theo số sao
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Lượt mượn gần đây, giảm dần theo thời gian (xem rankings.refresh_trending)
+    trending_score = db.Column(db.Float, nullable=False, default=0)
     
     @property
     def average_rating(self):
@@ -43,10 +117,19 @@ class Book(db.Model):
             return round(self.sum_ratings / self.total_ratings, 1)
         return 0
     
+    @property
+    def star_histogram(self):
+        """[(số sao, số lượt, phần trăm)] từ 5 sao xuống 1 sao"""
+        total = self.total_ratings or 0
+        return [(stars, getattr(self, f'stars_{stars}'),
+                 round(getattr(self, f'stars_{stars}') * 100 / total) if total else 0)
+                for stars in range(5, 0, -1)]
+    
     def __repr__(self):
         return f'<Book {self.title}>'
 
-class BorrowRecord(db.Model):
+class BorrowFields:
+    """Các cột chung của BorrowRecord (bảng nóng) và BorrowArchive (bảng lưu trữ)"""
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -55,25 +138,51 @@ class BorrowRecord(db.Model):
     return_date = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='borrowing')  # 'borrowing' hoặc 'returned'
     late_fee = db.Column(db.Integer, default=0)
+    overdue = db.Column(db.Boolean, nullable=False, default=False)  # Đánh dấu bởi tiến trình quét quá hạn
     rating = db.Column(db.Integer)  # Đánh giá từ 1-5 sao
     review = db.Column(db.Text)  # Review của người dùng
+
+class BorrowRecord(BorrowFields, db.Model):
+    __table_args__ = (
+        db.Index('ix_borrow_record_user', 'user_id', 'borrow_date', 'id'),  # Lịch sử mượn của độc giả
+        db.Index('ix_borrow_record_status_due', 'status', 'due_date'),  # Đang mượn, quá hạn
+        db.Index('ix_borrow_record_book', 'book_id', 'return_date'),  # Review, lượt mượn của một sách
+        db.Index('ix_borrow_record_borrow_date', 'borrow_date', 'id'),  # Tất cả lượt mượn (keyset), thịnh hành
+        # Không dùng lại id của các lượt đã chuyển sang bảng lưu trữ (SQLite mặc định lấy MAX(id) + 1)
+        {'sqlite_autoincrement': True},
+    )
     
     book = db.relationship('Book', backref='borrow_records')
     user = db.relationship('User', backref='borrow_records')
     
-    def calculate_late_fee(self, fee_per_day=5000):
-        if self.status == 'returned' and self.return_date:
-            if self.return_date > self.due_date:
-                days_late = (self.return_date - self.due_date).days
-                self.late_fee = days_late * fee_per_day
-        elif self.status == 'borrowing':
-            if datetime.utcnow() > self.due_date:
-                days_late = (datetime.utcnow() - self.due_date).days
-                self.late_fee = days_late * fee_per_day
-        return self.late_fee
+    # Phí phạt hiện tại, được nạp từ SQL bằng with_expression(current_late_fee(...))
+    accrued_fee = query_expression()
+    
+    @hybrid_method
+    def current_late_fee(self, fee_per_day=5000, now=None):
+        """Phí phạt tính đến hiện tại (hoặc thời điểm now), không ghi vào late_fee"""
+        if self.status == 'borrowing':
+            return compute_late_fee(self.due_date, now or datetime.utcnow(), fee_per_day)
+        return self.late_fee or 0
+    
+    @current_late_fee.expression
+    def current_late_fee(cls, fee_per_day=5000, now=None):
+        now = db.literal(now or datetime.utcnow(), db.DateTime)
+        return db.case(
+            (db.and_(cls.status == 'borrowing', cls.due_date < now),
+             days_between(cls.due_date, now) * fee_per_day),
+            (cls.status == 'borrowing', 0),
+            else_=db.func.coalesce(cls.late_fee, 0)
+        )
     
-    def is_overdue(self):
-        return self.status == 'borrowing' and datetime.utcnow() > self.due_date
+    @hybrid_method
+    def is_overdue(self, now=None):
+        return self.status == 'borrowing' and (now or datetime.utcnow()) > self.due_date
+    
+    @is_overdue.expression
+    def is_overdue(cls, now=None):
+        return db.and_(cls.status == 'borrowing',
+                       cls.due_date < db.literal(now or datetime.utcnow(), db.DateTime))
     
     def days_until_due(self):
         """Số ngày còn lại đến hạn trả"""
@@ -83,4 +192,53 @@ class BorrowRecord(db.Model):
         return None
     
     def __repr__(self):
-        return f'<BorrowRecord {self.id}>'
\ No newline at end of file
+        return f'<BorrowRecord {self.id}>'
+
+# Lượt mượn đã trả từ lâu, được archive.py chuyển khỏi bảng nóng theo từng khúc.
+# Giữ nguyên id nên đọc chung với BorrowRecord qua archive.history() không bị trùng.
+class BorrowArchive(BorrowFields, db.Model):
+    __tablename__ = 'borrow_record_archive'
+    __table_args__ = (
+        db.Index('ix_borrow_archive_user', 'user_id', 'borrow_date', 'id'),  # Lịch sử mượn của độc giả
+        db.Index('ix_borrow_archive_book', 'book_id', 'return_date'),  # Review ở trang chi tiết sách
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    
+    def __repr__(self):
+        return f'<BorrowArchive {self.id}>'
+
+# Bảng thống kê được cập nhật cùng transaction với mượn/trả/thêm/xóa sách
+class BookStat(db.Model):
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    book = db.relationship('Book')
+
+class UserStat(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    user = db.relationship('User')
+
+class LibraryStat(db.Model):
+    """Bộ đếm toàn cục, mỗi dòng là một chỉ số (total_books, active_borrows, ...)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class BookNeighbor(db.Model):
+    """Sách "người mượn cũng mượn", giữ top-K theo độ tương đồng cho mỗi sách"""
+    __table_args__ = (
+        db.Index('ix_book_neighbor_rank', 'book_id', 'score'),
+    )
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('book.id'), primary_key=True)
+    co_count = db.Column(db.Integer, nullable=False, default=0)  # Số độc giả đã mượn cả hai sách
+    score = db.Column(db.Float, nullable=False, default=0)  # Cosine trên ma trận độc giả x sách
+
+class SchemaMigration(db.Model):
+    """Các phiên bản schema đã áp dụng (xem migrations.py)"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Phân trang theo con trỏ (keyset pagination).
+
+Thay vì OFFSET (phải quét lại toàn bộ các dòng phía trước), mỗi trang được
+lấy bằng điều kiện ``(sort_col, id) < (giá trị cuối trang trước)`` nên chi phí
+mỗi trang là cố định dù bảng lớn đến đâu.
+"""
+import base64
+import json
+from datetime import datetime
+
+from models import db
+
+
+class KeysetPage:
+    """Một trang kết quả cùng con trỏ để lấy trang tiếp theo"""
+
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(sort_value, id_value):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, id_value]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_column):
+    """Giải mã con trỏ theo kiểu của cột sắp xếp, trả về None nếu con trỏ không hợp lệ.
+
+    Ngày giờ được lưu dạng ISO, còn số (điểm đánh giá, điểm thịnh hành) giữ
+    nguyên số JSON.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, id_value = json.loads(base64.urlsafe_b64decode(padded))
+        python_type = sort_column.type.python_type
+        if python_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        elif isinstance(sort_value, (int, float)) and not isinstance(sort_value, bool):
+            sort_value = python_type(sort_value)
+        else:
+            return None
+        return sort_value, int(id_value)
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def get_per_page(value, default, maximum):
+    """Đọc số dòng mỗi trang từ query string, giới hạn trong [1, maximum]"""
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, maximum))
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=20):
+    """Lấy một trang theo thứ tự ``sort_column DESC, id_column DESC``.
+
+    Lấy dư một dòng để biết còn trang sau hay không, nên mỗi trang chỉ tốn
+    đúng một câu SELECT.
+    """
+    position = decode_cursor(cursor, sort_column)
+    if position is not None:
+        query = query.filter(
+            db.tuple_(sort_column, id_column) < db.tuple_(*position)
+        )
+
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return KeysetPage(rows, next_cursor, per_page)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Bảng xếp hạng lưu sẵn: "đánh giá cao" và "đang thịnh hành".
+
+* ``Book.rating_score`` và các cột ``stars_1..stars_5`` được ``rate_book``
+  cập nhật trong cùng câu UPDATE với tổng rating (xem
+  ``circulation.set_rating``). ``rebuild_ratings`` chỉ dùng để khởi tạo hoặc
+  sửa lại từ lịch sử mượn (cả bảng lưu trữ, xem ``archive.history``).
+* ``Book.trending_score`` là tổng các lượt mượn trong ``window_days`` ngày gần
+  nhất, mỗi lượt có trọng số giảm một nửa sau ``half_life_days`` ngày. Mỗi lượt
+  mượn mới cộng ngay 1 điểm; ``refresh_trending`` (chạy định kỳ qua cron) áp
+  dụng lại độ giảm theo thời gian.
+
+Cả hai cột đều có chỉ mục ``(score, id)`` nên ``/books`` sắp xếp và phân trang
+keyset theo chúng mà không phải quét bảng.
+"""
+from datetime import datetime, timedelta
+
+import archive
+from models import db, Book, BorrowRecord, bayesian_rating, days_between
+
+
+def _write_scores(scores, column, reset_value, batch_size):
+    """Ghi các giá trị trong scores, đưa các sách còn lại về reset_value.
+
+    Chỉ ghi những dòng có giá trị đổi và giữ nguyên ``updated_at``: điểm này
+    không hiển thị ở thẻ hay trang chi tiết sách, nên chạy cron không được làm
+    đổi ETag và khóa fragment của từng sách (danh sách sắp xếp theo điểm đã có
+    ``bump_catalog_revision`` của lệnh cron).
+    """
+    current = dict(db.session.query(Book.id, column).filter(column != reset_value))
+    rows = [{'book_id': book_id, 'value': reset_value} for book_id in current if book_id not in scores]
+    rows.extend({'book_id': book_id, 'value': score} for book_id, score in scores.items()
+                if current.get(book_id, reset_value) != score)
+    table = Book.__table__
+    stmt = db.update(table).where(table.c.id == db.bindparam('book_id')) \
+        .values({column.key: db.bindparam('value'), 'updated_at': table.c.updated_at})
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[start:start + batch_size])
+
+
+def refresh_trending(half_life_days=7, window_days=60, now=None, batch_size=1000):
+    """Tính lại trending_score từ các lượt mượn gần đây, trả về số sách có điểm"""
+    now = now or datetime.utcnow()
+    age = days_between(BorrowRecord.borrow_date, db.literal(now, db.DateTime))
+
+    # Gom theo (sách, số ngày tuổi) trong SQL, chỉ phần trọng số mũ tính bằng Python
+    scores = {}
+    for book_id, days, count in db.session.query(
+        BorrowRecord.book_id, age, db.func.count(BorrowRecord.id)
+    ).filter(BorrowRecord.borrow_date >= now - timedelta(days=window_days)).group_by(BorrowRecord.book_id, age):
+        weight = 0.5 ** (max(days or 0, 0) / half_life_days)
+        scores[book_id] = scores.get(book_id, 0.0) + count * weight
+
+    _write_scores({book_id: round(score, 4) for book_id, score in scores.items()},
+                  Book.trending_score, 0, batch_size)
+    return len(scores)
+
+
+def rebuild_ratings(batch_size=1000):
+    """Tính lại tổng rating, histogram số sao và rating_score từ toàn bộ lịch sử mượn"""
+    records = archive.history()
+    histograms = {}
+    for book_id, rating, count in db.session.query(
+        records.book_id, records.rating, db.func.count(records.id)
+    ).filter(records.rating.between(1, 5)).group_by(records.book_id, records.rating):
+        histograms.setdefault(book_id, [0] * 6)[rating] = count
+
+    # Chỉ ghi sách có số liệu đổi; các sách này đổi updated_at (điểm hiển thị ở thẻ sách)
+    fields = ['total_ratings', 'sum_ratings', 'rating_score'] + [f'stars_{stars}' for stars in range(1, 6)]
+    empty = dict.fromkeys(fields, 0)
+    empty['rating_score'] = bayesian_rating(0, 0)
+    wanted = {}
+    for book_id, counts in histograms.items():
+        total = sum(counts)
+        total_sum = sum(stars * counts[stars] for stars in range(1, 6))
+        row = {'total_ratings': total, 'sum_ratings': total_sum, 'rating_score': bayesian_rating(total_sum, total)}
+        row.update({f'stars_{stars}': counts[stars] for stars in range(1, 6)})
+        wanted[book_id] = row
+
+    rows = []
+    for book_id, *values in db.session.query(Book.id, *(getattr(Book, field) for field in fields)) \
+            .order_by(Book.id).yield_per(batch_size):
+        row = wanted.get(book_id, empty)
+        if list(values) != [row[field] for field in fields]:
+            rows.append(dict(row, id=book_id))
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.update(Book), rows[start:start + batch_size])
+    return len(wanted)
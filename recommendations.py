@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Gợi ý "Người mượn sách này cũng mượn" từ ma trận đồng xuất hiện.
+
+Mỗi độc giả là một hàng, mỗi sách là một cột của ma trận nhị phân (đã từng
+mượn hay chưa). Độ tương đồng giữa hai sách là cosine của hai cột::
+
+    score(a, b) = số độc giả mượn cả a và b / sqrt(số độc giả của a * số độc giả của b)
+
+``rebuild`` tính lại toàn bộ và chỉ giữ ``top_k`` sách gần nhất cho mỗi sách
+trong bảng ``BookNeighbor``. Có NumPy/SciPy thì nhân ma trận thưa theo từng khối
+sách (vài giây cho 1 triệu lượt mượn); không có thì dùng bản thuần Python, chỉ
+phù hợp với dữ liệu nhỏ.
+
+``record_borrow`` cập nhật tăng dần khi có lượt mượn mới: cộng đồng xuất hiện
+giữa sách vừa mượn và các sách độc giả đã mượn trước đó. Bước này dùng
+``BookStat.borrow_count`` thay cho số độc giả khác nhau và không cắt bớt danh
+sách, nên là xấp xỉ cho tới lần ``rebuild`` kế tiếp (chạy định kỳ qua cron).
+"""
+import heapq
+import math
+from collections import defaultdict
+
+import archive
+from models import db, Book, BookNeighbor, BookStat
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - NumPy/SciPy là tùy chọn
+    np = sparse = None
+
+
+def similar_books(book_id, limit=6):
+    """Các sách gần nhất, một truy vấn theo chỉ mục (book_id, score)"""
+    return Book.query.join(BookNeighbor, BookNeighbor.neighbor_id == Book.id) \
+        .filter(BookNeighbor.book_id == book_id) \
+        .order_by(BookNeighbor.score.desc()).limit(limit).all()
+
+
+def neighbors_version(book_id):
+    """Dấu phiên bản của khối gợi ý của một sách, dùng trong ETag trang chi tiết.
+
+    Đổi khi danh sách sách gần nhất đổi (``rebuild``, ``record_borrow`` cộng
+    co_count, ``remove_book`` xóa dòng) hoặc một sách trong đó đổi ``updated_at``
+    (mượn, trả, sửa). Một truy vấn theo khóa chính của BookNeighbor và Book.
+    """
+    return tuple(db.session.execute(
+        db.select(db.func.count(), db.func.sum(BookNeighbor.co_count), db.func.sum(BookNeighbor.score),
+                  db.func.max(Book.updated_at))
+        .select_from(BookNeighbor).join(Book, Book.id == BookNeighbor.neighbor_id)
+        .where(BookNeighbor.book_id == book_id)
+    ).one())
+
+
+def _reader_book_pairs(distinct=True):
+    records = archive.history()
+    stmt = db.select(records.user_id, records.book_id)
+    return db.session.execute(stmt.distinct() if distinct else stmt).all()
+
+
+def _neighbors_numpy(pairs, top_k, min_count, block_size=2048):
+    users = np.fromiter((pair[0] for pair in pairs), dtype=np.int64, count=len(pairs))
+    books = np.fromiter((pair[1] for pair in pairs), dtype=np.int64, count=len(pairs))
+    _, rows = np.unique(users, return_inverse=True)
+    book_ids, cols = np.unique(books, return_inverse=True)
+
+    # Cặp (độc giả, sách) lặp lại bị cộng dồn khi tạo ma trận, đưa về 0/1 sau đó
+    matrix = sparse.csr_matrix((np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+                               shape=(rows.max() + 1, len(book_ids)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    transposed = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+
+    # Nhân theo khối để ma trận đồng xuất hiện (sách x sách) không phải nằm trọn trong bộ nhớ
+    for start in range(0, len(book_ids), block_size):
+        block = (transposed[start:start + block_size] @ matrix).tocoo()
+        sources = block.row + start
+        keep = (block.col != sources) & (block.data >= min_count)
+        sources, targets, counts = sources[keep], block.col[keep], block.data[keep]
+        scores = counts / (norms[sources] * norms[targets])
+
+        # Sắp theo (sách nguồn, điểm giảm dần) rồi lấy top_k đầu mỗi nhóm; điểm nằm
+        # trong (0, 1] nên một khóa số thực thay được cho lexsort hai cột
+        order = np.argsort(sources - scores * 0.5, kind='stable')
+        sources, targets, counts, scores = sources[order], targets[order], counts[order], scores[order]
+        group_start = np.r_[0, np.flatnonzero(np.diff(sources)) + 1]
+        rank = np.arange(len(sources)) - np.repeat(group_start, np.diff(np.r_[group_start, len(sources)]))
+        best = rank < top_k
+
+        yield from zip(book_ids[sources[best]].tolist(), book_ids[targets[best]].tolist(),
+                       counts[best].astype(np.int64).tolist(), scores[best].tolist())
+
+
+def _neighbors_python(pairs, top_k, min_count):
+    books_by_reader = defaultdict(list)
+    for user_id, book_id in pairs:
+        books_by_reader[user_id].append(book_id)
+
+    readers = defaultdict(int)
+    co_counts = defaultdict(lambda: defaultdict(int))
+    for books in books_by_reader.values():
+        for book_id in books:
+            readers[book_id] += 1
+            for other_id in books:
+                if other_id != book_id:
+                    co_counts[book_id][other_id] += 1
+
+    for book_id, counts in co_counts.items():
+        scored = [(count / math.sqrt(readers[book_id] * readers[other_id]), other_id, count)
+                  for other_id, count in counts.items() if count >= min_count]
+        for score, other_id, count in heapq.nlargest(top_k, scored):
+            yield book_id, other_id, count, score
+
+
+def rebuild(top_k=10, min_count=1, batch_size=5000):
+    """Tính lại toàn bộ BookNeighbor từ lịch sử mượn, trả về số dòng đã ghi"""
+    # Bản NumPy tự bỏ cặp trùng, không cần DISTINCT (sắp xếp cả bảng) trong SQL
+    pairs = _reader_book_pairs(distinct=np is None)
+    compute = _neighbors_numpy if np is not None else _neighbors_python
+    insert = BookNeighbor.__table__.insert()
+
+    db.session.execute(db.delete(BookNeighbor))
+    written = 0
+    batch = []
+    for book_id, neighbor_id, count, score in (compute(pairs, top_k, min_count) if pairs else ()):
+        batch.append({'book_id': book_id, 'neighbor_id': neighbor_id, 'co_count': count, 'score': score})
+        if len(batch) >= batch_size:
+            db.session.execute(insert, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+        written += len(batch)
+    return written
+
+
+def _upsert_pairs(rows):
+    """Cộng 1 vào co_count của từng cặp, tạo dòng nếu chưa có.
+
+    ``score`` của mỗi dòng đầu vào là hệ số chuẩn hóa 1/sqrt(na * nb), nên điểm
+    mới là ``(co_count + 1) * hệ số``.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(BookNeighbor)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['book_id', 'neighbor_id'],
+            set_={'co_count': BookNeighbor.co_count + 1,
+                  'score': (BookNeighbor.co_count + 1) * stmt.excluded.score}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            db.update(BookNeighbor).where(
+                BookNeighbor.book_id == row['book_id'],
+                BookNeighbor.neighbor_id == row['neighbor_id']
+            ).values(co_count=BookNeighbor.co_count + 1,
+                     score=(BookNeighbor.co_count + 1) * row['score'])
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.session.execute(db.insert(BookNeighbor).values(**row))
+
+
+def record_borrow(user_id, book_ids, history_limit=50):
+    """Cập nhật đồng xuất hiện cho các sách user_id sắp mượn.
+
+    Gọi trước khi thêm BorrowRecord mới trong cùng transaction. Sách độc giả
+    đã từng mượn được bỏ qua vì cặp của nó đã được tính.
+    """
+    records = archive.history()
+    already = {row[0] for row in db.session.query(records.book_id).filter(
+        records.user_id == user_id, records.book_id.in_(book_ids)).distinct()}
+    fresh = set(book_ids) - already
+    if not fresh:
+        return 0
+
+    previous = [row[0] for row in db.session.query(records.book_id).filter(
+        records.user_id == user_id
+    ).group_by(records.book_id).order_by(db.func.max(records.borrow_date).desc())
+        .limit(history_limit)]
+
+    pairs = set()
+    for book_id in fresh:
+        for other_id in list(previous) + list(fresh):
+            if other_id != book_id:
+                pairs.add((book_id, other_id))
+                pairs.add((other_id, book_id))
+    if not pairs:
+        return 0
+
+    involved = {book_id for pair in pairs for book_id in pair}
+    readers = dict(db.session.query(BookStat.book_id, BookStat.borrow_count)
+                   .filter(BookStat.book_id.in_(involved)))
+    rows = [{'book_id': a, 'neighbor_id': b, 'co_count': 1,
+             'score': 1 / math.sqrt(max(readers.get(a, 0), 1) * max(readers.get(b, 0), 1))}
+            for a, b in sorted(pairs)]
+    _upsert_pairs(rows)
+    return len(rows)
+
+
+def remove_book(book_id):
+    db.session.execute(db.delete(BookNeighbor).where(
+        (BookNeighbor.book_id == book_id) | (BookNeighbor.neighbor_id == book_id)
+    ))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Đưa các trang chỉ đọc sang bản sao (read replica), phần còn lại dùng primary.
+
+Các bản sao khai báo qua ``DATABASE_REPLICA_URLS`` trở thành các bind
+``replica_<n>`` của Flask-SQLAlchemy. Với request GET/HEAD tới một endpoint
+trong ``DB_REPLICA_ENDPOINTS``, ``RoutingSession`` chọn ngẫu nhiên một bản sao
+dùng cho cả request, trừ khi:
+
+* request bắt đầu ghi (flush, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE):
+  câu đó và mọi câu sau trong request đi primary;
+* trình duyệt vừa ghi trong vòng ``DB_REPLICA_STICKY_SECONDS`` giây, để người
+  dùng luôn thấy ngay thay đổi của mình dù bản sao còn trễ (read-your-writes).
+  Thời điểm ghi cuối được lưu trong session cookie.
+
+Ngoài request (lệnh CLI, thread nền) luôn dùng primary. Không cấu hình bản sao
+thì không có hook nào được đăng ký.
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+WRITE_AT_KEY = '_db_write_at'
+REPLICA_PREFIX = 'replica_'
+
+
+def _is_write(db_session, clause):
+    if db_session._flushing or isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Session của Flask-SQLAlchemy, dùng bản sao đã chọn cho request chỉ đọc"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if _is_write(self, clause):
+                g.db_wrote = True
+                g.db_replica = None
+            else:
+                replica = g.get('db_replica')
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_names(app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                  if key and key.startswith(REPLICA_PREFIX))
+
+
+def init_app(app):
+    names = replica_names(app)
+    if not names:
+        return
+    endpoints = frozenset(app.config['DB_REPLICA_ENDPOINTS'])
+
+    @app.before_request
+    def choose_replica():
+        if request.method not in ('GET', 'HEAD') or request.endpoint not in endpoints:
+            return
+        written_at = session.get(WRITE_AT_KEY)
+        if written_at and time.time() - written_at < app.config['DB_REPLICA_STICKY_SECONDS']:
+            return
+        g.db_replica = current_app.extensions['sqlalchemy'].engines[random.choice(names)]
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('db_wrote'):
+            session[WRITE_AT_KEY] = time.time()
+        return response
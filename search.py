@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Tìm kiếm toàn văn cho danh mục sách.
+
+Chỉ mục được lưu ở bảng riêng ``book_search``:
+
+* SQLite: bảng ảo FTS5, xếp hạng bằng ``bm25``.
+* PostgreSQL: cột ``tsvector`` với chỉ mục GIN, xếp hạng bằng ``ts_rank``.
+
+Văn bản được chuẩn hóa (bỏ dấu tiếng Việt, ``đ`` -> ``d``, chữ thường) trước khi
+đưa vào chỉ mục và trước khi tìm, nên "dac nhan tam" khớp với "Đắc Nhân Tâm".
+Các dialect khác quay về ``LIKE`` như cũ.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import text
+
+from models import db, Book
+from pagination import KeysetPage
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Trọng số cho các cột: title, author, category, description
+_BM25_WEIGHTS = '10.0, 5.0, 2.0, 1.0'
+
+
+def normalize(value):
+    """Chuẩn hóa văn bản: bỏ dấu, đổi đ -> d, chữ thường"""
+    if not value:
+        return ''
+    value = value.replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFD', value)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.lower()
+
+
+def tokenize(value):
+    return _TOKEN_RE.findall(normalize(value))
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _document(book):
+    return {
+        'id': book.id,
+        'title': normalize(book.title),
+        'author': normalize(book.author),
+        'category': normalize(book.category),
+        'description': normalize(book.description),
+    }
+
+
+def create_index():
+    """Tạo bảng chỉ mục nếu chưa có"""
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS book_search "
+            "USING fts5(title, author, category, description, tokenize='unicode61')"
+        ))
+    elif dialect == 'postgresql':
+        db.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS book_search ("
+            "book_id INTEGER PRIMARY KEY REFERENCES book(id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_book_search_document "
+            "ON book_search USING GIN (document)"
+        ))
+
+
+def index_book(book):
+    """Thêm hoặc cập nhật một sách trong chỉ mục (cùng transaction với thay đổi sách)"""
+    index_books([book])
+
+
+def index_books(books):
+    """Như index_book nhưng cho nhiều sách, mỗi câu lệnh chạy một lần (executemany)"""
+    documents = [_document(book) for book in books]
+    if not documents:
+        return
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(text("DELETE FROM book_search WHERE rowid = :id"),
+                           [{'id': doc['id']} for doc in documents])
+        db.session.execute(text(
+            "INSERT INTO book_search (rowid, title, author, category, description) "
+            "VALUES (:id, :title, :author, :category, :description)"
+        ), documents)
+    elif dialect == 'postgresql':
+        db.session.execute(text(
+            "INSERT INTO book_search (book_id, document) VALUES (:id, "
+            "setweight(to_tsvector('simple', :title), 'A') || "
+            "setweight(to_tsvector('simple', :author), 'B') || "
+            "setweight(to_tsvector('simple', :category), 'C') || "
+            "setweight(to_tsvector('simple', :description), 'D')) "
+            "ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document"
+        ), documents)
+
+
+def remove_book(book_id):
+    """Xóa một sách khỏi chỉ mục"""
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        db.session.execute(text("DELETE FROM book_search WHERE rowid = :id"), {'id': book_id})
+    elif dialect == 'postgresql':
+        db.session.execute(text("DELETE FROM book_search WHERE book_id = :id"), {'id': book_id})
+
+
+def rebuild_index(batch_size=1000):
+    """Xây lại toàn bộ chỉ mục từ bảng Book, trả về số sách đã đánh chỉ mục"""
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql'):
+        return 0
+
+    create_index()
+    db.session.execute(text("DELETE FROM book_search"))
+    count = 0
+    batch = []
+    for book in Book.query.order_by(Book.id).yield_per(batch_size):
+        batch.append(book)
+        if len(batch) >= batch_size:
+            index_books(batch)
+            count += len(batch)
+            batch = []
+    index_books(batch)
+    return count + len(batch)
+
+
+def index_is_empty():
+    if _dialect() not in ('sqlite', 'postgresql'):
+        return False
+    return db.session.execute(text("SELECT 1 FROM book_search LIMIT 1")).first() is None
+
+
+def _parse_offset(cursor):
+    try:
+        return max(0, int(cursor))
+    except (TypeError, ValueError):
+        return 0
+
+
+def search_books(query_text, category=None, cursor=None, per_page=20):
+    """Tìm sách theo độ liên quan, trả về KeysetPage.
+
+    Con trỏ ở đây là vị trí trong danh sách đã xếp hạng; chi phí mỗi trang do
+    chỉ mục quyết định chứ không phải kích thước bảng Book.
+    """
+    tokens = tokenize(query_text)
+    dialect = _dialect()
+    offset = _parse_offset(cursor)
+
+    if not tokens:
+        return KeysetPage([], None, per_page)
+
+    params = {'limit': per_page + 1, 'offset': offset}
+    category_filter = ''
+    if category:
+        category_filter = 'AND b.category = :category '
+        params['category'] = category
+
+    if dialect == 'sqlite':
+        params['q'] = ' '.join('"%s"*' % token for token in tokens)
+        sql = (
+            "SELECT b.id FROM book_search s JOIN book b ON b.id = s.rowid "
+            "WHERE book_search MATCH :q " + category_filter +
+            "ORDER BY bm25(book_search, " + _BM25_WEIGHTS + "), b.id "
+            "LIMIT :limit OFFSET :offset"
+        )
+        ids = [row[0] for row in db.session.execute(text(sql), params)]
+    elif dialect == 'postgresql':
+        params['q'] = ' & '.join('%s:*' % token for token in tokens)
+        sql = (
+            "SELECT b.id FROM book_search s JOIN book b ON b.id = s.book_id, "
+            "to_tsquery('simple', :q) query "
+            "WHERE s.document @@ query " + category_filter +
+            "ORDER BY ts_rank(s.document, query) DESC, b.id "
+            "LIMIT :limit OFFSET :offset"
+        )
+        ids = [row[0] for row in db.session.execute(text(sql), params)]
+    else:
+        query = Book.query.filter(Book.title.contains(query_text) | Book.author.contains(query_text))
+        if category:
+            query = query.filter_by(category=category)
+        ids = [row.id for row in query.with_entities(Book.id).order_by(Book.id)
+               .limit(per_page + 1).offset(offset)]
+
+    next_cursor = None
+    if len(ids) > per_page:
+        ids = ids[:per_page]
+        next_cursor = str(offset + per_page)
+
+    books_by_id = {book.id: book for book in Book.query.filter(Book.id.in_(ids))} if ids else {}
+    books = [books_by_id[book_id] for book_id in ids if book_id in books_by_id]
+    return KeysetPage(books, next_cursor, per_page)
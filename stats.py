@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Thống kê cho dashboard, được duy trì tăng dần.
+
+Các bộ đếm (``LibraryStat``, ``BookStat``, ``UserStat``) được cập nhật bằng
+UPDATE nguyên tử trong cùng transaction với thao tác mượn/trả/thêm/sửa/xóa,
+nên dashboard chỉ cần đọc vài dòng thay vì SUM/COUNT/GROUP BY trên toàn bảng.
+Kết quả đọc được giữ thêm trong cache nội bộ tiến trình với TTL ngắn, mỗi
+ứng dụng một cache (``app.extensions['dashboard_stats']``).
+
+Mỗi bộ đếm toàn cục được chia thành ``SHARDS`` dòng (``active_borrows``,
+``active_borrows#1``, ...). Mỗi transaction cộng mọi bộ đếm của nó vào một
+phân mảnh chọn ngẫu nhiên bằng một câu upsert, nên các lượt mượn/trả đồng thời
+hiếm khi phải chờ khóa của cùng một dòng; khi đọc thì cộng các phân mảnh lại.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+import archive
+from models import db, User, Book, BorrowRecord, BookStat, UserStat, LibraryStat
+
+COUNTERS = ('total_books', 'total_quantity', 'total_available', 'active_borrows', 'total_borrows')
+SHARDS = 8
+
+PopularBook = namedtuple('PopularBook', 'id title author')
+ActiveReader = namedtuple('ActiveReader', 'id username')
+
+
+class TTLCache:
+    """Cache một giá trị trong bộ nhớ với thời gian sống ngắn"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0.0
+
+    def get(self, ttl, loader):
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not None and now < self._expires_at:
+                return self._value
+        value = loader()
+        with self._lock:
+            self._value = value
+            self._expires_at = now + ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._expires_at = 0.0
+
+
+def _cache():
+    return current_app.extensions['dashboard_stats']
+
+
+def _execute(stmt):
+    return db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def _shard_name(name, shard):
+    return name if shard == 0 else f'{name}#{shard}'
+
+
+def _is_counter_row():
+    return db.or_(LibraryStat.name.in_(COUNTERS),
+                  *(LibraryStat.name.startswith(f'{name}#', autoescape=True) for name in COUNTERS))
+
+
+def _bump(**deltas):
+    """Cộng dồn các bộ đếm toàn cục vào một phân mảnh ngẫu nhiên"""
+    shard = random.randrange(SHARDS)
+    _add_many(LibraryStat, LibraryStat.name, LibraryStat.value,
+              {_shard_name(name, shard): delta for name, delta in deltas.items() if delta})
+    _cache().invalidate()
+
+
+def _increment(model, key_column, key, delta=1):
+    """Tăng borrow_count của một dòng BookStat/UserStat, tạo dòng nếu chưa có"""
+    _increment_many(model, key_column, {key: delta})
+
+
+def _increment_many(model, key_column, deltas):
+    """Như _increment cho nhiều khóa ``{key: delta}``"""
+    _add_many(model, key_column, model.borrow_count, deltas)
+
+
+def _add_many(model, key_column, value_column, deltas):
+    """Cộng ``{key: delta}`` vào value_column, tạo dòng nếu chưa có (một câu upsert executemany)"""
+    if not deltas:
+        return
+    rows = [{key_column.key: key, value_column.key: delta} for key, delta in deltas.items()]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key_column.key],
+            set_={value_column.key: value_column + stmt.excluded[value_column.key]}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for key, delta in deltas.items():
+        updated = _execute(db.update(model).where(key_column == key)
+                           .values({value_column.key: value_column + delta})).rowcount
+        if not updated:
+            db.session.execute(db.insert(model).values({key_column.key: key, value_column.key: delta}))
+
+
+def book_added(quantity, available, count=1):
+    _bump(total_books=count, total_quantity=quantity, total_available=available)
+
+
+def book_updated(quantity_delta, available_delta):
+    _bump(total_quantity=quantity_delta, total_available=available_delta)
+
+
+def book_deleted(book_id, quantity, available):
+    _execute(db.delete(BookStat).where(BookStat.book_id == book_id))
+    _bump(total_books=-1, total_quantity=-quantity, total_available=-available)
+
+
+def borrowed(book_id, user_id, count=1):
+    _increment(BookStat, BookStat.book_id, book_id, count)
+    _increment(UserStat, UserStat.user_id, user_id, count)
+    _bump(total_available=-count, active_borrows=count, total_borrows=count)
+
+
+def borrowed_many(book_ids, user_id):
+    """Ghi nhận một lượt mượn cho mỗi sách trong book_ids (cùng một người mượn)"""
+    if not book_ids:
+        return
+    book_counts = {}
+    for book_id in book_ids:
+        book_counts[book_id] = book_counts.get(book_id, 0) + 1
+    count = len(book_ids)
+    _increment_many(BookStat, BookStat.book_id, book_counts)
+    _increment(UserStat, UserStat.user_id, user_id, count)
+    _bump(total_available=-count, active_borrows=count, total_borrows=count)
+
+
+def returned(count=1):
+    _bump(total_available=count, active_borrows=-count)
+
+
+def compute_counters():
+    """Tính lại các bộ đếm toàn cục từ dữ liệu gốc"""
+    total_books, total_quantity, total_available = db.session.query(
+        db.func.count(Book.id),
+        db.func.coalesce(db.func.sum(Book.quantity), 0),
+        db.func.coalesce(db.func.sum(Book.available), 0)
+    ).one()
+    # Lượt đang mượn chỉ nằm ở bảng nóng; tổng số lượt tính cả bảng lưu trữ
+    records = archive.history()
+    total_borrows = db.session.query(db.func.count(records.id)).scalar()
+    active_borrows = db.session.query(db.func.count(BorrowRecord.id)) \
+        .filter(BorrowRecord.status == 'borrowing').scalar()
+    return {
+        'total_books': total_books,
+        'total_quantity': total_quantity,
+        'total_available': total_available,
+        'active_borrows': active_borrows,
+        'total_borrows': total_borrows,
+    }
+
+
+def read_counters():
+    """Giá trị các bộ đếm toàn cục (tổng của các phân mảnh)"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    for name, value in db.session.query(LibraryStat.name, LibraryStat.value).filter(_is_counter_row()):
+        counters[name.split('#', 1)[0]] += value
+    return counters
+
+
+def is_empty():
+    return db.session.query(LibraryStat.name).filter(LibraryStat.name.in_(COUNTERS)).first() is None
+
+
+def rebuild(dry_run=False):
+    """Tính lại toàn bộ thống kê từ đầu.
+
+    Trả về danh sách chênh lệch ``(tên, giá trị đang lưu, giá trị đúng)``.
+    Với ``dry_run=True`` chỉ kiểm tra, không ghi gì.
+    """
+    fresh = compute_counters()
+    stored = read_counters()
+    drift = [(name, stored[name], fresh[name]) for name in COUNTERS if stored[name] != fresh[name]]
+
+    records = archive.history()
+    book_counts = dict(db.session.query(records.book_id, db.func.count(records.id))
+                       .join(Book, Book.id == records.book_id)
+                       .group_by(records.book_id))
+    user_counts = dict(db.session.query(records.user_id, db.func.count(records.id))
+                       .group_by(records.user_id))
+    stored_books = dict(db.session.query(BookStat.book_id, BookStat.borrow_count))
+    stored_users = dict(db.session.query(UserStat.user_id, UserStat.borrow_count))
+    if stored_books != book_counts:
+        drift.append(('book_stat', len(stored_books), len(book_counts)))
+    if stored_users != user_counts:
+        drift.append(('user_stat', len(stored_users), len(user_counts)))
+
+    if dry_run:
+        return drift
+
+    db.session.execute(db.delete(LibraryStat).where(_is_counter_row()))
+    db.session.execute(db.delete(BookStat))
+    db.session.execute(db.delete(UserStat))
+    db.session.add_all([LibraryStat(name=name, value=fresh[name]) for name in COUNTERS])
+    db.session.add_all([BookStat(book_id=k, borrow_count=v) for k, v in book_counts.items()])
+    db.session.add_all([UserStat(user_id=k, borrow_count=v) for k, v in user_counts.items()])
+    _cache().invalidate()
+    return drift
+
+
+def _load_dashboard(limit):
+    counters = read_counters()
+    popular_books = [
+        (PopularBook(book_id, title, author), count)
+        for book_id, title, author, count in db.session.query(
+            Book.id, Book.title, Book.author, BookStat.borrow_count
+        ).join(Book, Book.id == BookStat.book_id).filter(BookStat.borrow_count > 0)
+        .order_by(BookStat.borrow_count.desc()).limit(limit)
+    ]
+    active_readers = [
+        (ActiveReader(user_id, username), count)
+        for user_id, username, count in db.session.query(
+            User.id, User.username, UserStat.borrow_count
+        ).join(User, User.id == UserStat.user_id).filter(User.role == 'user', UserStat.borrow_count > 0)
+        .order_by(UserStat.borrow_count.desc()).limit(limit)
+    ]
+    return {
+        'total_books': counters['total_books'],
+        'total_quantity': counters['total_quantity'],
+        'total_borrowed': counters['total_quantity'] - counters['total_available'],
+        'active_borrows': counters['active_borrows'],
+        'total_borrows': counters['total_borrows'],
+        'popular_books': popular_books,
+        'active_readers': active_readers,
+    }
+
+
+def dashboard_stats(ttl=30, limit=5):
+    """Số liệu dashboard, đọc từ cache nếu còn hạn"""
+    return _cache().get(ttl, lambda: _load_dashboard(limit))
+
+
+def invalidate():
+    _cache().invalidate()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Quét sách quá hạn định kỳ.
+
+Duyệt các bản ghi ``status='borrowing'`` đã quá hạn theo từng khúc ``id``
+(keyset), mỗi khúc là một câu UPDATE theo tập hợp và một transaction ngắn,
+nên không giữ khóa lâu và không nạp cả bảng vào bộ nhớ. Ghi lại ``late_fee``
+và cờ ``overdue`` để phí phạt không chỉ tồn tại tạm thời trên trang web.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from models import db, BorrowRecord
+
+
+def sweep_overdue(fee_per_day, chunk_size=1000, now=None):
+    """Cập nhật phí phạt cho mọi bản ghi quá hạn.
+
+    Trả về ``(số dòng đã xử lý, số giây đã chạy)``.
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    processed = 0
+    last_id = 0
+
+    while True:
+        # Lấy ranh giới của khúc tiếp theo (chỉ đọc cột id)
+        ids = [row[0] for row in db.session.query(BorrowRecord.id).filter(
+            BorrowRecord.id > last_id,
+            BorrowRecord.is_overdue(now)
+        ).order_by(BorrowRecord.id).limit(chunk_size)]
+        if not ids:
+            break
+
+        result = db.session.execute(
+            db.update(BorrowRecord).where(
+                BorrowRecord.id > last_id,
+                BorrowRecord.id <= ids[-1],
+                BorrowRecord.is_overdue(now)
+            ).values(
+                late_fee=BorrowRecord.current_late_fee(fee_per_day, now),
+                overdue=True
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        processed += result.rowcount
+        last_id = ids[-1]
+
+    return processed, time.perf_counter() - started
+
+
+def start_scheduler(app, interval):
+    """Chạy sweep_overdue mỗi ``interval`` giây trong một thread nền.
+
+    Mỗi tiến trình gọi hàm này sẽ có một thread riêng; khi chạy nhiều worker
+    nên dùng lệnh ``flask sweep-overdue`` qua cron thay vì bật ở mọi worker.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    processed, elapsed = sweep_overdue(app.config['LATE_FEE_PER_DAY'],
+                                                       app.config['OVERDUE_SWEEP_CHUNK'])
+                    app.logger.info('Quét quá hạn: %d dòng trong %.2fs', processed, elapsed)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Quét quá hạn thất bại')
+
+    thread = threading.Thread(target=run, name='overdue-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app):
+    """Bật thread quét ở request đầu tiên của mỗi tiến trình.
+
+    Thread tạo lúc import sẽ không sang được các worker khi gunicorn nạp ứng
+    dụng trước rồi fork (``--preload``), nên chờ tới khi worker nhận request.
+    """
+    interval = app.config['OVERDUE_SWEEP_INTERVAL']
+    if interval <= 0:
+        return
+    started = set()
+    lock = threading.Lock()
+
+    @app.before_request
+    def ensure_overdue_sweeper():
+        pid = os.getpid()
+        if pid in started:
+            return
+        with lock:
+            if pid not in started:
+                start_scheduler(app, interval)
+                started.add(pid)
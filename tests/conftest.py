@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Fixture dùng chung cho bộ test.
+
+Mỗi ứng dụng được tạo bằng ``create_app`` trên một file SQLite tạm và khởi tạo
+bằng ``init_database`` như ``flask init-db`` (tài khoản admin/admin123,
+user/user123 và 5 sách mẫu). ``seeded_app`` thêm dữ liệu giả lập quy mô 1k của
+``benchmarks.datagen`` (độc giả ``reader<N>``/``bench123``) và được dùng chung
+trong một module, nên test dùng nó không được ghi dữ liệu.
+
+Chạy: ``python -m pytest -q``
+"""
+import os
+
+# Ứng dụng mặc định trong app.py được tạo ngay khi import: không để nó trỏ vào library.db
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import pytest
+from sqlalchemy import event
+
+from config import Config
+
+
+def make_config(path, **overrides):
+    attrs = {
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path / "library.db"}',
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'SQLALCHEMY_BINDS': {},
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',  # Băm nhanh cho test
+        'UPLOAD_FOLDER': str(path / 'uploads'),
+        'COVER_CACHE_FOLDER': str(path / 'covers'),
+        'SLOW_REQUEST_MS': 0,
+    }
+    attrs.update(overrides)
+    return type('TestConfig', (Config,), attrs)
+
+
+def build_app(path, **overrides):
+    from app import create_app, init_database
+
+    app = create_app(make_config(path, **overrides))
+    with app.app_context():
+        init_database()
+    return app
+
+
+def dispose(app):
+    from models import db
+
+    with app.app_context():
+        db.session.remove()
+        for engine in app.extensions['sqlalchemy'].engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = build_app(tmp_path)
+    yield app
+    dispose(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='module')
+def seeded_app(tmp_path_factory):
+    from benchmarks.datagen import populate
+
+    app = build_app(tmp_path_factory.mktemp('seeded'))
+    with app.app_context():
+        populate('1k', seed=7)
+    yield app
+    dispose(app)
+
+
+def login(client, username, password):
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, f'Đăng nhập {username} thất bại'
+    return client
+
+
+class QueryCounter:
+    """Đếm số câu SQL gửi tới engine trong khối ``with``"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def count_queries(app):
+    from models import db
+
+    with app.app_context():
+        return QueryCounter(db.engine)
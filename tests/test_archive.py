@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Bảng lưu trữ lịch sử mượn: id không bị dùng lại sau khi chuyển lượt mượn đi."""
+from datetime import datetime, timedelta
+
+from tests.conftest import login
+
+
+def _borrow_and_return(app, client, book_ids):
+    from models import BorrowRecord
+
+    for book_id in book_ids:
+        assert client.post('/borrow', data={'book_id': str(book_id)}).status_code == 302
+    with app.app_context():
+        record_ids = [row.id for row in BorrowRecord.query.filter(BorrowRecord.status == 'borrowing',
+                                                                   BorrowRecord.book_id.in_(book_ids))]
+    for record_id in record_ids:
+        client.get(f'/return/{record_id}')
+
+
+def _archive_everything(app):
+    import archive
+
+    with app.app_context():
+        moved, _ = archive.archive_returned(0, now=datetime.utcnow() + timedelta(days=1))
+    return moved
+
+
+def _history_ids(app):
+    import archive
+    from models import db
+
+    with app.app_context():
+        records = archive.history()
+        return [row.id for row in db.session.query(records.id)]
+
+
+def test_new_borrows_do_not_reuse_archived_ids(app):
+    client = login(app.test_client(), 'user', 'user123')
+    _borrow_and_return(app, client, (1, 2, 3))
+    assert _archive_everything(app) == 3
+
+    _borrow_and_return(app, client, (1, 2))
+    client.post('/borrow', data={'book_id': '4'})
+
+    ids = _history_ids(app)
+    assert len(ids) == 6
+    assert len(set(ids)) == len(ids)
+
+
+def test_migration_rebuilds_a_table_without_autoincrement(app):
+    import migrations
+    from models import db, BorrowRecord, SchemaMigration
+
+    client = login(app.test_client(), 'user', 'user123')
+    client.post('/borrow', data={'book_id': '4'})  # Lượt 1 còn ở bảng nóng
+    _borrow_and_return(app, client, (1, 2, 3))
+    assert _archive_everything(app) == 3
+
+    # Đưa bảng nóng về schema cũ (không AUTOINCREMENT) như database tạo trước migration 10
+    with app.app_context():
+        sql = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE name = 'borrow_record'")).scalar()
+        rows = [dict(row) for row in db.session.execute(db.select(BorrowRecord.__table__)).mappings()]
+        db.session.execute(db.text('DROP TABLE borrow_record'))
+        db.session.execute(db.text(sql.replace('AUTOINCREMENT', '')))
+        db.session.execute(BorrowRecord.__table__.insert(), rows)
+        db.session.execute(db.delete(SchemaMigration).where(SchemaMigration.version == 10))
+        db.session.commit()
+
+        assert [version for version, _ in migrations.migrate()] == [10]
+        assert db.session.query(BorrowRecord).count() == len(rows) == 1
+
+    client.post('/borrow', data={'book_id': '5'})
+    ids = _history_ids(app)
+    assert len(ids) == 5
+    assert len(set(ids)) == len(ids)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Mượn/trả hàng loạt: kết quả từng mã, giới hạn lô, mượn hộ, số câu SQL và CSRF cho JSON."""
+import re
+
+import pytest
+
+from tests.conftest import build_app, count_queries, dispose, login
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def _messages(response):
+    assert response.status_code == 200
+    return [(row['id'], row['ok'], row['message']) for row in response.get_json()['results']]
+
+
+def _available(app, book_id):
+    from models import db, Book
+
+    with app.app_context():
+        return db.session.get(Book, book_id).available
+
+
+def _records(app, username):
+    from models import BorrowRecord, User
+
+    with app.app_context():
+        return [record.id for record in BorrowRecord.query.join(User).filter(User.username == username)
+                .order_by(BorrowRecord.id)]
+
+
+def _user(app, username):
+    from models import User
+
+    with app.app_context():
+        return User.query.filter_by(username=username).one().id
+
+
+def test_borrow_batch_reports_every_id(app):
+    from models import db, Book
+
+    with app.app_context():
+        db.session.get(Book, 2).available = 0
+        db.session.commit()
+    client = login(app.test_client(), 'user', 'user123')
+
+    response = client.post('/borrow/batch', json={'book_ids': [1, 1, 99, 2, 3]})
+
+    results = _messages(response)
+    assert [(book_id, ok) for book_id, ok, _ in results] == [(1, True), (1, False), (99, False), (2, False), (3, True)]
+    assert [message for _, _, message in results[1:4]] == ['Trùng trong danh sách', 'Không tìm thấy sách',
+                                                           'Sách này hiện không còn!']
+    assert response.get_json()['succeeded'] == 2
+    assert (_available(app, 1), _available(app, 2), _available(app, 3)) == (4, 0, 3)
+    assert len(_records(app, 'user')) == 2
+
+
+def test_return_batch_reports_every_id(app):
+    client = login(app.test_client(), 'user', 'user123')
+    client.post('/borrow/batch', data={'book_ids': '1, 2'})
+    login(app.test_client(), 'admin', 'admin123').post('/borrow/batch', data={'book_ids': '3'})
+    first, second = _records(app, 'user')
+    foreign, = _records(app, 'admin')
+    client.get(f'/return/{first}')
+
+    response = client.post('/return/batch', json={'record_ids': [second, second, first, foreign, 999]})
+
+    assert _messages(response) == [
+        (second, True, 'Đã trả'),
+        (second, False, 'Trùng trong danh sách'),
+        (first, False, 'Sách này đã được trả rồi!'),
+        (foreign, False, 'Bạn không có quyền thực hiện thao tác này!'),
+        (999, False, 'Không tìm thấy phiếu mượn'),
+    ]
+    assert (_available(app, 1), _available(app, 2), _available(app, 3)) == (5, 3, 3)
+
+
+def test_admin_returns_any_record(app):
+    login(app.test_client(), 'user', 'user123').post('/borrow/batch', data={'book_ids': '1'})
+    record, = _records(app, 'user')
+
+    response = login(app.test_client(), 'admin', 'admin123').post('/return/batch', json={'record_ids': [record]})
+
+    assert _messages(response) == [(record, True, 'Đã trả')]
+
+
+def test_batch_size_is_capped(app):
+    app.config['BATCH_MAX_ITEMS'] = 3
+    client = login(app.test_client(), 'user', 'user123')
+
+    response = client.post('/borrow/batch', json={'book_ids': [1, 2, 3, 4]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == {'book_ids': ['Tối đa 3 mã mỗi lần!']}
+    html = client.post('/borrow/batch', data={'book_ids': '1 2 3 4'}).get_data(as_text=True)
+    assert 'Tối đa 3 mã mỗi lần!' in html
+    assert _records(app, 'user') == []
+
+    assert client.post('/borrow/batch', json={'book_ids': [1, 2, 3]}).get_json()['succeeded'] == 3
+
+
+def test_admin_borrows_on_behalf_of_a_user(app):
+    admin = login(app.test_client(), 'admin', 'admin123')
+
+    response = admin.post('/borrow/batch', json={'book_ids': [1, 2], 'username': 'user'})
+    assert response.get_json()['succeeded'] == 2
+    assert len(_records(app, 'user')) == 2
+    assert _records(app, 'admin') == []
+
+    response = admin.post('/borrow/batch', json={'book_ids': [3], 'username': 'khong_co'})
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == {'username': ['Không tìm thấy người dùng!']}
+
+
+def test_users_cannot_borrow_on_behalf_of_others(app):
+    client = login(app.test_client(), 'user', 'user123')
+
+    response = client.post('/borrow/batch', json={'book_ids': [1], 'username': 'admin'})
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == {'username': ['Chỉ quản trị viên được mượn hộ!']}
+    assert _records(app, 'admin') == _records(app, 'user') == []
+
+
+def _borrow_statements(app, book_ids, user_id):
+    import app as views
+
+    with app.test_request_context(), count_queries(app) as counter:
+        views.borrow_many(book_ids, user_id)
+    return counter.statements
+
+
+def _return_statements(app, record_ids, username):
+    import app as views
+    from models import User
+
+    with app.app_context():
+        user = User.query.filter_by(username=username).one()
+        with count_queries(app) as counter:
+            views.return_many(record_ids, user)
+    return counter.statements
+
+
+@pytest.mark.parametrize('incremental, borrow_count', [(True, 10), (False, 6)])
+def test_statement_count_does_not_grow_with_the_batch(app, incremental, borrow_count):
+    app.config['RECOMMENDATIONS_INCREMENTAL'] = incremental
+    user_id = _user(app, 'user')
+
+    # SELECT tên sách, UPDATE có điều kiện, INSERT executemany và ba upsert bộ đếm;
+    # gợi ý tăng dần thêm 4 câu (lịch sử mượn, số lượt mượn, upsert book_neighbor)
+    assert len(_borrow_statements(app, [1, 2], user_id)) == borrow_count
+    assert len(_borrow_statements(app, [3, 4, 5, 1, 2, 99, 3], user_id)) == borrow_count
+
+    # SELECT phiếu, UPDATE phiếu, UPDATE sách (một câu cho mỗi số bản trả) và bộ đếm
+    records = _records(app, 'user')
+    assert len(_return_statements(app, records[:2], 'user')) == 4
+    assert len(_return_statements(app, records[2:] + [999], 'user')) == 4
+
+
+@pytest.fixture
+def csrf_app(tmp_path):
+    app = build_app(tmp_path, WTF_CSRF_ENABLED=True)
+    yield app
+    dispose(app)
+
+
+def _csrf_token(client, path):
+    return CSRF_RE.search(client.get(path).get_data(as_text=True)).group(1)
+
+
+def test_json_clients_may_send_the_csrf_token_in_a_header(csrf_app):
+    client = csrf_app.test_client()
+    token = _csrf_token(client, '/login')
+    assert client.post('/login', data={'username': 'user', 'password': 'user123',
+                                       'csrf_token': token}).status_code == 302
+    token = _csrf_token(client, '/borrow/batch')
+
+    response = client.post('/borrow/batch', json={'book_ids': [1]})
+    assert response.status_code == 400
+    assert 'csrf_token' in response.get_json()['errors']
+
+    response = client.post('/borrow/batch', json={'book_ids': [1]}, headers={'X-CSRFToken': 'sai'})
+    assert response.status_code == 400
+
+    response = client.post('/borrow/batch', json={'book_ids': [1]}, headers={'X-CSRFToken': token})
+    assert response.get_json()['succeeded'] == 1
+    response = client.post('/borrow/batch', json={'book_ids': [2], 'csrf_token': token})
+    assert response.get_json()['succeeded'] == 1
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Mượn/trả đồng thời: các bộ đếm luôn đúng, không bán quá số bản còn lại."""
+import threading
+
+from sqlalchemy import event
+
+from tests.conftest import login
+
+THREADS = 16
+
+
+def _set_copies(app, book_id, quantity, available):
+    from models import db, Book
+
+    with app.app_context():
+        db.session.execute(db.update(Book).where(Book.id == book_id)
+                           .values(quantity=quantity, available=available))
+        db.session.commit()
+
+
+def _run_together(app, requests):
+    """Chạy mỗi request (hàm nhận client) trong một thread, cùng xuất phát một lúc"""
+    clients = [login(app.test_client(), 'user', 'user123') for _ in requests]
+    barrier = threading.Barrier(len(requests))
+    responses = [None] * len(requests)
+
+    def worker(index):
+        barrier.wait()
+        responses[index] = requests[index](clients[index])
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def _borrowed(response):
+    return response.status_code == 302 and response.location.endswith('/my-borrows')
+
+
+def test_only_one_thread_gets_the_last_copy(app):
+    from models import db, Book, BorrowRecord
+
+    _set_copies(app, 1, quantity=5, available=1)
+
+    responses = _run_together(app, [lambda client: client.post('/borrow', data={'book_id': '1'})] * THREADS)
+
+    assert all(response.status_code < 500 for response in responses)
+    assert sum(_borrowed(response) for response in responses) == 1
+    with app.app_context():
+        assert db.session.get(Book, 1).available == 0
+        assert BorrowRecord.query.filter_by(book_id=1, status='borrowing').count() == 1
+
+
+def test_concurrent_borrows_and_returns_keep_available_exact(app):
+    from models import db, Book, BorrowRecord
+
+    _set_copies(app, 2, quantity=5, available=5)
+
+    responses = _run_together(app, [lambda client: client.post('/borrow', data={'book_id': '2'})] * THREADS)
+
+    assert sum(_borrowed(response) for response in responses) == 5
+    with app.app_context():
+        assert db.session.get(Book, 2).available == 0
+        record_ids = [row.id for row in BorrowRecord.query.filter_by(book_id=2, status='borrowing')]
+    assert len(record_ids) == 5
+
+    # Mỗi phiếu bị trả hai lần cùng lúc: chỉ một lần được tính
+    returns = [lambda client, record_id=record_id: client.get(f'/return/{record_id}')
+               for record_id in record_ids for _ in range(2)]
+    _run_together(app, returns)
+
+    with app.app_context():
+        assert db.session.get(Book, 2).available == 5
+        assert BorrowRecord.query.filter_by(book_id=2, status='returned').count() == 5
+
+
+def test_batch_return_without_returning_skips_records_closed_meanwhile(app, monkeypatch):
+    import circulation
+    from models import db, Book, BorrowRecord
+
+    monkeypatch.setattr(circulation, '_supports_returning', lambda: False)
+    client = login(app.test_client(), 'user', 'user123')
+    client.post('/borrow/batch', data={'book_ids': '1 2 3'})
+    with app.app_context():
+        first, second, third = [row.id for row in BorrowRecord.query.order_by(BorrowRecord.id)]
+        engine = db.engine
+
+    # Request khác trả phiếu thứ hai ngay sau khi lô đã đọc danh sách phiếu
+    def close_second(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE borrow_record') and not closed:
+            closed.append(second)
+            conn.exec_driver_sql("UPDATE borrow_record SET status = 'returned', late_fee = 123 WHERE id = ?",
+                                 (second,))
+            conn.exec_driver_sql('UPDATE book SET available = available + 1 WHERE id = 2')
+
+    closed = []
+    event.listen(engine, 'before_cursor_execute', close_second)
+    try:
+        response = client.post('/return/batch', json={'record_ids': [first, second, third]})
+    finally:
+        event.remove(engine, 'before_cursor_execute', close_second)
+
+    assert [(row['id'], row['ok']) for row in response.get_json()['results']] == \
+        [(first, True), (second, False), (third, True)]
+    with app.app_context():
+        assert db.session.get(BorrowRecord, second).late_fee == 123
+        assert [db.session.get(Book, book_id).available for book_id in (1, 2, 3)] == [5, 3, 4]
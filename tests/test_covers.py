@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Ảnh bìa: upload ảnh từ máy người dùng và bộ đệm ảnh ở máy chủ ngoài.
+
+Máy chủ ngoài được thay bằng một ``http.server`` chạy trong thread, đếm số lần
+ảnh bị tải.
+"""
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tests.conftest import build_app, dispose, login
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = build_app(tmp_path, COVER_ASYNC=False)
+    yield app
+    dispose(app)
+
+
+def _png():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 900), 'navy').save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+class _CoverHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append(self.path)
+        time.sleep(server.delay)
+        if self.path != '/cover.png':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _CoverHandler)
+    server.lock = threading.Lock()
+    server.hits = []
+    server.delay = 0
+    server.body = _png().getvalue()
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _point_cover(app, book_id, url):
+    from models import db, Book
+
+    with app.app_context():
+        db.session.execute(db.update(Book).where(Book.id == book_id).values(image_url=url))
+        db.session.commit()
+
+
+def test_upload_with_non_ascii_filename(app):
+    from models import Book
+
+    client = login(app.test_client(), 'admin', 'admin123')
+    response = client.post('/books/add', data={
+        'title': 'Sách có bìa', 'author': 'Tác giả', 'category': 'Khác', 'quantity': '1',
+        'image': (_png(), '封面.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        book = Book.query.filter_by(title='Sách có bìa').one()
+        assert book.image_url.startswith('uploads/books/')
+        assert book.image_url.endswith('.png')
+
+
+def test_save_upload_rejects_unknown_extension(app):
+    import covers
+    from werkzeug.datastructures import FileStorage
+
+    with pytest.raises(ValueError):
+        covers.save_upload(FileStorage(io.BytesIO(b'x'), filename='封面'), app.config)
+
+
+def test_remote_cover_is_fetched_once_and_served_locally(app, origin):
+    _point_cover(app, 1, origin.url + '/cover.png')
+    client = app.test_client()
+
+    first = client.get('/cover/1/thumb')
+    second = client.get('/cover/1/thumb')
+    medium = client.get('/cover/1/medium')
+
+    for response in (first, second, medium):
+        assert response.status_code == 200
+        assert response.mimetype.startswith('image/')
+        assert response.cache_control.immutable
+    assert first.data == second.data
+    assert first.data != origin.body  # Bản thu nhỏ chứ không phải ảnh gốc
+    assert origin.hits == ['/cover.png']
+
+
+def test_concurrent_misses_share_one_fetch(app, origin):
+    _point_cover(app, 1, origin.url + '/cover.png')
+    origin.delay = 0.2
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.get('/cover/1/thumb').status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 8
+    assert origin.hits == ['/cover.png']
+
+
+def test_failed_fetch_redirects_to_the_original(app, origin):
+    url = origin.url + '/missing.png'
+    _point_cover(app, 1, url)
+
+    response = app.test_client().get('/cover/1/thumb')
+
+    assert response.status_code == 302
+    assert response.location == url
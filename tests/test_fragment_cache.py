@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Cache fragment: chỉ mục ngược sách -> khóa không lớn hơn nội dung cache."""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fragment_cache import FragmentCache, LRUBackend
+
+START = datetime(2024, 1, 1)
+
+
+def _book(book_id, minutes=0):
+    return SimpleNamespace(id=book_id, updated_at=START + timedelta(minutes=minutes), created_at=START)
+
+
+def _tracked_keys(cache):
+    return sum(len(keys) for keys in cache._keys_by_book.values())
+
+
+def test_evicted_keys_leave_the_reverse_index():
+    cache = FragmentCache(LRUBackend(maxsize=10))
+
+    for book_id in range(1, 501):
+        cache.render('card', _book(book_id), lambda: '<div></div>')
+
+    assert len(cache.backend) == 10
+    assert _tracked_keys(cache) == 10
+    assert cache.stats()['tracked_books'] == 10
+
+
+def test_new_version_replaces_the_old_key():
+    cache = FragmentCache(LRUBackend(maxsize=100))
+
+    for minutes in range(20):
+        cache.render('card', _book(1, minutes), lambda: '<div></div>')
+        cache.render('info', _book(1, minutes), lambda: '<p></p>')
+
+    assert len(cache.backend) == 2
+    assert _tracked_keys(cache) == 2
+
+    cache.invalidate_book(1)
+    assert len(cache.backend) == 0
+    assert cache.stats()['tracked_books'] == 0
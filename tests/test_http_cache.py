@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""GET có điều kiện: 304 theo ETag/If-Modified-Since, không validator cho trang có flash."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import login
+
+# Thay đổi cuối của danh mục, đã qua từ lâu: Last-Modified là giây kế tiếp
+CHANGED_AT = datetime(2026, 1, 1, 10, 0, 0, 250000)
+LAST_MODIFIED = 'Thu, 01 Jan 2026 10:00:01 GMT'
+SAME_SECOND = 'Thu, 01 Jan 2026 10:00:00 GMT'
+
+
+def _set_catalog_changed_at(app, changed_at):
+    import http_cache
+    from models import db, Book, LibraryStat
+
+    with app.app_context():
+        db.session.execute(db.update(Book).values(updated_at=changed_at))
+        db.session.execute(db.update(LibraryStat).where(LibraryStat.name == http_cache.REVISION)
+                           .values(value=http_cache._to_us(changed_at)))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('path', ['/', '/books', '/books?category=V%C4%83n+h%E1%BB%8Dc', '/book/1'])
+def test_unchanged_pages_are_revalidated_by_etag(app, path):
+    client = app.test_client()
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache, public'
+
+    response = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+@pytest.mark.parametrize('path', ['/', '/books'])
+def test_catalog_pages_are_revalidated_by_date(app, path):
+    _set_catalog_changed_at(app, CHANGED_AT)
+    client = app.test_client()
+
+    assert client.get(path).headers['Last-Modified'] == LAST_MODIFIED
+    assert client.get(path, headers={'If-Modified-Since': LAST_MODIFIED}).status_code == 304
+
+
+def test_change_in_the_same_second_is_not_hidden(app):
+    _set_catalog_changed_at(app, CHANGED_AT)
+    client = app.test_client()
+
+    # Mốc cắt xuống giây của thay đổi cuối vẫn sớm hơn thay đổi đó
+    assert client.get('/', headers={'If-Modified-Since': SAME_SECOND}).status_code == 200
+
+    _set_catalog_changed_at(app, CHANGED_AT.replace(microsecond=900000))
+    assert client.get('/', headers={'If-Modified-Since': SAME_SECOND}).status_code == 200
+
+
+def test_unfinished_second_is_not_sent_as_last_modified(app):
+    # Thay đổi trong giây hiện tại (ở đây: giây còn chưa tới) chỉ được xác nhận bằng ETag
+    _set_catalog_changed_at(app, datetime.utcnow() + timedelta(seconds=5))
+
+    response = app.test_client().get('/books')
+
+    assert 'ETag' in response.headers
+    assert 'Last-Modified' not in response.headers
+
+
+@pytest.mark.parametrize('path', ['/', '/books', '/book/1'])
+def test_pages_with_a_flash_message_carry_no_validators(app, path):
+    client = login(app.test_client(), 'user', 'user123')
+
+    response = client.get(path)
+    assert 'Chào mừng user!' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers
+    assert 'Last-Modified' not in response.headers
+
+    # Flash đã hiển thị: lần sau có validator và được 304
+    response = client.get(path)
+    assert 'Chào mừng user!' not in response.get_data(as_text=True)
+    assert response.headers['Cache-Control'] == 'no-cache, private'
+    assert client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Nhập danh mục: giới hạn kích thước body theo route, số có sẵn khi cập nhật sách."""
+import io
+import json
+
+from tests.conftest import login
+
+BIG = 9 * 1024 * 1024  # Lớn hơn MAX_CONTENT_LENGTH, nhỏ hơn IMPORT_MAX_CONTENT_LENGTH
+
+
+def _upload(client, path, name, content, **fields):
+    data = dict(fields, file=(io.BytesIO(content), name))
+    return client.post(path, data=data, content_type='multipart/form-data')
+
+
+def test_large_body_is_rejected_outside_the_import_page(app):
+    client = login(app.test_client(), 'admin', 'admin123')
+
+    response = _upload(client, '/books/add', 'cover.png', b'x' * BIG,
+                       title='Sách', author='Tác giả', category='Khác', quantity='1')
+
+    assert response.status_code == 413
+
+
+def test_import_page_accepts_a_large_file(app):
+    from models import Book
+
+    client = login(app.test_client(), 'admin', 'admin123')
+    # Phần lớn file là dòng trống (bị bỏ qua), sau đó là một sách
+    row = '{"title": "Sách lớn", "author": "Tác giả", "category": "Khác", "quantity": 2}'
+    content = b' ' * BIG + f'\n{row}\n'.encode('utf-8')
+
+    response = _upload(client, '/books/import', 'catalog.jsonl', content)
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert Book.query.filter_by(title='Sách lớn').one().available == 2
+
+
+def _import(app, *rows):
+    import catalog_io
+
+    content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows).encode('utf-8')
+    with app.app_context():
+        return catalog_io.import_books(io.BytesIO(content), 'jsonl')
+
+
+def test_import_keeps_borrows_made_after_the_batch_was_read(app, monkeypatch):
+    import catalog_io
+    from models import db, Book
+
+    # Một lượt mượn chen vào giữa lúc lô đọc số có sẵn và lúc ghi
+    original = catalog_io._update_statement
+
+    def borrow_then_update():
+        db.session.execute(db.update(Book).where(Book.id == 1).values(available=Book.available - 1))
+        return original()
+
+    monkeypatch.setattr(catalog_io, '_update_statement', borrow_then_update)
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        row = {'title': book.title, 'author': book.author, 'category': book.category, 'quantity': book.quantity + 2}
+        quantity, available = book.quantity, book.available
+
+    result = _import(app, row)
+
+    assert result.updated == 1
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        assert book.quantity == quantity + 2
+        assert book.available == available - 1 + 2
+
+
+def test_import_never_makes_available_negative(app):
+    from models import db, Book
+
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        row = {'title': book.title, 'author': book.author, 'category': book.category, 'quantity': 1}
+        db.session.execute(db.update(Book).where(Book.id == 1).values(quantity=5, available=1))
+        db.session.commit()
+
+    _import(app, row)
+
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        assert (book.quantity, book.available) == (1, 0)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Đăng nhập: băm lại mật khẩu khi đổi tham số, giới hạn số lần băm đồng thời."""
+import time
+
+import pytest
+
+from tests.conftest import build_app, dispose, login
+
+
+@pytest.fixture
+def scrypt_app(tmp_path):
+    # 'scrypt' được werkzeug ghi thành 'scrypt:32768:8:1' trong hash
+    app = build_app(tmp_path, PASSWORD_HASH_METHOD='scrypt')
+    yield app
+    dispose(app)
+
+
+def _password_hash(app, username):
+    from models import User
+
+    with app.app_context():
+        return User.query.filter_by(username=username).one().password_hash
+
+
+def test_login_does_not_rehash_a_current_hash(scrypt_app):
+    before = _password_hash(scrypt_app, 'user')
+
+    login(scrypt_app.test_client(), 'user', 'user123')
+    login(scrypt_app.test_client(), 'user', 'user123')
+
+    assert _password_hash(scrypt_app, 'user') == before
+
+
+def test_login_rehashes_an_outdated_hash(app):
+    from models import db, User
+
+    with app.app_context():
+        user = User.query.filter_by(username='user').one()
+        user.set_password('user123', 'pbkdf2:sha256:500')
+        db.session.commit()
+
+    login(app.test_client(), 'user', 'user123')
+
+    assert _password_hash(app, 'user').startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_fails_fast_when_hashing_is_busy(app):
+    gate = app.extensions['password_gate']
+    slots = app.config['PASSWORD_HASH_CONCURRENCY']
+    for _ in range(slots):
+        gate._semaphore.acquire()
+    try:
+        started = time.monotonic()
+        response = app.test_client().post('/login', data={'username': 'user', 'password': 'user123'})
+        elapsed = time.monotonic() - started
+    finally:
+        for _ in range(slots):
+            gate._semaphore.release()
+
+    assert response.status_code == 503
+    assert elapsed < 0.5
+    login(app.test_client(), 'user', 'user123')
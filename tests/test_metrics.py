@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""/metrics đóng theo mặc định: chỉ token hoặc admin, loopback phải bật riêng."""
+import pytest
+
+from tests.conftest import build_app, dispose, login
+
+REMOTE = {'REMOTE_ADDR': '203.0.113.7'}
+
+
+@pytest.fixture
+def token_app(tmp_path):
+    app = build_app(tmp_path, METRICS_TOKEN='s3cret')
+    yield app
+    dispose(app)
+
+
+@pytest.fixture
+def loopback_app(tmp_path):
+    app = build_app(tmp_path, METRICS_ALLOW_LOOPBACK=True)
+    yield app
+    dispose(app)
+
+
+def test_metrics_is_closed_to_anonymous_clients_even_from_loopback(app):
+    # Sau reverse proxy cùng máy, mọi client đều đến từ 127.0.0.1
+    assert app.test_client().get('/metrics').status_code == 403
+    assert app.test_client().get('/metrics', environ_base=REMOTE).status_code == 403
+    reader = login(app.test_client(), 'user', 'user123')
+    assert reader.get('/metrics').status_code == 403
+
+
+def test_metrics_is_open_to_admins(app):
+    admin = login(app.test_client(), 'admin', 'admin123')
+    response = admin.get('/metrics', environ_base=REMOTE)
+    assert response.status_code == 200
+    assert 'text/plain' in response.content_type
+
+
+def test_metrics_token(token_app):
+    client = token_app.test_client()
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', environ_base=REMOTE, headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+
+
+def test_loopback_access_must_be_enabled(loopback_app):
+    client = loopback_app.test_client()
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base=REMOTE).status_code == 403
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Phân trang keyset: mỗi trang tốn một số câu SQL cố định, không phụ thuộc số dòng."""
+import re
+
+import pytest
+
+from tests.conftest import count_queries, login
+
+ADMIN = ('admin', 'admin123')
+
+# (đường dẫn, tài khoản): None là khách, 'reader' là độc giả có nhiều lượt mượn nhất
+LISTINGS = [
+    ('/books', None),
+    ('/books?category=Khác', None),
+    ('/my-borrows', 'reader'),
+    ('/all-borrows', ADMIN),
+    ('/all-borrows?overdue=1', ADMIN),
+]
+
+
+@pytest.fixture(scope='module')
+def reader(seeded_app):
+    from models import db, BorrowRecord, User
+
+    with seeded_app.app_context():
+        user_id = db.session.query(BorrowRecord.user_id).group_by(BorrowRecord.user_id) \
+            .order_by(db.func.count().desc()).limit(1).scalar()
+        return db.session.get(User, user_id).username, 'bench123'
+
+
+def _client(app, account, reader):
+    client = app.test_client()
+    if account == 'reader':
+        account = reader
+    if account:
+        login(client, *account)
+    return client
+
+
+def _get(app, client, path):
+    with count_queries(app) as counter:
+        response = client.get(path)
+    assert response.status_code == 200
+    return counter.count, response.get_data(as_text=True)
+
+
+def _rows(html):
+    return len(re.findall(r'<tr\b|class="card h-100', html))
+
+
+def _with(path, **params):
+    separator = '&' if '?' in path else '?'
+    return path + separator + '&'.join(f'{key}={value}' for key, value in params.items())
+
+
+@pytest.mark.parametrize('path,account', LISTINGS)
+def test_query_count_does_not_depend_on_page_size(seeded_app, reader, path, account):
+    client = _client(seeded_app, account, reader)
+    client.get(path)  # Làm nóng cache danh tính người dùng
+
+    small, small_html = _get(seeded_app, client, _with(path, per_page=5))
+    large, large_html = _get(seeded_app, client, _with(path, per_page=100))
+
+    # Trang lớn hiển thị nhiều dòng hơn hẳn nhưng không tốn thêm câu SQL nào
+    assert _rows(large_html) > _rows(small_html)
+    assert small == large
+    assert large <= 4
+
+
+@pytest.mark.parametrize('path,account', LISTINGS[:4])
+def test_next_page_costs_the_same_as_the_first(seeded_app, reader, path, account):
+    client = _client(seeded_app, account, reader)
+    client.get(path)
+
+    first, html = _get(seeded_app, client, _with(path, per_page=10))
+    cursor = re.search(r'after=([\w=-]+)', html)
+    assert cursor is not None, 'Trang đầu phải có liên kết trang sau'
+    second, _ = _get(seeded_app, client, _with(path, per_page=10, after=cursor.group(1)))
+
+    assert second == first
+
+
+@pytest.mark.parametrize('sort', ['newest', 'rating', 'trending'])
+def test_paging_through_every_sort_reaches_the_end(seeded_app, sort):
+    from models import Book
+
+    client = seeded_app.test_client()
+    path = f'/books?sort={sort}&per_page=100'
+    seen = []
+    for _ in range(100):
+        html = client.get(path).get_data(as_text=True)
+        seen.extend(dict.fromkeys(int(book_id) for book_id in re.findall(r'href="/book/(\d+)"', html)))
+        cursor = re.search(r'after=([\w=-]+)', html)
+        if cursor is None:
+            break
+        path = f'/books?sort={sort}&per_page=100&after={cursor.group(1)}'
+
+    with seeded_app.app_context():
+        total = Book.query.count()
+    assert len(seen) == len(set(seen)) == total
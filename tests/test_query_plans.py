@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Kế hoạch thực thi: không câu SELECT nào của các route chính quét toàn bảng.
+
+Chạy cùng kiểm tra với ``benchmarks.query_plans`` trên dữ liệu 1k của
+``seeded_app``. Với dữ liệu nhỏ SQLite vẫn chọn chỉ mục nếu có, nên một chỉ mục
+bị thiếu hay một điều kiện không dùng được chỉ mục vẫn bị phát hiện.
+"""
+import pytest
+
+from benchmarks import query_plans
+
+ROUTES = [
+    'index', 'books', 'books_category', 'books_rating', 'books_trending', 'books_search',
+    'book_detail', 'rate_form', 'my_borrows', 'borrow_form', 'borrow_form_book', 'borrow_suggest',
+    'dashboard', 'all_borrows', 'all_borrows_overdue', 'books_page', 'all_borrows_page', 'my_borrows_page',
+]
+
+
+@pytest.fixture(scope='module')
+def routes(seeded_app):
+    return {route[0]: route for route in query_plans.build_routes(seeded_app)}
+
+
+@pytest.fixture(scope='module')
+def planner(seeded_app):
+    return query_plans.explainer(seeded_app)
+
+
+@pytest.mark.parametrize('name', ROUTES)
+def test_route_does_not_scan_large_tables(seeded_app, routes, planner, name):
+    status, _, problems, _ = query_plans.inspect_route(seeded_app, *planner, routes[name])
+
+    assert status == 200
+    assert not problems, '\n'.join(query_plans.describe(*problem) for problem in problems)
+
+
+def test_every_route_is_covered(routes):
+    assert sorted(routes) == sorted(ROUTES)
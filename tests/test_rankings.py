@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Cron xếp hạng: chỉ ghi điểm đã đổi, không làm đổi updated_at, ETag hay khóa fragment của sách."""
+from tests.conftest import login
+
+
+def _borrow_return_and_rate(app, book_id, rating):
+    from models import BorrowRecord
+
+    client = login(app.test_client(), 'user', 'user123')
+    client.post('/borrow', data={'book_id': str(book_id)})
+    with app.app_context():
+        record_id = BorrowRecord.query.filter_by(book_id=book_id, status='borrowing').one().id
+    client.get(f'/return/{record_id}')
+    assert client.post(f'/book/{book_id}/rate', data={'rating': str(rating)}).status_code == 302
+
+
+def _books(app):
+    from models import Book
+
+    with app.app_context():
+        return {book.id: (book.updated_at, book.trending_score, book.total_ratings, book.rating_score)
+                for book in Book.query}
+
+
+def _refresh(app):
+    import rankings
+    from models import db
+
+    with app.app_context():
+        rankings.rebuild_ratings(batch_size=2)
+        count = rankings.refresh_trending(batch_size=2)
+        db.session.commit()
+    return count
+
+
+def _detail_etag(app, book_id):
+    client = app.test_client()
+    response = client.get(f'/book/{book_id}')
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_cron_keeps_updated_at_and_etags_when_nothing_changed(app):
+    from fragment_cache import FragmentCache
+    from models import db, Book
+
+    _borrow_return_and_rate(app, 1, 5)
+    _borrow_return_and_rate(app, 2, 3)
+    _refresh(app)
+    before = _books(app)
+    etag = _detail_etag(app, 1)
+    with app.app_context():
+        key = FragmentCache.make_key('_book_card.html', db.session.get(Book, 1))
+
+    assert _refresh(app) == 2
+
+    assert _books(app) == before
+    assert _detail_etag(app, 1) == etag
+    with app.app_context():
+        assert FragmentCache.make_key('_book_card.html', db.session.get(Book, 1)) == key
+
+
+def test_refresh_trending_resets_stale_scores_without_touching_updated_at(app):
+    from models import db, Book
+
+    _borrow_return_and_rate(app, 1, 4)
+    with app.app_context():
+        db.session.execute(db.update(Book).where(Book.id == 4)
+                           .values(trending_score=7.5, updated_at=Book.updated_at))
+        db.session.commit()
+    before = _books(app)
+
+    _refresh(app)
+
+    after = _books(app)
+    assert after[4][1] == 0
+    assert after[1][1] == before[1][1] == 1.0
+    assert {book_id: row[0] for book_id, row in after.items()} == \
+        {book_id: row[0] for book_id, row in before.items()}
+
+
+def test_rebuild_ratings_rewrites_only_drifted_books(app):
+    from models import db, Book
+
+    _borrow_return_and_rate(app, 1, 5)
+    _borrow_return_and_rate(app, 2, 3)
+    with app.app_context():
+        db.session.execute(db.update(Book).where(Book.id == 2).values(total_ratings=9))
+        db.session.execute(db.update(Book).where(Book.id == 3).values(stars_4=2))
+        db.session.commit()
+    before = _books(app)
+    etag = _detail_etag(app, 2)
+
+    _refresh(app)
+
+    after = _books(app)
+    assert after[2][2] == 1
+    # Sách được sửa lại đổi updated_at (điểm hiển thị trên trang), các sách khác giữ nguyên
+    assert [book_id for book_id in after if after[book_id][0] != before[book_id][0]] == [2, 3]
+    assert _detail_etag(app, 2) != etag
+    with app.app_context():
+        assert db.session.get(Book, 3).stars_4 == 0
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Gợi ý "Người mượn sách này cũng mượn" và ETag của trang chi tiết sách."""
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import login
+
+# Lịch sử mượn mẫu {độc giả: sách}; 'a' mượn sách 1 hai lần
+HISTORY = {'a': [1, 2, 3, 1], 'b': [1, 2], 'c': [1, 4], 'd': [2, 3]}
+
+
+def _etag(client, path):
+    client.get(path)  # Bỏ qua trang còn flash message (không có ETag)
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def _revalidate(client, path, etag):
+    return client.get(path, headers={'If-None-Match': etag})
+
+
+def _add_neighbor(app, book_id, neighbor_id, score=0.5):
+    from models import db, BookNeighbor
+
+    with app.app_context():
+        db.session.add(BookNeighbor(book_id=book_id, neighbor_id=neighbor_id, co_count=1, score=score))
+        db.session.commit()
+
+
+def test_detail_is_revalidated_after_a_co_borrow(app):
+    reader = login(app.test_client(), 'user', 'user123')
+    reader.post('/borrow', data={'book_id': '1'})
+    client = app.test_client()
+    etag = _etag(client, '/book/1')
+    assert _revalidate(client, '/book/1', etag).status_code == 304
+
+    # Mượn sách 2 sau sách 1: sách 2 thành gợi ý của sách 1 mà sách 1 không đổi
+    reader.post('/borrow', data={'book_id': '2'})
+
+    response = _revalidate(client, '/book/1', etag)
+    assert response.status_code == 200
+    assert 'href="/book/2"' in response.get_data(as_text=True)
+
+
+def test_detail_is_revalidated_when_a_neighbor_runs_out(app):
+    from models import db, Book
+
+    _add_neighbor(app, 1, 2)
+    client = app.test_client()
+    etag = _etag(client, '/book/1')
+
+    with app.app_context():
+        db.session.get(Book, 2).available = 0
+        db.session.commit()
+
+    response = _revalidate(client, '/book/1', etag)
+    assert response.status_code == 200
+    assert 'Hết sách' in response.get_data(as_text=True)
+
+
+def test_detail_is_revalidated_after_a_neighbor_is_removed(app):
+    import recommendations
+    from models import db
+
+    _add_neighbor(app, 1, 2)
+    _add_neighbor(app, 1, 3, score=0.4)
+    client = app.test_client()
+    etag = _etag(client, '/book/1')
+
+    with app.app_context():
+        recommendations.remove_book(3)
+        db.session.commit()
+
+    assert _revalidate(client, '/book/1', etag).status_code == 200
+
+
+def test_unrelated_changes_keep_the_detail_cached(app):
+    _add_neighbor(app, 1, 2)
+    client = app.test_client()
+    etag = _etag(client, '/book/1')
+
+    login(app.test_client(), 'user', 'user123').post('/borrow', data={'book_id': '4'})
+
+    assert _revalidate(client, '/book/1', etag).status_code == 304
+
+
+def _seed_history(app, history=HISTORY):
+    """Tạo độc giả và các lượt đã trả theo history, trả về {tên: id}"""
+    from models import db, BorrowRecord, User
+
+    now = datetime.utcnow()
+    with app.app_context():
+        ids = {}
+        for name, book_ids in history.items():
+            user = User(username=f'reader_{name}', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            ids[name] = user.id
+            for offset, book_id in enumerate(book_ids):
+                borrowed = now - timedelta(days=30 - offset)
+                db.session.add(BorrowRecord(book_id=book_id, user_id=user.id, borrow_date=borrowed,
+                                            due_date=borrowed + timedelta(days=14),
+                                            return_date=borrowed + timedelta(days=1), status='returned'))
+        db.session.commit()
+    return ids
+
+
+def _neighbors(app):
+    from models import db, BookNeighbor
+
+    with app.app_context():
+        return {(row.book_id, row.neighbor_id): (row.co_count, row.score)
+                for row in db.session.query(BookNeighbor)}
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def implementation(request, monkeypatch):
+    import recommendations
+
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+        pytest.importorskip('scipy')
+    else:
+        monkeypatch.setattr(recommendations, 'np', None)
+    return request.param
+
+
+def test_rebuild_scores_pairs_by_cosine_and_keeps_top_k(app, implementation):
+    import recommendations
+    from models import db
+
+    _seed_history(app)
+    with app.app_context():
+        written = recommendations.rebuild(top_k=2, min_count=1)
+        db.session.commit()
+
+    # Số độc giả: sách 1 và 2 có 3, sách 3 có 2, sách 4 có 1
+    expected = {
+        (1, 2): (2, 2 / 3), (1, 4): (1, 1 / math.sqrt(3)),  # (1, 3) điểm thấp hơn, bị cắt
+        (2, 3): (2, 2 / math.sqrt(6)), (2, 1): (2, 2 / 3),
+        (3, 2): (2, 2 / math.sqrt(6)), (3, 1): (1, 1 / math.sqrt(6)),
+        (4, 1): (1, 1 / math.sqrt(3)),
+    }
+    neighbors = _neighbors(app)
+    assert written == len(expected)
+    assert set(neighbors) == set(expected)
+    for pair, (count, score) in expected.items():
+        assert neighbors[pair][0] == count
+        assert neighbors[pair][1] == pytest.approx(score, rel=1e-6)
+
+
+def test_rebuild_drops_pairs_below_min_count(app, implementation):
+    import recommendations
+    from models import db
+
+    _seed_history(app)
+    with app.app_context():
+        recommendations.rebuild(top_k=10, min_count=2)
+        db.session.commit()
+
+    assert set(_neighbors(app)) == {(1, 2), (2, 1), (2, 3), (3, 2)}
+
+
+def _set_borrow_counts(app, counts):
+    from models import db, BookStat
+
+    with app.app_context():
+        for book_id, count in counts.items():
+            db.session.merge(BookStat(book_id=book_id, borrow_count=count))
+        db.session.commit()
+
+
+def test_record_borrow_upserts_both_directions_and_skips_borrowed_books(app):
+    import recommendations
+    from models import db
+
+    ids = _seed_history(app, {'a': [1, 2], 'b': [1]})
+    _set_borrow_counts(app, {1: 4, 2: 1, 3: 9})
+
+    with app.app_context():
+        # Sách 2 đã mượn rồi nên chỉ sách 3 tạo cặp mới, với cả hai sách đã mượn
+        assert recommendations.record_borrow(ids['a'], [2, 3]) == 4
+        db.session.commit()
+    neighbors = _neighbors(app)
+    assert set(neighbors) == {(1, 3), (3, 1), (2, 3), (3, 2)}
+    assert neighbors[(1, 3)] == neighbors[(3, 1)] == (1, pytest.approx(1 / 6))
+    assert neighbors[(2, 3)] == neighbors[(3, 2)] == (1, pytest.approx(1 / 3))
+
+    with app.app_context():
+        assert recommendations.record_borrow(ids['a'], [1, 2]) == 0  # Đều đã mượn
+        assert recommendations.record_borrow(ids['b'], [3]) == 2
+        db.session.commit()
+    neighbors = _neighbors(app)
+    assert neighbors[(1, 3)] == neighbors[(3, 1)] == (2, pytest.approx(2 / 6))
+    assert neighbors[(2, 3)][0] == 1
+
+
+def test_remove_book_clears_both_sides(app):
+    import recommendations
+    from models import db
+
+    for book_id, neighbor_id in ((1, 2), (2, 1), (3, 1), (2, 3)):
+        _add_neighbor(app, book_id, neighbor_id)
+
+    with app.app_context():
+        recommendations.remove_book(1)
+        db.session.commit()
+
+    assert set(_neighbors(app)) == {(2, 3)}
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Định tuyến bản sao đọc: hai file SQLite, bản sao được đánh dấu để biết câu SQL chạy ở đâu."""
+import sqlite3
+
+import pytest
+
+from tests.conftest import build_app, dispose, login
+
+REPLICA_TITLE = 'Đọc từ bản sao'
+
+
+@pytest.fixture
+def app(tmp_path):
+    primary = tmp_path / 'library.db'
+    replica = tmp_path / 'replica.db'
+    app = build_app(tmp_path, SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{replica}'})
+
+    # Bản sao là bản chụp của primary, chỉ khác tên sách 1
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+        source.backup(target)
+        target.execute('UPDATE book SET title = ? WHERE id = 1', (REPLICA_TITLE,))
+
+    yield app
+    dispose(app)
+
+
+def _detail(client):
+    response = client.get('/book/1')
+    assert response.status_code == 200
+    return REPLICA_TITLE in response.get_data(as_text=True)
+
+
+def test_read_only_pages_use_the_replica(app):
+    client = app.test_client()
+
+    assert _detail(client)
+    # Endpoint ngoài DB_REPLICA_ENDPOINTS luôn đọc primary
+    login(client, 'user', 'user123')
+    html = client.get('/borrow?book_id=1').get_data(as_text=True)
+    assert 'Đắc Nhân Tâm' in html and REPLICA_TITLE not in html
+
+
+def test_reads_stick_to_the_primary_after_a_write(app):
+    client = login(app.test_client(), 'user', 'user123')
+    client.get('/')  # Bỏ qua flash đăng nhập
+    assert _detail(client)
+
+    response = client.post('/borrow', data={'book_id': '2'})
+    assert response.status_code == 302
+
+    # Trong DB_REPLICA_STICKY_SECONDS sau khi ghi, trình duyệt này đọc primary
+    assert not _detail(client)
+    assert _detail(app.test_client())
+
+
+def test_first_write_moves_the_rest_of_the_request_to_the_primary(app):
+    from models import db, Book
+
+    with app.test_request_context('/book/1'):
+        app.preprocess_request()
+        assert db.session.get(Book, 1).title == REPLICA_TITLE
+
+        db.session.execute(db.update(Book).where(Book.id == 2).values(description='ghi'))
+        db.session.expire_all()
+        assert db.session.get(Book, 1).title != REPLICA_TITLE
+        db.session.rollback()
+
+
+def test_sticky_window_expires(app):
+    client = login(app.test_client(), 'user', 'user123')
+    client.post('/borrow', data={'book_id': '2'})
+    assert not _detail(client)
+
+    with client.session_transaction() as session:
+        session['_db_write_at'] -= app.config['DB_REPLICA_STICKY_SECONDS'] + 1
+    assert _detail(client)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Tìm kiếm toàn văn: chuẩn hóa tiếng Việt, xếp hạng và đồng bộ chỉ mục.
+
+Chạy trên SQLite (FTS5); nhánh tsvector của PostgreSQL dùng cùng văn bản đã
+chuẩn hóa nên các ca về bỏ dấu ở đây cũng áp dụng cho nó.
+"""
+import io
+import json
+
+from search import normalize, tokenize
+from tests.conftest import login
+
+
+def _search(app, text, **kwargs):
+    import search
+
+    with app.app_context():
+        return [book.id for book in search.search_books(text, **kwargs).items]
+
+
+def _book_form(**fields):
+    return dict({'title': 'Sách mới', 'author': 'Tác giả', 'category': 'Khác', 'quantity': '2'}, **fields)
+
+
+def test_normalize_strips_vietnamese_diacritics():
+    assert normalize('Đắc Nhân Tâm') == 'dac nhan tam'
+    assert normalize('Tuổi Trẻ Đáng Giá Bao Nhiêu') == 'tuoi tre dang gia bao nhieu'
+    assert normalize(None) == ''
+    assert tokenize('Nhà Giả Kim, Paulo-Coelho') == ['nha', 'gia', 'kim', 'paulo', 'coelho']
+
+
+def test_search_matches_with_or_without_diacritics(app):
+    assert _search(app, 'dac nhan tam') == [1]
+    assert _search(app, 'Đắc Nhân Tâm') == [1]
+    assert _search(app, 'ĐẮC') == [1]
+    # Mọi từ phải khớp, mỗi từ theo tiền tố: sách 1 khớp qua "nhân" và "giao"
+    assert _search(app, 'nha gia') == [4, 1]
+    assert _search(app, 'nha gia kim') == [4]
+    assert _search(app, 'dac zzz') == []
+    assert _search(app, '  ,, ') == []
+
+
+def test_title_matches_rank_above_description_matches(app):
+    import search
+    from models import db, Book
+
+    with app.app_context():
+        book = Book(title='Cẩm nang du lịch', author='Khuyết danh', category='Khác',
+                    description='Mang theo Nhà Giả Kim khi đi xa', quantity=1, available=1)
+        db.session.add(book)
+        db.session.flush()
+        search.index_book(book)
+        db.session.commit()
+        book_id = book.id
+
+    assert _search(app, 'gia kim') == [4, book_id]
+    assert _search(app, 'gia kim', category='Khác') == [book_id]
+
+
+def test_results_are_paged_by_rank_position(app):
+    import search
+
+    with app.app_context():
+        first = search.search_books('n', per_page=2)
+        second = search.search_books('n', cursor=first.next_cursor, per_page=2)
+        last = search.search_books('n', cursor=second.next_cursor, per_page=2)
+        everything = search.search_books('n', per_page=20)
+
+    assert (first.next_cursor, second.next_cursor, last.next_cursor) == ('2', '4', None)
+    assert [book.id for book in first.items + second.items + last.items] == [book.id for book in everything]
+    assert len(everything) == 5
+
+
+def test_add_edit_and_delete_keep_the_index_in_sync(app):
+    from models import Book
+
+    client = login(app.test_client(), 'admin', 'admin123')
+    assert client.post('/books/add', data=_book_form(title='Lược Sử Thời Gian')).status_code == 302
+    with app.app_context():
+        book_id = Book.query.filter_by(title='Lược Sử Thời Gian').one().id
+    assert _search(app, 'thoi gian') == [book_id]
+
+    response = client.post(f'/books/edit/{book_id}', data=_book_form(title='Vũ Trụ', author='Carl Sagan'))
+    assert response.status_code == 302
+    assert _search(app, 'thoi gian') == []
+    assert _search(app, 'vu tru sagan') == [book_id]
+
+    assert client.get(f'/books/delete/{book_id}').status_code == 302
+    assert _search(app, 'vu tru') == []
+
+
+def test_import_indexes_new_and_updated_books(app):
+    import catalog_io
+
+    rows = [
+        {'title': 'Đời Ngắn Đừng Ngủ Dài', 'author': 'Robin Sharma', 'category': 'Kỹ năng sống', 'quantity': 2},
+        {'title': 'Sapiens', 'author': 'Yuval Noah Harari', 'category': 'Lịch sử', 'quantity': 3,
+         'description': 'Lược sử loài người, bản bìa cứng'},
+    ]
+    content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows).encode('utf-8')
+    with app.app_context():
+        result = catalog_io.import_books(io.BytesIO(content), 'jsonl')
+    assert (result.inserted, result.updated) == (1, 1)
+
+    assert len(_search(app, 'doi ngan dung ngu')) == 1
+    assert _search(app, 'bia cung') == [2]
+
+
+def test_rebuild_index_restores_an_empty_index(app):
+    import search
+    from models import db
+
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM book_search'))
+        assert search.index_is_empty()
+        assert search.rebuild_index(batch_size=2) == 5
+        db.session.commit()
+
+    assert _search(app, 'dac nhan tam') == [1]
+    assert _search(app, 'tuoi tre') == [3]
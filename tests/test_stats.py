@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Bộ đếm dashboard được duy trì tăng dần luôn khớp với dữ liệu gốc."""
+from tests.conftest import build_app, count_queries, dispose, login
+
+
+def test_counters_match_after_borrows_and_returns(app):
+    import stats
+    from models import BorrowRecord
+
+    client = login(app.test_client(), 'user', 'user123')
+    for book_id in (1, 2, 2, 3, 4, 5, 5):
+        client.post('/borrow', data={'book_id': str(book_id)})
+    with app.app_context():
+        record_ids = [row.id for row in BorrowRecord.query.filter_by(status='borrowing').limit(4)]
+    for record_id in record_ids:
+        client.get(f'/return/{record_id}')
+
+    with app.app_context():
+        assert stats.rebuild(dry_run=True) == []
+        counters = stats.read_counters()
+        assert counters['total_borrows'] == 7
+        assert counters['active_borrows'] == 3
+
+
+def test_rebuild_folds_shards_back_into_one_row(app):
+    import stats
+    from models import db, LibraryStat
+
+    client = login(app.test_client(), 'user', 'user123')
+    for book_id in (1, 2, 3):
+        client.post('/borrow', data={'book_id': str(book_id)})
+
+    with app.app_context():
+        before = stats.read_counters()
+        stats.rebuild()
+        db.session.commit()
+        assert stats.read_counters() == before
+        names = {name for name, in db.session.query(LibraryStat.name)}
+        assert not any('#' in name for name in names)
+
+
+def test_borrow_writes_global_counters_in_one_statement(app):
+    client = login(app.test_client(), 'user', 'user123')
+
+    with count_queries(app) as counter:
+        response = client.post('/borrow', data={'book_id': '1'})
+    assert response.status_code == 302
+
+    writes = [statement for statement in counter.statements
+              if 'library_stat' in statement and not statement.lstrip().upper().startswith('SELECT')]
+    assert len(writes) == 1
+
+
+def test_borrow_still_changes_catalog_etag(app):
+    client = login(app.test_client(), 'user', 'user123')
+    client.get('/books')  # Trang có flash đăng nhập không được gắn ETag
+    etag = client.get('/books').headers['ETag']
+
+    client.post('/borrow', data={'book_id': '1'})
+    client.get('/books')
+
+    response = client.get('/books', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def _dashboard(app):
+    import stats
+
+    with app.app_context():
+        summary = stats.dashboard_stats(ttl=60)
+        return summary['total_books'], summary['active_borrows']
+
+
+def test_each_app_has_its_own_dashboard_cache(app, tmp_path):
+    (tmp_path / 'other').mkdir()
+    other = build_app(tmp_path / 'other')
+    try:
+        assert _dashboard(app) == (5, 0)
+
+        login(other.test_client(), 'user', 'user123').post('/borrow', data={'book_id': '1'})
+        assert _dashboard(other) == (5, 1)
+        assert _dashboard(app) == (5, 0)
+
+        # Ghi ở một ứng dụng chỉ xóa cache của chính nó
+        login(app.test_client(), 'user', 'user123').post('/borrow', data={'book_id': '2'})
+        assert _dashboard(app) == (5, 1)
+        assert other.extensions['dashboard_stats'] is not app.extensions['dashboard_stats']
+    finally:
+        dispose(other)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Quét quá hạn: chia khúc theo id, phí phạt ghi lại được tính lại chứ không cộng dồn."""
+from datetime import datetime, timedelta
+
+from tests.conftest import count_queries
+
+NOW = datetime(2026, 3, 1, 12, 0)
+FEE = 5000
+
+# (số ngày quá hạn tính tới NOW, trạng thái); số âm là chưa tới hạn
+RECORDS = [(3, 'borrowing'), (-2, 'borrowing'), (10, 'returned'), (1, 'borrowing'),
+           (5, 'borrowing'), (-1, 'borrowing'), (2, 'borrowing'), (7, 'borrowing')]
+
+
+def _seed(app):
+    from models import db, BorrowRecord
+
+    with app.app_context():
+        ids = []
+        for days_late, status in RECORDS:
+            due = NOW - timedelta(days=days_late, hours=1)
+            record = BorrowRecord(book_id=1, user_id=2, borrow_date=due - timedelta(days=14), due_date=due,
+                                  status=status, return_date=NOW if status == 'returned' else None,
+                                  late_fee=0)
+            db.session.add(record)
+            db.session.flush()
+            ids.append(record.id)
+        db.session.commit()
+    return ids
+
+
+def _state(app, ids):
+    from models import db, BorrowRecord
+
+    with app.app_context():
+        rows = {row.id: (row.late_fee, row.overdue) for row in
+                db.session.query(BorrowRecord.id, BorrowRecord.late_fee, BorrowRecord.overdue)}
+    return [rows[record_id] for record_id in ids]
+
+
+def _sweep(app, now, chunk_size):
+    import sweeper
+
+    with app.app_context(), count_queries(app) as counter:
+        processed, _ = sweeper.sweep_overdue(FEE, chunk_size=chunk_size, now=now)
+    return processed, counter.statements
+
+
+def _expected(now):
+    state = []
+    for days_late, status in RECORDS:
+        due = NOW - timedelta(days=days_late, hours=1)
+        overdue = status == 'borrowing' and now > due
+        state.append(((now - due).days * FEE if overdue else 0, overdue))
+    return state
+
+
+def test_sweep_walks_overdue_rows_in_chunks(app):
+    ids = _seed(app)
+
+    processed, statements = _sweep(app, NOW, chunk_size=2)
+
+    # 5 dòng quá hạn, khúc 2 dòng: 3 cặp SELECT ranh giới + UPDATE, thêm một SELECT rỗng
+    assert processed == 5
+    assert [statement.split()[0] for statement in statements] == ['SELECT', 'UPDATE'] * 3 + ['SELECT']
+    assert _state(app, ids) == _expected(NOW)
+    assert _state(app, ids)[:2] == [(3 * FEE, True), (0, False)]
+
+
+def test_chunk_size_does_not_change_the_result(app):
+    ids = _seed(app)
+    results = []
+    for chunk_size in (1, 3, 5, 1000):
+        processed, _ = _sweep(app, NOW, chunk_size)
+        results.append((processed, _state(app, ids)))
+
+    assert results == [(5, _expected(NOW))] * 4
+
+
+def test_repeated_sweeps_recompute_instead_of_adding_fees(app):
+    ids = _seed(app)
+    _sweep(app, NOW, chunk_size=2)
+
+    _sweep(app, NOW, chunk_size=2)
+    assert _state(app, ids) == _expected(NOW)
+
+    later = NOW + timedelta(days=2)
+    assert _sweep(app, later, chunk_size=2)[0] == 7  # Thêm hai sách vừa tới hạn
+    assert _state(app, ids) == _expected(later)
+    assert [_state(app, ids)[i] for i in (0, 1)] == [(5 * FEE, True), (0, True)]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Chỉ mục tiền tố của gợi ý mượn sách."""
+from typeahead import PrefixIndex
+
+ROWS = [
+    (1, 'Đắc Nhân Tâm', 'Dale Carnegie'),
+    (2, 'Nhà Giả Kim', 'Paulo Coelho'),
+    (3, 'Tâm Lý Học Đám Đông', 'Gustave Le Bon'),
+    (4, 'Nhân Tố Enzyme', 'Hiromi Shinya'),
+    (5, 'Sống Nhân Ái', 'Tâm An'),
+]
+
+
+def test_title_prefix_ranks_first():
+    index = PrefixIndex(ROWS)
+
+    assert index.search('nha')[:2] == [2, 4]
+    assert set(index.search('nha')) == {1, 2, 4, 5}
+
+
+def test_every_word_must_prefix_a_word_of_the_title_or_author():
+    index = PrefixIndex(ROWS)
+
+    assert index.search('tam nhan') == [1, 5]
+    assert index.search('carn dac') == [1]
+    assert index.search('tam le') == [3]
+    # 'an' là tiền tố của từ 'an' (tác giả sách 5), không khớp giữa từ như 'nhan'
+    assert index.search('an song') == [5]
+    assert index.search('nhan zzz') == []
+    assert len(index) == len(ROWS)
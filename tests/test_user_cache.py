@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Cache danh tính người dùng: trúng cache không truy vấn, đổi User thì xóa mục."""
+from tests.conftest import build_app, count_queries, dispose
+
+
+def _user_id(app, username='user'):
+    from models import User
+
+    with app.app_context():
+        return User.query.filter_by(username=username).one().id
+
+
+def _load(app, user_id):
+    """(số câu SQL, (tên, vai trò)) của một lần nạp qua cache"""
+    with app.app_context(), count_queries(app) as counter:
+        user = app.extensions['user_identities'].load(user_id)
+        return counter.count, (user.username, user.role)
+
+
+def test_cache_hit_skips_the_select(app):
+    user_id = _user_id(app)
+
+    assert _load(app, user_id) == (1, ('user', 'user'))
+    assert _load(app, user_id) == (0, ('user', 'user'))
+
+
+def test_role_and_password_changes_invalidate_the_entry(app):
+    from models import db, User
+
+    user_id = _user_id(app)
+    _load(app, user_id)
+
+    with app.app_context():
+        db.session.get(User, user_id).role = 'admin'
+        db.session.commit()
+    assert _load(app, user_id) == (1, ('user', 'admin'))
+
+    with app.app_context():
+        db.session.get(User, user_id).set_password('moi123', 'pbkdf2:sha256:1000')
+        db.session.commit()
+    assert _load(app, user_id)[0] == 1
+
+
+def test_apps_do_not_add_listeners_or_share_caches(app, tmp_path):
+    from models import db, User
+
+    listeners = len(User.__mapper__.dispatch.after_update)
+    (tmp_path / 'other').mkdir()
+    other = build_app(tmp_path / 'other')
+    try:
+        assert len(User.__mapper__.dispatch.after_update) == listeners
+
+        user_id = _user_id(app)
+        _load(app, user_id)
+        _load(other, user_id)
+        with other.app_context():
+            db.session.get(User, user_id).role = 'admin'
+            db.session.commit()
+
+        # Hai ứng dụng có database riêng: chỉ cache của ứng dụng đã ghi bị xóa
+        assert _load(other, user_id) == (1, ('user', 'admin'))
+        assert _load(app, user_id) == (0, ('user', 'user'))
+    finally:
+        dispose(other)
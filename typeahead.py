@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Gợi ý sách khi gõ (trang mượn sách) từ chỉ mục tiền tố trong bộ nhớ.
+
+Tên sách và từng từ của tên/tác giả (đã bỏ dấu, chữ thường như
+``search.tokenize``) nằm trong các mảng đã sắp xếp, nên tìm mục bắt đầu bằng
+một tiền tố chỉ là hai lần ``bisect`` và mỗi lần tra mất vài chục micro giây.
+Chỉ mục của 20k đầu sách chiếm khoảng 6 MB mỗi tiến trình. Số bản còn lại
+thay đổi theo từng lượt mượn nên không nằm trong chỉ mục: các ứng viên đã xếp
+hạng được lọc ``available > 0`` bằng một câu SELECT theo khóa chính.
+
+Mỗi lần thêm/sửa/xóa/nhập sách gọi ``mark_changed`` trong cùng transaction để
+tăng ``typeahead_revision`` trong ``LibraryStat``. Mỗi tiến trình so số hiệu
+này (một dòng) trước khi tra và dựng lại chỉ mục khi nó đổi, tối đa một lần
+mỗi ``refresh_seconds`` giây để một lần nhập lớn không bắt dựng lại liên tục.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from models import db, Book, LibraryStat
+from search import tokenize
+
+REVISION = 'typeahead_revision'
+
+
+def mark_changed():
+    """Báo tên/tác giả sách đã đổi (gọi trong cùng transaction với thay đổi)"""
+    result = db.session.execute(
+        db.update(LibraryStat).where(LibraryStat.name == REVISION).values(value=LibraryStat.value + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.add(LibraryStat(name=REVISION, value=1))
+
+
+def current_revision():
+    return db.session.query(LibraryStat.value).filter(LibraryStat.name == REVISION).scalar() or 0
+
+
+class PrefixIndex:
+    """Chỉ mục tiền tố bất biến gồm hai cặp mảng song song đã sắp xếp:
+
+    * ``titles``/``title_ids``: tên sách đã chuẩn hóa, để tìm sách có tên bắt
+      đầu bằng cụm đã gõ (kết quả tốt nhất, đã theo thứ chữ cái);
+    * ``tokens``/``token_ids``: từng từ của tên và tác giả, để tìm sách có một
+      từ bắt đầu bằng từ đã gõ.
+    """
+
+    def __init__(self, rows):
+        titles = []
+        entries = set()
+        book_tokens = {}
+        words = {}
+        for book_id, title, author in rows:
+            title_tokens = tokenize(title)
+            # Dùng chung một chuỗi cho mọi lần xuất hiện của cùng một từ
+            tokens = tuple(words.setdefault(token, token)
+                           for token in dict.fromkeys(title_tokens + tokenize(author)))
+            entries.update((token, book_id) for token in tokens)
+            book_tokens[book_id] = tokens
+            titles.append((' '.join(title_tokens), book_id))
+        titles.sort()
+        self.titles = [title for title, _ in titles]
+        self.title_ids = array('q', (book_id for _, book_id in titles))
+        entries = sorted(entries)
+        self.tokens = [token for token, _ in entries]
+        self.token_ids = array('q', (book_id for _, book_id in entries))
+        # Các từ của mỗi sách (trỏ tới chuỗi dùng chung ở trên), để kiểm tra các từ còn lại của query
+        self.book_tokens = book_tokens
+
+    def __len__(self):
+        return len(self.book_tokens)
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        start = bisect_left(keys, prefix)
+        return start, bisect_left(keys, prefix + '\uffff', start)
+
+    def search(self, query, limit=10, scan_limit=500):
+        """Id sách có mọi từ trong query là tiền tố của một từ trong tên/tác giả.
+
+        Sách có tên bắt đầu bằng cụm đã gõ đứng trước; mỗi lần tra duyệt tối đa
+        ``scan_limit`` mục nên thời gian không phụ thuộc kích thước danh mục.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        start, stop = self._prefix_range(self.titles, ' '.join(terms))
+        found = dict.fromkeys(self.title_ids[start:min(stop, start + limit)])
+
+        # Duyệt theo từ có ít mục nhất, các từ còn lại kiểm tra trên các từ của sách
+        ranges = [(self._prefix_range(self.tokens, term), term) for term in terms]
+        (start, stop), term = min(ranges, key=lambda item: item[0][1] - item[0][0])
+        others = [other for other in terms if other != term]
+        for book_id in self.token_ids[start:min(stop, start + scan_limit)]:
+            if len(found) >= limit:
+                break
+            if book_id in found:
+                continue
+            tokens = self.book_tokens[book_id]
+            if all(any(token.startswith(other) for token in tokens) for other in others):
+                found[book_id] = None
+        return list(found)
+
+
+class BookTypeahead:
+    """Chỉ mục của tiến trình hiện tại, tự dựng lại khi danh mục đổi"""
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self.index = None
+        self.revision = None
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _build(self, revision):
+        rows = db.session.query(Book.id, Book.title, Book.author).yield_per(5000)
+        self.index = PrefixIndex(rows)
+        self.revision = revision
+        self.built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        revision = current_revision()
+        if self.index is not None and (
+            revision == self.revision or time.monotonic() - self.built_at < self.refresh_seconds
+        ):
+            return
+        # Chỉ một luồng dựng lại; các luồng khác dùng tạm chỉ mục cũ nếu đã có
+        if not self._lock.acquire(blocking=self.index is None):
+            return
+        try:
+            if self.index is None or revision != self.revision:
+                self._build(revision)
+        finally:
+            self._lock.release()
+
+    def suggest(self, query, limit=10):
+        """[(id, tên, tác giả, số bản còn)] của tối đa limit sách còn bản khớp với query"""
+        self._ensure_fresh()
+        # Lấy dư ứng viên vì một phần có thể đã hết sách
+        ranked = self.index.search(query, limit * 4)
+        if not ranked:
+            return []
+        available = {row.id: row for row in db.session.query(
+            Book.id, Book.title, Book.author, Book.available
+        ).filter(Book.id.in_(ranked), Book.available > 0)}
+        return [tuple(available[book_id]) for book_id in ranked if book_id in available][:limit]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Cache danh tính người dùng cho ``login_manager.user_loader``.
+
+Mỗi request đã đăng nhập chỉ cần id, tên và vai trò của người dùng; các giá
+trị này được giữ trong LRU có TTL nên phần lớn request không phải truy vấn
+bảng User. Mọi thay đổi User qua ORM (đổi vai trò, đổi mật khẩu, xóa) sẽ xóa
+mục tương ứng trong cache của ứng dụng hiện tại (``app.extensions``, qua một
+listener chung cho cả module); các worker khác nhận thay đổi sau tối đa TTL giây.
+
+Đối tượng trả về khi trúng cache là một ``User`` tạm (transient), không gắn
+với session: chỉ dùng các thuộc tính cột như ``id``/``role``, không gán nó vào
+quan hệ của bản ghi khác (hãy dùng ``user_id=current_user.id``).
+"""
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from fragment_cache import LRUBackend
+from models import db, User
+
+
+class UserIdentityCache:
+    def __init__(self, maxsize=10000, ttl=60):
+        self.backend = LRUBackend(maxsize, ttl)
+
+    def load(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        identity = self.backend.get(user_id)
+        if identity is not None:
+            username, role = identity
+            return User(id=user_id, username=username, role=role)
+
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self.backend.set(user_id, (user.username, user.role))
+        return user
+
+    def invalidate(self, user_id):
+        self.backend.delete([user_id])
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _on_user_change(mapper, connection, target):
+    """Xóa mục của User vừa cập nhật hoặc xóa qua ORM khỏi cache của ứng dụng hiện tại"""
+    if not has_app_context():
+        return
+    cache = current_app.extensions.get('user_identities')
+    if cache is not None:
+        cache.invalidate(target.id)
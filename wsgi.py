@@ -1,5 +1,9 @@
 from app import app, init_database
 
+# Không khởi tạo database khi import: chạy `flask --app app init-db` trước khi
+# khởi động server (xem build.sh), nên có thể dùng `gunicorn --preload wsgi:app`
+
 if __name__ == "__main__":
-    init_database()
-    app.run()
\ No newline at end of file
+    with app.app_context():
+        init_database()
+    app.run()